@@ -1,5 +1,18 @@
 from .catalog import *
+from .cache import *
+from .streaming import *
+from .journal import *
+from .lease import *
+from .writebehind import *
+from .parallelism import *
+from .tracing import *
+from .runlog import *
+from .metrics import *
+from .profiling import *
 from .datasets import *
+from .execution import *
+from .distributed import *
 from .fetch import *
+from .garbage import *
 from .utils import *
 from .extra import *
@@ -0,0 +1,343 @@
+"""
+Content-addressed caches of DatasetGraph edge outputs, and of processed Datasets
+"""
+import os
+import pathlib
+import shutil
+import uuid
+
+import fsspec
+import joblib
+
+from .. import paths
+from ..log import logger
+from .runlog import annotate, count_bytes, instrument
+
+__all__ = [
+    'BuildCache',
+    'RemoteCache',
+    'default_build_cache',
+    'default_remote_cache',
+    'edge_fingerprint',
+]
+
+
+def edge_fingerprint(transformations, input_hashes, hash_type='sha1'):
+    """Compute a fingerprint of a transformer edge
+
+    The fingerprint changes whenever the edge's transformer pipeline, or the hashes
+    of any of its inputs change.
+
+    Parameters
+    ----------
+    transformations: list
+        serialized transformer pipeline of the edge (as stored in the transformer catalog)
+    input_hashes: dict {dataset_name: hash_dict}
+        hashes of each of the edge's input datasets
+    hash_type: {'sha1', 'md5'}
+        Hash function to use
+
+    Returns
+    -------
+    fingerprint (str)
+    """
+    key_dict = {
+        'transformations': transformations,
+        'input_hashes': {name: dict(sorted(hashes.items()))
+                         for name, hashes in sorted(input_hashes.items())},
+    }
+    return joblib.hash(key_dict, hash_name=hash_type)
+
+
+class BuildCache:
+    """Content-addressed store of transformer edge outputs.
+
+    Outputs are filed under a key computed from the edge's serialized
+    `transformations` and the hashes of its input datasets. If neither has
+    changed, the edge's outputs can be restored from the cache instead of
+    being regenerated, regardless of which edge (or which run) stored them.
+
+    Each entry is a directory, `cache_path/<key>`, containing the dumped
+    output Datasets. Entries are written to a temporary directory and renamed
+    into place, so a partially written entry is never visible.
+
+    Entries are never evicted by the cache itself (see `GarbageCollector`), so
+    it is opt-in: if the environment variable EASYDATA_BUILD_CACHE is set to a
+    directory, a DatasetGraph (and hence `make datasets`) uses a BuildCache there by default.
+    """
+
+    def __init__(self, cache_path=None, hash_type='sha1'):
+        """
+        Parameters
+        ----------
+        cache_path: path or None
+            Directory holding the cache entries. Default: `paths['cache_path']/build`
+        hash_type: {'sha1', 'md5'}
+            Hash function used to compute cache keys
+        """
+        if cache_path is None:
+            cache_path = paths['cache_path'] / 'build'
+        self.cache_path = pathlib.Path(cache_path)
+        self.hash_type = hash_type
+
+    def __repr__(self):
+        return f"BuildCache(cache_path='{self.cache_path}')"
+
+    def key(self, transformations, input_hashes):
+        """Compute the cache key for an edge
+
+        Parameters
+        ----------
+        transformations: list
+            serialized transformer pipeline of the edge (as stored in the transformer catalog)
+        input_hashes: dict {dataset_name: hash_dict}
+            hashes of each of the edge's input datasets
+
+        Returns
+        -------
+        key (str), or None if the edge can't be cached
+        (it has no transformations, or an input has no hashes)
+        """
+        if not transformations:
+            return None
+        for ds_name, hashes in input_hashes.items():
+            if not hashes:
+                logger.debug(f"No hashes for input Dataset '{ds_name}'. Not using build cache.")
+                return None
+        return edge_fingerprint(transformations, input_hashes, hash_type=self.hash_type)
+
+    def _entry_path(self, key):
+        return self.cache_path / key
+
+    def __contains__(self, key):
+        return key is not None and self._entry_path(key).is_dir()
+
+    def get(self, key, dataset_names):
+        """Restore cached outputs
+
+        Parameters
+        ----------
+        key: str
+            cache key (see `key()`)
+        dataset_names: iterable of str
+            the outputs that are required
+
+        Returns
+        -------
+        dict {dataset_name: Dataset} if every requested dataset is in the cache, otherwise None
+        """
+        if key is None:
+            return None
+        entry = self._entry_path(key)
+        dsdict = {}
+        for ds_name in dataset_names:
+            dataset_fq = entry / f'{ds_name}.dataset'
+            try:
+                with open(dataset_fq, 'rb') as fd:
+                    dsdict[ds_name] = joblib.load(fd)
+            except FileNotFoundError:
+                return None
+        try:
+            os.utime(entry)  # record the access
+        except OSError:
+            pass
+        logger.debug(f"Build cache hit: {key} {list(dsdict)}")
+        return dsdict
+
+    def put(self, key, dsdict):
+        """Store edge outputs in the cache
+
+        If an entry for `key` already exists, it is left untouched.
+
+        Parameters
+        ----------
+        key: str
+            cache key (see `key()`)
+        dsdict: dict {dataset_name: Dataset}
+            outputs to store
+
+        Returns
+        -------
+        True if a new entry was created
+        """
+        if key is None or key in self:
+            return False
+        entry = self._entry_path(key)
+        tmp_entry = self.cache_path / f'.{key}.{uuid.uuid4().hex}.tmp'
+        try:
+            for ds in dsdict.values():
+                ds.dump(dump_path=tmp_entry, exists_ok=True, update_catalog=False)
+            os.replace(tmp_entry, entry)
+        except OSError as err:
+            # most likely, another process stored this key first
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            if key not in self:
+                logger.warning(f"Unable to store build cache entry {key}: {err}")
+            return False
+        logger.debug(f"Stored build cache entry: {key} {list(dsdict)}")
+        return True
+
+    def clear(self):
+        """Remove all cache entries"""
+        if self.cache_path.exists():
+            shutil.rmtree(self.cache_path)
+
+
+class RemoteCache:
+    """Processed Datasets shared through any fsspec-supported storage (e.g. s3://, gs://, a shared directory).
+
+    Entries are keyed by a Dataset's name and catalog hashes, so anyone with the
+    same Dataset catalog can download an artifact that someone else generated,
+    rather than regenerating it. Writes go through to the cache as Datasets are
+    dumped (see `Dataset.dump`), and reads go through it when a Dataset isn't
+    on disk (see `Dataset.from_disk` and `DatasetGraph`).
+
+    Each entry is stored as `url/<key>/<dataset_name>.metadata` and `.dataset`.
+    The metadata file is written last, so an entry is only visible once complete.
+    Downloads are verified against the requested hashes before they are moved
+    into place.
+
+    If the environment variable EASYDATA_REMOTE_CACHE is set to a URL, a
+    DatasetGraph (and hence `Dataset.load`) uses a RemoteCache at that URL by default.
+    """
+
+    def __init__(self, url, hash_type='sha1', **storage_options):
+        """
+        Parameters
+        ----------
+        url: str or path
+            fsspec URL (or local path) of the cache
+        hash_type: {'sha1', 'md5'}
+            Hash function used to compute cache keys
+        **storage_options:
+            passed to the fsspec filesystem (e.g. credentials)
+        """
+        self.url = str(url)
+        self.hash_type = hash_type
+        self.fs, self.root = fsspec.core.url_to_fs(self.url, **storage_options)
+
+    def __repr__(self):
+        return f"RemoteCache(url='{self.url}')"
+
+    def key(self, dataset_name, hashes):
+        """Compute the cache key for a Dataset
+
+        Returns
+        -------
+        key (str), or None if there are no `hashes` to key on
+        """
+        if not hashes:
+            return None
+        return joblib.hash({'dataset_name': dataset_name, 'hashes': dict(sorted(hashes.items()))},
+                           hash_name=self.hash_type)
+
+    def _entry(self, key, filename):
+        return f"{self.root.rstrip('/')}/{key}/{filename}"
+
+    def __contains__(self, item):
+        """True if `(dataset_name, hashes)` is in the cache"""
+        key = self.key(*item)
+        return key is not None and self.fs.exists(self._entry(key, f'{item[0]}.metadata'))
+
+    def get(self, dataset_name, hashes, data_path):
+        """Download a Dataset into `data_path`, if the cache has a copy matching `hashes`
+
+        Parameters
+        ----------
+        dataset_name: str
+        hashes: dict
+            hashes of the required Dataset (e.g. from the Dataset catalog)
+        data_path: path
+            directory to download the `.metadata` and `.dataset` files into
+
+        Returns
+        -------
+        True if the Dataset was downloaded
+        """
+        key = self.key(dataset_name, hashes)
+        if key is None:
+            return False
+        data_path = pathlib.Path(data_path)
+        tmp_suffix = f'.{uuid.uuid4().hex}.tmp'
+        # the metadata file is moved into place last, as it marks the Dataset as present
+        downloads = {data_path / f'{dataset_name}.{suffix}': data_path / f'{dataset_name}.{suffix}{tmp_suffix}'
+                     for suffix in ('dataset', 'metadata')}
+        with instrument('remote_cache_get', dataset_name):
+            try:
+                if not self.fs.exists(self._entry(key, f'{dataset_name}.metadata')):
+                    annotate(remote_cache='miss')
+                    return False
+                os.makedirs(data_path, exist_ok=True)
+                for final, local in downloads.items():
+                    self.fs.get_file(self._entry(key, final.name), str(local))
+                    count_bytes(read=local.stat().st_size)
+                with open(downloads[data_path / f'{dataset_name}.metadata'], 'rb') as fd:
+                    metadata = joblib.load(fd)
+                if not hashes.items() <= metadata.get('hashes', {}).items():
+                    raise ValueError(f"hashes {metadata.get('hashes')} do not match {hashes}")
+                for final, local in downloads.items():
+                    os.replace(local, final)
+            except Exception as err:
+                logger.warning(f"Unable to fetch Dataset '{dataset_name}' from {self}: {err!r}")
+                annotate(remote_cache='error')
+                for local in downloads.values():
+                    if local.exists():
+                        local.unlink()
+                return False
+            annotate(remote_cache='hit')
+        logger.info(f"Downloaded Dataset '{dataset_name}' from {self}")
+        return True
+
+    def put(self, dataset_name, hashes, metadata_file, dataset_file):
+        """Upload a dumped Dataset
+
+        If the cache already has an entry for these `hashes`, it is left untouched.
+
+        Parameters
+        ----------
+        dataset_name: str
+        hashes: dict
+            the Dataset's hashes
+        metadata_file, dataset_file: path
+            the dumped `.metadata` and `.dataset` files
+
+        Returns
+        -------
+        True if a new entry was uploaded
+        """
+        key = self.key(dataset_name, hashes)
+        if key is None:
+            return False
+        with instrument('remote_cache_put', dataset_name):
+            try:
+                if (dataset_name, hashes) in self:
+                    return False
+                for local, filename in ((dataset_file, f'{dataset_name}.dataset'),
+                                        (metadata_file, f'{dataset_name}.metadata')):
+                    remote = self._entry(key, filename)
+                    tmp_remote = f'{remote}.{uuid.uuid4().hex}.tmp'
+                    self.fs.makedirs(self._entry(key, ''), exist_ok=True)
+                    self.fs.put_file(str(local), tmp_remote)
+                    self.fs.mv(tmp_remote, remote)
+                    count_bytes(written=pathlib.Path(local).stat().st_size)
+            except Exception as err:
+                logger.warning(f"Unable to upload Dataset '{dataset_name}' to {self}: {err!r}")
+                return False
+        logger.debug(f"Uploaded Dataset '{dataset_name}' to {self}")
+        return True
+
+
+def default_build_cache():
+    """The BuildCache in the directory in EASYDATA_BUILD_CACHE, or None if it is not set"""
+    cache_path = os.environ.get('EASYDATA_BUILD_CACHE')
+    if not cache_path:
+        return None
+    return BuildCache(cache_path)
+
+
+def default_remote_cache():
+    """The RemoteCache at the URL in EASYDATA_REMOTE_CACHE, or None if it is not set"""
+    url = os.environ.get('EASYDATA_REMOTE_CACHE')
+    if not url:
+        return None
+    return RemoteCache(url)
@@ -44,7 +44,7 @@ class Catalog(MutableMapping):
         catalog_path: path. (default: paths['catalog_dir'])
             Location of catalog directory (i.e. data catalog is stored at `catalog_path/catalog_name`)
         create: Boolean
-            if True, create the catalog if needed
+            if True, create the catalog if needed. Otherwise, it is created when an entry is first written
         data:
             Dict-like object containing data to be merged into the catalog
         delete: boolean
@@ -171,6 +171,7 @@ class Catalog(MutableMapping):
         """serialize a catalog entry to disk"""
         value = self.data[key]
         logger.debug(f"Writing entry:'{key}' to catalog:'{self.name}'.")
+        os.makedirs(self.catalog_dir_fq, exist_ok=True)  # catalogs opened with create=False
         save_json(self.catalog_dir_fq / f"{key}.{self.extension}", value)
 
     def _save(self, paranoid=True):
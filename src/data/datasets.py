@@ -1,9 +1,15 @@
+import concurrent.futures as cf
+import copy
 import json
 import os
 import pathlib
+import shutil
 import sys
+import threading
+import time
+from contextlib import contextmanager
 from functools import partial
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, deque
 
 import joblib
 import fsspec
@@ -13,10 +19,21 @@ from sklearn.model_selection import train_test_split
 from .. import paths
 from ..exceptions import EasydataError, NotFoundError, ObjectCollision, ValidationError
 from ..log import logger
-from ..utils import load_json, save_json, normalize_to_list
+from ..utils import load_json, save_json, normalize_to_list, MemoryWatch
 from .utils import partial_call_signature, serialize_partial, deserialize_partial, process_dataset_default
 from .fetch import fetch_file,  get_dataset_filename, hash_file, unpack, infer_filename
 from .catalog import Catalog
+from .execution import DAGExecutor, ExecutionPlan
+from .cache import BuildCache, RemoteCache, default_build_cache, default_remote_cache, edge_fingerprint
+from .runlog import instrument, instrumented, count_bytes, annotate, io_counter
+from .tracing import span, traced
+from .profiling import active_profiler
+from .journal import RunJournal
+from .lease import Lease
+from .parallelism import n_jobs
+from .streaming import (ChunkHasher, ChunkWriter, concat_chunks, is_streaming as is_streaming_transformer, iter_chunks,
+                        read_chunks, zip_chunks)
+from .writebehind import WriteBehind
 
 
 __all__ = [
@@ -29,6 +46,10 @@ __all__ = [
     'dataset_from_datasource',
 ]
 
+# Maximum number of input Datasets an edge loads from disk at once (within its share of the ParallelismBudget)
+MAX_LOAD_THREADS = 8
+
+
 def default_transformer(dsdict, **kwargs):
     """Placeholder for transformerdata processing function.
 
@@ -252,7 +273,7 @@ class Dataset(Bunch):
 
     @classmethod
     def from_disk(cls, dataset_name, data_path=None, metadata_only=False, errors=True,
-                  catalog_path=None, dataset_path='datasets', check_hashes=True):
+                  catalog_path=None, dataset_path='datasets', check_hashes=True, remote_cache=None):
         """Load a dataset (or its metadata) by name
 
         errors: Boolean
@@ -271,6 +292,9 @@ class Dataset(Bunch):
         check_hashes: Boolean
             if True, dataset will only be loaded if hashes match the dataset catalog
             if False, no hash checking will be performed
+        remote_cache: RemoteCache or None
+            if given (and check_hashes=True), a dataset that is not on disk is downloaded
+            from this cache, if it has a copy matching the catalog hashes
         """
         if data_path is None:
             data_path = paths['processed_data_path']
@@ -289,6 +313,10 @@ class Dataset(Bunch):
             if not catalog_hashes:
                 logger.warning(f"check_hashes=True but no hashes in catalog for Dataset:{dataset_name}")
 
+        if (remote_cache is not None and check_hashes and catalog_hashes
+                and not metadata_fq.exists() and not dataset_fq.exists()):
+            remote_cache.get(dataset_name, catalog_hashes, data_path)
+
         if not metadata_fq.exists() and not dataset_fq.exists():
             if errors:
                 raise FileNotFoundError(f"No dataset {dataset_name} in {data_path}.")
@@ -304,8 +332,14 @@ class Dataset(Bunch):
             return meta
 
         logger.debug(f"Load {dataset_name} from disk...")
-        with open(dataset_fq, 'rb') as fd:
-            ds = joblib.load(fd)
+        with instrument('from_disk', dataset_name):
+            count_bytes(read=metadata_fq.stat().st_size)
+            if meta.get('chunks') is not None:  # written by a streaming edge
+                ds = concat_chunks(read_chunks(dataset_name, data_path), meta)
+            else:
+                with open(dataset_fq, 'rb') as fd:
+                    ds = joblib.load(fd)
+                count_bytes(read=dataset_fq.stat().st_size)
 
         if check_hashes and not (catalog_hashes.items() <= ds.HASHES.items()):
             raise ValidationError(f"Dataset hashes do note match catalog or on-disk metadata for Dataset:{dataset_name}")
@@ -318,6 +352,7 @@ class Dataset(Bunch):
          catalog_path=None,
          dataset_path='datasets',
          transformer_path='transformers',
+         remote_cache=None,
         ):
         """
         Load a dataset (or its metadata) from the dataset catalog.
@@ -325,8 +360,14 @@ class Dataset(Bunch):
         The named dataset must exist in the `dataset_file`.
 
         If a cached copy of the dataset is present on disk, (and its hashes match those in the dataset catalog),
-        the cached copy will be returned. Otherwise, the dataset will be regenerated by traversing the
-        transformer graph.
+        the cached copy will be returned. Otherwise, it is downloaded from the remote cache (if any, and if
+        it has a matching copy), or regenerated by traversing the transformer graph.
+
+        Only one process at a time regenerates a given dataset: it holds a `Lease` on
+        the dataset (in `dataset_cache_path/.leases`) while doing so. Other processes
+        requesting the same dataset wait for the lease, then load the regenerated copy.
+        Each edge generated along the way is leased too (see `DatasetGraph`'s `leases`),
+        so ancestors shared with other requested datasets are only generated once.
 
         Parameters
         ----------
@@ -344,6 +385,8 @@ class Dataset(Bunch):
             name of dataset catalog directory. Relative to `catalog_path`.
         transformer_path: str.
             name of transformers catalog directory. Relative to `catalog_path`.
+        remote_cache: RemoteCache, str, Boolean, or None
+            Remote cache of processed datasets. See `DatasetGraph`
         """
         if dataset_cache_path is None:
             dataset_cache_path = paths['processed_data_path']
@@ -352,7 +395,9 @@ class Dataset(Bunch):
 
         dag = DatasetGraph(catalog_path=catalog_path,
                                        transformer_path=transformer_path,
-                                       dataset_path=dataset_path)
+                                       dataset_path=dataset_path,
+                                       dataset_cache_path=dataset_cache_path,
+                                       remote_cache=remote_cache)
         if dataset_name not in dag.datasets:
             raise NotFoundError(f"'{dataset_name}' not found in dataset catalog.")
         meta = dag.datasets[dataset_name]
@@ -360,12 +405,14 @@ class Dataset(Bunch):
 
         if metadata_only:
             return meta
-        try:
+
+        def load_cached():
             ds = cls.from_disk(dataset_name, data_path=dataset_cache_path,
                                metadata_only=metadata_only,
                                errors=True,
                                catalog_path=catalog_path,
-                               dataset_path=dataset_path)
+                               dataset_path=dataset_path,
+                               remote_cache=dag.remote_cache)
             logger.debug(f"Loaded {dataset_name} from disk.")
             generated_hashes = ds.metadata['hashes']
             if catalog_hashes is not None:
@@ -373,19 +420,29 @@ class Dataset(Bunch):
                     msg = (f"Dataset '{dataset_name}' hashes {generated_hashes} do not match catalog: {catalog_hashes}")
                     logger.warning(msg)
                     raise ValidationError(msg)
+            return ds
+
+        try:
+            return load_cached()
         except:
-            logger.debug(f"Falling back to loading {dataset_name} from catalog.")
-            ds = cls.from_catalog(
+            pass
+        with Lease(dataset_cache_path / '.leases' / f'{dataset_name}.lease'):
+            try:
+                # another process may have generated it while we waited for the lease
+                return load_cached()
+            except Exception:
+                logger.debug(f"Falling back to loading {dataset_name} from catalog.")
+            return cls.from_catalog(
                 dataset_name,
                 metadata_only=metadata_only,
                 dataset_cache_path=dataset_cache_path,
                 catalog_path=catalog_path,
                 dataset_path=dataset_path,
-                transformer_path=transformer_path
+                transformer_path=transformer_path,
+                remote_cache=dag.remote_cache or False,
+                leases=True,
             )
 
-        return ds
-
     @classmethod
     def from_catalog(cls, dataset_name,
          metadata_only=False,
@@ -393,7 +450,9 @@ class Dataset(Bunch):
          catalog_path=None,
          dataset_path='datasets',
          transformer_path='transformers',
-         exhaustive=False
+         exhaustive=False,
+         remote_cache=None,
+         leases=False,
         ):
         """Load a dataset (or its metadata) from the dataset catalog.
 
@@ -418,6 +477,10 @@ class Dataset(Bunch):
             name of transformer catalog path. Relative to `catalog_path`.
         exhaustive: Boolean
             if True, ignore any on-disk Datasets and regenerate every node from its catalog entry.
+        remote_cache: RemoteCache, str, Boolean, or None
+            Remote cache of processed datasets. See `DatasetGraph`
+        leases: Boolean
+            Lease each edge while generating it. See `DatasetGraph`
         """
         if dataset_cache_path is None:
             dataset_cache_path = paths['processed_data_path']
@@ -426,7 +489,10 @@ class Dataset(Bunch):
 
         dag = DatasetGraph(catalog_path=catalog_path,
                            transformer_path=transformer_path,
-                           dataset_path=dataset_path)
+                           dataset_path=dataset_path,
+                           dataset_cache_path=dataset_cache_path,
+                           remote_cache=remote_cache,
+                           leases=leases)
         if dataset_name not in dag.datasets:
             raise AttributeError(f"'{dataset_name}' not found in dataset catalog.")
         meta = dag.datasets[dataset_name]
@@ -524,6 +590,7 @@ class Dataset(Bunch):
         ret["hashes"] = hashes
         return ret
 
+    @instrumented('hash', lambda self, *args, **kwargs: self.name)
     def update_hashes(self, exclude_list=None, hash_type='sha1', update_metadata=True):
         """Update data/target hashes in object metadata
 
@@ -732,9 +799,10 @@ class Dataset(Bunch):
 
         return fsspec.open(self.extra_file(relative_path), **auth_kwargs, **kwargs)
 
+    @instrumented('dump', lambda self, *args, **kwargs: self.name)
     def dump(self, file_base=None, dump_path=None, hash_type='sha1',
              exists_ok=False, create_dirs=True, dump_metadata=True, update_catalog=True,
-             catalog_path=None):
+             catalog_path=None, remote_cache=None):
         """Dump a dataset to disk.
 
         Note, this dumps a separate copy of the metadata structure,
@@ -761,6 +829,8 @@ class Dataset(Bunch):
             if True, new metadata will be written to catalog
         catalog_path: path or None
             Location of catalog file. default paths['catalog_path']
+        remote_cache: RemoteCache or None
+            If given, also upload the dumped dataset to this cache (requires dump_metadata=True)
 
         """
         if dump_path is None:
@@ -799,16 +869,24 @@ class Dataset(Bunch):
         if dump_metadata:
             with open(metadata_fq, 'wb') as fo:
                 joblib.dump(metadata, fo)
+            count_bytes(written=metadata_fq.stat().st_size)
             logger.debug(f'Wrote Dataset Metadata: {metadata_filename}')
 
         if update_catalog:
             self.update_catalog(catalog_path=catalog_path)
 
         dataset_fq = dump_path / dataset_filename
+        stale_chunks = dump_path / f'{file_base}.chunks'
+        if stale_chunks.exists():  # an earlier, chunked version of this dataset
+            shutil.rmtree(stale_chunks)
         with open(dataset_fq, 'wb') as fo:
             joblib.dump(self, fo)
+        count_bytes(written=dataset_fq.stat().st_size)
         logger.debug(f'Wrote Dataset: {dataset_filename}')
 
+        if remote_cache is not None and dump_metadata:
+            remote_cache.put(self.name, self.metadata['hashes'], metadata_fq, dataset_fq)
+
 def process_datasources(datasources=None, action='process'):
     """Fetch, Unpack, and Process data sources.
 
@@ -1201,6 +1279,7 @@ class DataSource(object):
         }
         return dset_opts
 
+    @instrumented('fetch', lambda self, *args, **kwargs: self.name)
     def fetch(self, fetch_path=None, fetch_options=None, force_download=False):
         """Fetch files in the `file_dict` to `raw_data_dir` and check hashes.
 
@@ -1279,6 +1358,7 @@ class DataSource(object):
         else:
             return [key for key in self.file_dict]
 
+    @instrumented('unpack', lambda self, *args, **kwargs: self.name)
     def unpack(self, unpack_path=None, force_unpack=False):
         """Unpack fetched files
 
@@ -1316,6 +1396,7 @@ class DataSource(object):
 
         return self.unpack_path_
 
+    @instrumented('process', lambda self, *args, **kwargs: self.name)
     def process(self,
                 cache_path=None,
                 force=False,
@@ -1538,6 +1619,15 @@ class DatasetGraph:
     nodes: set of dataset nodes (nodes in the hypergraph)
     edges: set of transformer nodes (edges in the hypergraph)
 
+    Adjacency is indexed when the catalogs are loaded (and whenever an edge is added),
+    so looking up the edge that produces a node, or the edges that consume it,
+    does not require a scan of the transformer catalog.
+
+    Output datasets of an edge may be marked as "ephemeral" (via the
+    `ephemeral_datasets` field of its transformer catalog entry). Ephemeral
+    datasets are hash-verified like any other, but are never written to disk;
+    they are handed to downstream edges in memory, and regenerated when needed.
+
     """
 
     def __init__(self,
@@ -1545,6 +1635,13 @@ class DatasetGraph:
                  create=True,
                  dataset_path='datasets',
                  transformer_path='transformers',
+                 dataset_cache_path=None,
+                 build_cache=None,
+                 fingerprint_path='fingerprints',
+                 edge_stats_path='edge_stats',
+                 remote_cache=None,
+                 write_behind=False,
+                 leases=False,
                  ):
         """Create the Transformer (Dataset Dependency) Graph
 
@@ -1562,19 +1659,141 @@ class DatasetGraph:
             Path to dataset catalog. Relative to `catalog_path`
         transformer_path: String
             Path to transformer catalog. Relative to `catalog_path`
+        dataset_cache_path: Path
+            Location of saved (processed) Dataset files. Default paths['processed_data_path']
+        build_cache: BuildCache, path, Boolean, or None
+            Content-addressed cache of edge outputs. If an edge's transformations and
+            input hashes match a cache entry, its outputs are restored rather than regenerated.
+            True: use a BuildCache in the default location (`paths['cache_path']/build`)
+            path: use a BuildCache in this directory
+            None: use a BuildCache in the directory in EASYDATA_BUILD_CACHE, if set
+            False: don't use a build cache
+        fingerprint_path: String
+            Path to the catalog of edge fingerprints. Relative to `catalog_path`.
+            This records the transformations and input hashes each edge was last processed with,
+            and is used to determine which edges are `outdated()`.
+        edge_stats_path: String
+            Path to the catalog of edge statistics. Relative to `catalog_path`.
+            This records the wall time, peak memory, and output size of each edge
+            when it was last processed, and is used to estimate the cost of an `ExecutionPlan`.
+        remote_cache: RemoteCache, str, Boolean, or None
+            Cache of processed Datasets shared with other users (e.g. in object storage).
+            Datasets that are needed but not on disk are downloaded from it if it has a copy
+            matching the Dataset catalog, and Datasets written by `process_edge` are uploaded to it.
+            str: use a RemoteCache at this fsspec URL
+            None: use a RemoteCache at the URL in EASYDATA_REMOTE_CACHE, if set
+            False: don't use a remote cache
+        write_behind: WriteBehind, int, or Boolean
+            If enabled, Datasets written by `process_edge` are dumped by a background thread,
+            so writing them overlaps with downstream edges. Edges that read a pending Dataset
+            from disk wait for it to be written, as does the end of `generate` (see `flush`).
+            True: use a WriteBehind with the default memory budget
+            int: use a WriteBehind with this memory budget (in bytes) for pending Datasets
+            False: write Datasets before `process_edge` returns
+        leases: Boolean
+            If True, `process_edge` holds a `Lease` on each edge while processing it (in
+            `dataset_cache_path/.leases`), so processes sharing the `dataset_cache_path` don't
+            generate the same Datasets concurrently. If another process generated an edge's
+            outputs while we waited for its lease, they are loaded rather than regenerated.
+            Edges in streaming chains (see `process_chain`) are not leased.
 
         """
         if catalog_path is None:
             catalog_path = paths['catalog_path']
         else:
             catalog_path = pathlib.Path(catalog_path)
+        if dataset_cache_path is None:
+            dataset_cache_path = paths['processed_data_path']
+        else:
+            dataset_cache_path = pathlib.Path(dataset_cache_path)
 
         self._transformer_path = transformer_path
         self._dataset_path = dataset_path
         self._catalog_path = catalog_path
+        self._dataset_cache_path = dataset_cache_path
+        self._lock = threading.RLock()
+        self._satisfaction_cache = None
+        if build_cache is None:
+            build_cache = default_build_cache()
+        elif build_cache is True:
+            build_cache = BuildCache()
+        elif build_cache is not None and build_cache is not False and not isinstance(build_cache, BuildCache):
+            build_cache = BuildCache(build_cache)
+        self.build_cache = build_cache or None
+        if remote_cache is None:
+            remote_cache = default_remote_cache()
+        elif remote_cache is not False and not isinstance(remote_cache, RemoteCache):
+            remote_cache = RemoteCache(remote_cache)
+        self.remote_cache = remote_cache or None
+        if write_behind is True:
+            write_behind = WriteBehind()
+        elif write_behind is not False and not isinstance(write_behind, WriteBehind):
+            write_behind = WriteBehind(max_bytes=write_behind)
+        self.write_behind = write_behind or None
+        self.leases = leases
+        self._fingerprint_path = fingerprint_path
         self._update_catalogs(transformers=True, datasets=True, create=create)
+        self.fingerprints = self._bookkeeping_catalog(fingerprint_path)
+        self._edge_stats_path = edge_stats_path
+        self.edge_stats = self._bookkeeping_catalog(edge_stats_path)
         logger.debug(f"Loaded DatasetGraph with {len(self.nodes)} nodes and {len(self.edges)} edges.")
 
+    def _constructor_opts(self):
+        """Arguments needed to reconstruct this DatasetGraph (e.g. in a worker process)"""
+        return {
+            'catalog_path': self._catalog_path,
+            'create': False,
+            'dataset_path': self._dataset_path,
+            'transformer_path': self._transformer_path,
+            'dataset_cache_path': self._dataset_cache_path,
+            'build_cache': self.build_cache or False,
+            'fingerprint_path': self._fingerprint_path,
+            'edge_stats_path': self._edge_stats_path,
+            'remote_cache': self.remote_cache or False,
+            # a worker's outputs must be on disk by the time it returns
+            'write_behind': False,
+            'leases': self.leases,
+        }
+
+    def _bookkeeping_catalog(self, name):
+        """Load a catalog the graph records into (e.g. fingerprints), without creating it
+
+        The catalog directory is created when the first entry is written.
+        """
+        return Catalog(name, catalog_path=self._catalog_path, create=False)
+
+    def _sync_datasets(self, entries):
+        """Update in-memory Dataset catalog entries without writing them to disk
+
+        Used to bring this graph up to date with catalog changes made elsewhere
+        (e.g. by another process)
+
+        entries: dict {dataset_name: catalog_entry}
+        """
+        for name, entry in entries.items():
+            self.datasets._memory_setitem(name, entry)
+
+    @contextmanager
+    def _memoized_satisfaction(self):
+        """Within this context, check each node's on-disk state at most once
+
+        Results of `dataset_state` (and hence `is_cached`) are remembered until the node is written by `process_edge`.
+        Contexts may be nested; the cache is discarded when the outermost one exits.
+        """
+        outermost = self._satisfaction_cache is None
+        if outermost:
+            self._satisfaction_cache = {}
+        try:
+            yield
+        finally:
+            if outermost:
+                self._satisfaction_cache = None
+
+    def _invalidate_satisfaction(self, ds_name):
+        """Forget the remembered on-disk state of a node"""
+        if self._satisfaction_cache is not None:
+            self._satisfaction_cache.pop(ds_name, None)
+
     def _update_catalogs(self, transformers=True, datasets=True, create=False):
         """Reload the Transformer and Dataset catalogs from disk
 
@@ -1593,27 +1812,75 @@ class DatasetGraph:
         if datasets:
             self.datasets = Catalog.load(self._dataset_path, catalog_path=self._catalog_path,
                                          create=create, ignore_errors=True)
+        if transformers:
+            self._update_adjacency()
         self._validate_hypergraph()
         self._update_degrees()
 
+    def _update_adjacency(self):
+        """Rebuild the adjacency maps from the transformer catalog.
+
+        Maintains:
+
+        _producers: dict {node: edge}
+            the edge that generates each node
+        _consumers: dict {node: set(edge)}
+            the edges that use each node as an input
+        _edge_inputs, _edge_outputs: dict {edge: tuple(node)}
+            the input and output nodes of each edge
+        _ephemeral: set(node)
+            nodes that are never written to disk
+        """
+        self._producers = {}
+        self._consumers = defaultdict(set)
+        self._edge_inputs = {}
+        self._edge_outputs = {}
+        self._ephemeral = set()
+        for he_name, he in self.transformers.items():
+            self._index_edge(he_name, he)
+
+    def _index_edge(self, edge_name, catalog_entry):
+        """Add a single edge to the adjacency maps
+
+        If `edge_name` is already indexed, its previous entry is replaced.
+        """
+        if edge_name in self._edge_outputs:
+            self._unindex_edge(edge_name)
+        inputs = tuple(catalog_entry.get('input_datasets', ()))
+        outputs = tuple(catalog_entry['output_datasets'])
+        self._edge_inputs[edge_name] = inputs
+        self._edge_outputs[edge_name] = outputs
+        self._ephemeral.update(catalog_entry.get('ephemeral_datasets', ()))
+        for node in inputs:
+            self._consumers[node].add(edge_name)
+        for node in outputs:
+            if node in self._producers and self._producers[node] != edge_name:
+                logger.warning(f"Node '{node}' is generated by both '{self._producers[node]}' and '{edge_name}'. Using '{self._producers[node]}'")
+                continue
+            self._producers[node] = edge_name
+
+    def _unindex_edge(self, edge_name):
+        """Remove a single edge from the adjacency maps"""
+        for node in self._edge_inputs.pop(edge_name, ()):
+            self._consumers[node].discard(edge_name)
+            if not self._consumers[node]:
+                del self._consumers[node]
+        for node in self._edge_outputs.pop(edge_name, ()):
+            self._ephemeral.discard(node)
+            if self._producers.get(node) == edge_name:
+                del self._producers[node]
+
     def _update_degrees(self):
         """Update the counts of in- and out-edges.
 
-        used to compute sinks and sources
+        used to compute sinks and sources. Outputs of source edges
+        are considered to have no in-edges.
         """
         self.edges_out = Counter()
         self.edges_in = Counter()
-        for n in self.nodes:
-            self.edges_in[n] = 0
-            self.edges_out[n] = 0
-        for he_name, he in self.transformers.items():
-            for node in he['output_datasets']:
-                self.edges_in[node] += 1
-            for node in he.get('input_datasets', []):
-                self.edges_out[node] += 1
-            else:
-                if self.is_source(he_name):
-                    self.edges_in[node] = 0
+        for node, edge in self._producers.items():
+            self.edges_in[node] = 0 if self.is_source(edge) else 1
+            self.edges_out[node] = len(self._consumers.get(node, ()))
 
     def _validate_hypergraph(self, add_empty_datasets=True):
         """Check the basic structure of the hypergraph is valid
@@ -1637,15 +1904,11 @@ class DatasetGraph:
     def nodes(self):
         """A dataset is a node in the hypergraph if it is listed as the "output dataset" of some transformer.
         Thus, not every dataset in the catalog will be considered a node in the DatasetGraph."""
-        ret = set()
-        for he in self.transformers.values():
-            for node in he['output_datasets']:
-                ret.add(node)
-        return ret
+        return set(self._producers)
 
     @property
     def edges(self):
-        return set(self.transformers)
+        return set(self._edge_outputs)
 
     @property
     def sources(self):
@@ -1768,6 +2031,7 @@ class DatasetGraph:
                  write_catalog=True,
                  overwrite_catalog=False,
                  generate=True,
+                 ephemeral_datasets=None,
     ):
         """Add an edge to the Transformer Graph.
 
@@ -1805,6 +2069,9 @@ class DatasetGraph:
         overwrite_catalog: Boolean
             If True, overwrite entries in catalog
             If False, raise an exception on duplicate catalog entries
+        ephemeral_datasets: iterable or None
+            Output datasets that should never be written to disk.
+            Must be a subset of `output_datasets`
 
         Examples
         --------
@@ -1863,6 +2130,9 @@ class DatasetGraph:
 
         input_datasets = normalize_to_list(input_datasets)
         output_datasets = normalize_to_list(output_datasets)
+        ephemeral_datasets = normalize_to_list(ephemeral_datasets)
+        if not set(ephemeral_datasets) <= set(output_datasets):
+            raise ValueError("`ephemeral_datasets` must be a subset of `output_datasets`")
 
         if edge_name is None:
             edge_name = f"_{'_'.join([ids for ids in output_datasets])}"
@@ -1878,11 +2148,14 @@ class DatasetGraph:
         if transformer_pipeline:
             catalog_entry['transformations'] = transformer_pipeline
         catalog_entry['output_datasets'] = output_datasets
+        if ephemeral_datasets:
+            catalog_entry['ephemeral_datasets'] = ephemeral_datasets
 
         if edge_name in self.transformers and not overwrite_catalog:
             raise ObjectCollision(f"Transformer '{edge_name}' already in catalog. Use overwrite_catalog=True to overwrite")
         if write_catalog:
             self.transformers[edge_name] = catalog_entry
+            self._index_edge(edge_name, catalog_entry)
         for ds in set(input_datasets):
             if ds not in self.datasets:
                 if write_catalog:
@@ -1934,10 +2207,24 @@ class DatasetGraph:
             set of all the output nodes generated by this edge
 
         """
-        for hename, he in self.transformers.items():
-            if node in he['output_datasets']:
-                return set(he.get('input_datasets', [])), hename, set(he['output_datasets'])
-        raise NotFoundError(f"Node '{node}' not found in transformer graph")
+        hename = self._producers.get(node, None)
+        if hename is None:
+            raise NotFoundError(f"Node '{node}' not found in transformer graph")
+        return set(self._edge_inputs[hename]), hename, set(self._edge_outputs[hename])
+
+    def find_consumers(self, node):
+        """Find the edges that use a given node as an input.
+
+        Parameters
+        ----------
+        node: String
+            name of a node
+
+        Returns
+        -------
+        Set(str) of edge names. Empty if `node` is not used as an input by any edge
+        """
+        return set(self._consumers.get(node, ()))
 
     def is_source(self, edge):
         """Is this a source?
@@ -1947,10 +2234,92 @@ class DatasetGraph:
         """
         return not self.transformers[edge].get('input_datasets', False)
 
+    def is_ephemeral(self, node):
+        """Is this node ephemeral? (i.e. never written to disk)"""
+        return node in self._ephemeral
+
+    def _transformers(self, edge_name):
+        """The (deserialized) transformer functions of an edge, with their names"""
+        for xform_dict in self.transformers[edge_name].get('transformations', []):
+            fail_func = partial(default_transformer, transformer_name=xform_dict['transformer_name'])
+            yield (xform_dict['transformer_name'],
+                   deserialize_partial(xform_dict, key_base="transformer", fail_func=fail_func))
+
+    def is_streaming(self, edge_name):
+        """Is this a streaming edge? (i.e. are all of its transformers streaming transformers)
+
+        See `streaming_transformer`. An edge with no transformations is not streaming.
+        An edge may not mix streaming and ordinary transformers.
+        """
+        flags = {is_streaming_transformer(transformer) for _, transformer in self._transformers(edge_name)}
+        if len(flags) > 1:
+            raise EasydataError(f"Edge '{edge_name}' mixes streaming and non-streaming transformers")
+        return flags == {True}
+
+    def streaming_chains(self, edges, keep=None):
+        """Group edges into chains of streaming edges that can be piped together
+
+        Consecutive streaming edges are chained when the downstream edge's only input
+        is the upstream edge's only output, and no other edge in `edges` uses it.
+
+        Parameters
+        ----------
+        edges: iterable of edge names, in dependency order (e.g. an ExecutionPlan)
+        keep: iterable of edge names, or None
+            Edges whose outputs are needed in memory. These only end chains.
+
+        Returns
+        -------
+        list of chains (lists of edge names), in dependency order.
+        Non-streaming edges form chains of their own.
+        """
+        edges = list(edges)
+        keep = set() if keep is None else set(keep)
+        planned = set(edges)
+        chains = []
+        open_chains = {}  # {tail edge: chain} of streaming chains that may be extended
+        for edge in edges:
+            if not self.is_streaming(edge):
+                chains.append([edge])
+                continue
+            inputs = self._edge_inputs[edge]
+            if len(inputs) == 1:
+                upstream = self._producers.get(inputs[0])
+                if (upstream in open_chains and upstream not in keep
+                        and self._edge_outputs[upstream] == inputs
+                        and self._consumers[inputs[0]] & planned == {edge}):
+                    chain = open_chains.pop(upstream)
+                    chain.append(edge)
+                    open_chains[edge] = chain
+                    continue
+            chain = [edge]
+            chains.append(chain)
+            open_chains[edge] = chain
+        return chains
+
+    def set_ephemeral(self, node, ephemeral=True):
+        """Mark (or unmark) a node as ephemeral
+
+        This updates the transformer catalog entry of the edge that generates `node`.
+        Existing on-disk copies of the node are not removed, but will no longer be used.
+        """
+        _, edge_name, _ = self.find_child(node)
+        catalog_entry = dict(self.transformers[edge_name])
+        ephemeral_datasets = [n for n in catalog_entry.get('ephemeral_datasets', []) if n != node]
+        if ephemeral:
+            ephemeral_datasets.append(node)
+        if ephemeral_datasets:
+            catalog_entry['ephemeral_datasets'] = ephemeral_datasets
+        else:
+            catalog_entry.pop('ephemeral_datasets', None)
+        self.transformers[edge_name] = catalog_entry
+        self._index_edge(edge_name, catalog_entry)
+
     def traverse(self, node, kind="breadth-first", exhaustive=False):
-        """Find the path needed to regenerate the given node
+        """Find the path needed to regenerate the given node (or nodes)
 
         Traverse the graph as far as necessary to regenerate `node`.
+        If several start nodes are given, ancestors they share are only examined once.
 
         This will stop at the first upstream node whose parents are fully satisfied,
         (i.e. cached on disk, and whose hashes match the datset catalog)
@@ -1958,8 +2327,8 @@ class DatasetGraph:
 
         Parameters
         ----------
-        start: string
-            Name of start node. Dendencies will be traced form this node back to sources
+        node: string or list of strings
+            Name of start node(s). Dependencies will be traced from these nodes back to sources
 
         kind: {'depth-first', 'breadth-first'}. Default 'breadth-first'
         exhaustive: Boolean
@@ -1973,7 +2342,7 @@ class DatasetGraph:
             nodes: List(str)
                 list of node names traversed in the dependency graph
             edges: List(str)
-                list of edge names traversed in the dependcy graph
+                list of edge names traversed in the dependcy graph, in dependency order (see `toposort`)
         """
         if kind == 'breadth-first':
             pop_loc = 0
@@ -1982,30 +2351,36 @@ class DatasetGraph:
         else:
             raise ValueError(f"Unknown kind: {kind}")
         visited = []
+        visited_set = set()
         edges = []
-        queue = [node]
-        while queue:
-            vertex = queue.pop(pop_loc)
-            if vertex not in visited:
-                logger.debug(f"traverse: examining vertex:'{vertex}'")
-                visited += [vertex]
-                parents, edge, children = self.find_child(vertex)
-                satisfied = self.fully_satisfied(edge)
-                if exhaustive or not satisfied:
-                    if satisfied:
-                        logger.debug(f"traverse: all input dependencies {list(parents)} satisfied for edge: '{edge}' but exhaustive=True specified.")
+        queue = deque(normalize_to_list(node))
+        with self._memoized_satisfaction():
+            while queue:
+                vertex = queue.popleft() if pop_loc == 0 else queue.pop()
+                if vertex not in visited_set:
+                    logger.debug(f"traverse: examining vertex:'{vertex}'")
+                    visited.append(vertex)
+                    visited_set.add(vertex)
+                    parents, edge, children = self.find_child(vertex)
+                    satisfied = self.fully_satisfied(edge)
+                    if exhaustive or not satisfied:
+                        if satisfied:
+                            logger.debug(f"traverse: all input dependencies {list(parents)} satisfied for edge: '{edge}' but exhaustive=True specified.")
+                        else:
+                            logger.debug(f"traverse: Parent dependencies {list(parents)} not satisfied for edge '{edge}'.")
+                        queue.extend(parents - visited_set)
                     else:
-                        logger.debug(f"traverse: Parent dependencies {list(parents)} not satisfied for edge '{edge}'.")
-                    queue.extend(parents - set(visited))
-                else:
-                    logger.debug(f"traverse: all input dependencies:{list(parents)} satisfied for edge: '{edge}'")
-                edges += [edge]
-        return list(reversed(visited)), list(reversed(edges))
+                        logger.debug(f"traverse: all input dependencies:{list(parents)} satisfied for edge: '{edge}'")
+                    edges.append(edge)
+        return list(reversed(visited)), self.toposort(edges)
 
-    def process_edge(self, edge_name, write_dataset=True, overwrite_catalog=False, dataset_path=None):
+    @instrumented('process_edge', lambda self, edge_name, *args, **kwargs: edge_name)
+    def process_edge(self, edge_name, write_dataset=True, overwrite_catalog=False, dataset_path=None,
+                     input_datasets=None, prefetched=None):
         """Generate the outputs for a given edge in the DatasetGraph
 
-        This assumes all dependencies for this edge are already on-disk and have valid hashes.
+        This assumes all dependencies for this edge are either supplied in `input_datasets`,
+        or are already on-disk and have valid hashes.
 
         Parameters
         ----------
@@ -2016,70 +2391,503 @@ class DatasetGraph:
         overwrite_catalog: Boolean
             If True, write updated metadata even if Dataset hashes differ. Requires write_dataset=True
         dataset_path: path
-            location of saved dataset files
+            location of saved dataset files. Default: the graph's `dataset_cache_path`
+        input_datasets: dict {dataset_name: Dataset} or None
+            Input datasets already in memory (e.g. generated earlier in the same run).
+            These are used instead of reading the on-disk copies. Each edge receives its own
+            copy of their metadata, but data is shared, so transformers must not modify
+            their inputs in place.
+        prefetched: dict {dataset_name: Future} or None
+            Inputs already being loaded from disk (e.g. by `DAGExecutor`'s prefetcher).
+            Other on-disk inputs are loaded concurrently.
 
         returns:
             dict {dataset_name: Dataset}
         """
         if overwrite_catalog is True and write_dataset is False:
             raise ValueError("Overwrite_Catalog=True requires write_dataset=True")
+        if dataset_path is None:
+            dataset_path = self._dataset_cache_path
+        if input_datasets is None:
+            input_datasets = {}
 
-        if not self.fully_satisfied(edge_name):
+        if not self.fully_satisfied(edge_name, available=input_datasets):
             raise EasydataError(f"Edge '{edge_name}' has unsatisfied dependencies.")
-
-        # construct input dsdict. Assume all input datasets are on-disk and have valid hashes
+        if self.is_streaming(edge_name):
+            return self.process_chain([edge_name], write_dataset=write_dataset, overwrite_catalog=overwrite_catalog,
+                                      dataset_path=dataset_path, input_datasets=input_datasets)
+        if not self.leases:
+            return self._run_edge(edge_name, write_dataset, overwrite_catalog, dataset_path, input_datasets, prefetched)
+
+        outputs = self._edge_outputs[edge_name]
+        # outputs that appear while we wait for the lease were generated by another process
+        reusable = (write_dataset and not overwrite_catalog and pathlib.Path(dataset_path) == self._dataset_cache_path
+                    and not all(self.is_cached(name) for name in outputs))
+        with Lease(self._dataset_cache_path / '.leases' / f'{edge_name}.edge.lease'):
+            if reusable:
+                for name in outputs:
+                    self._invalidate_satisfaction(name)
+                if all(self.is_cached(name) for name in outputs):
+                    logger.info(f"Loading outputs of edge '{edge_name}', generated by another process")
+                    dsdict = self._load_inputs(outputs, dataset_path)
+                    self._record_fingerprint(edge_name, self.fingerprint(edge_name, input_datasets=input_datasets))
+                    annotate(outputs=len(dsdict), lease='reused')
+                    return dsdict
+            dsdict = self._run_edge(edge_name, write_dataset, overwrite_catalog, dataset_path, input_datasets, prefetched)
+            if dsdict is not None and write_dataset:
+                self.flush(outputs, dataset_path=dataset_path)  # on disk before the next holder looks
+            return dsdict
+
+    def _run_edge(self, edge_name, write_dataset, overwrite_catalog, dataset_path, input_datasets, prefetched):
+        """Process an edge whose inputs are available. See `process_edge`"""
+        # construct input dsdict. Inputs not supplied in memory are on-disk and have valid hashes
 
         edge = self.transformers[edge_name]
-        dsdict = {}
-        logger.debug(f"process_edge: Processing input datasets for edge:'{edge_name}'")
-        for in_ds in edge.get('input_datasets', []):  # sources have no inputs
-            logger.debug(f"process_edge: Loading Input Dataset '{in_ds}'")
+        fingerprint = self.fingerprint(edge_name, input_datasets=input_datasets)
+        cache_key = None
+        if self.build_cache is not None:
+            cache_key = self._build_cache_key(edge_name, input_datasets)
+            cached = self.build_cache.get(cache_key, self._edge_outputs[edge_name])
+            annotate(build_cache='miss' if cached is None else 'hit')
+            if cached is not None:
+                logger.info(f"Restored output datasets: {list(cached.keys())} for edge:'{edge_name}' from build cache")
+                if not self._record_outputs(cached, write_dataset=write_dataset,
+                                            overwrite_catalog=overwrite_catalog, dataset_path=dataset_path):
+                    return None
+                self._record_fingerprint(edge_name, fingerprint)
+                annotate(outputs=len(cached))
+                return cached
+
+        start_time = time.perf_counter()
+        with MemoryWatch() as memory:
+            dsdict = {}
+            logger.debug(f"process_edge: Processing input datasets for edge:'{edge_name}'")
+            in_names = edge.get('input_datasets', [])  # sources have no inputs
+            for in_ds in in_names:
+                if in_ds not in self.datasets:
+                    raise NotFoundError(f"Edge '{edge_name}' specifies an input dataset, '{in_ds}' that is not in the dataset catalog")
+            loaded = self._load_inputs([n for n in in_names if n not in input_datasets], dataset_path, prefetched)
+            for in_ds in in_names:
+                if in_ds in input_datasets:
+                    logger.debug(f"process_edge: Using in-memory Input Dataset '{in_ds}'")
+                    ds = copy.copy(input_datasets[in_ds])
+                    ds['metadata'] = copy.deepcopy(ds['metadata'])
+                else:
+                    ds = loaded[in_ds]
+                dsdict[in_ds] = ds
+
+            for transformer_name, transformer in self._transformers(edge_name):
+                logger.debug(f"process_edge:Applying transformer: {transformer_name} to input datasets: {list(dsdict.keys())}")
+                profiler = active_profiler()
+                with span(f"transformer: {transformer_name}", cat='transformer'):
+                    if profiler is not None and profiler.selects(edge_name, transformer_name):
+                        dsdict = profiler.run(transformer, dsdict, label=f"{edge_name}.{transformer_name}")
+                    else:
+                        dsdict = transformer(dsdict)
+                logger.info(f"Generated output datasets: {list(dsdict.keys())} via edge:'{edge_name}'")
+                if not self._record_outputs(dsdict, write_dataset=write_dataset,
+                                            overwrite_catalog=overwrite_catalog, dataset_path=dataset_path):
+                    return None
+
+        self._record_fingerprint(edge_name, fingerprint)
+        self._record_edge_stats(edge_name, time.perf_counter() - start_time, dataset_path, memory.peak)
+        annotate(outputs=len(dsdict))
+        if cache_key is not None:
+            outputs = {name: dsdict[name] for name in self._edge_outputs[edge_name] if name in dsdict}
+            if len(outputs) == len(self._edge_outputs[edge_name]):
+                self.build_cache.put(cache_key, outputs)
+        return dsdict
+
+    def _fetch_remote(self, ds_name, dataset_path):
+        """Download a Dataset from the remote cache, unless it is on disk with hashes matching the Dataset catalog"""
+        if self.remote_cache is None or ds_name not in self.datasets:
+            return
+        catalog_hashes = self.datasets[ds_name].get('hashes')
+        ds_meta = Dataset.from_disk(ds_name, data_path=dataset_path, metadata_only=True,
+                                    errors=False, check_hashes=False)
+        if catalog_hashes and not (ds_meta and self.check_dataset_hashes(ds_name, ds_meta['hashes'])):
+            self.remote_cache.get(ds_name, catalog_hashes, dataset_path)
+
+    def _load_input(self, ds_name, dataset_path):
+        """Load an (on-disk) input Dataset, checking its hashes against the Dataset catalog"""
+        logger.debug(f"process_edge: Loading Input Dataset '{ds_name}'")
+        self.flush([ds_name], dataset_path=dataset_path)
+        self._fetch_remote(ds_name, dataset_path)
+        return Dataset.from_disk(ds_name, data_path=dataset_path, check_hashes=True,
+                                 catalog_path=self._catalog_path, dataset_path=self._dataset_path)
+
+    def _load_input_elsewhere(self, ds_name, dataset_path):
+        """`_load_input`, for another thread: returns (Dataset, I/O counts), see `io_counter`"""
+        with io_counter() as io:
+            return self._load_input(ds_name, dataset_path), io
+
+    def _load_inputs(self, ds_names, dataset_path, prefetched=None):
+        """Load several input Datasets from disk, concurrently
+
+        The I/O of loads done in other threads is attributed to the calling stage (see `RunLog`).
+
+        Parameters
+        ----------
+        prefetched: dict {dataset_name: Future} or None
+            Datasets that are already being loaded, by `_load_input_elsewhere`
+
+        Returns
+        -------
+        dict {dataset_name: Dataset}
+        """
+        if prefetched is None:
+            prefetched = {}
+        futures = {name: prefetched[name] for name in ds_names if name in prefetched}
+        to_load = [name for name in ds_names if name not in prefetched]
+        if len(to_load) == 1 and not futures:
+            return {to_load[0]: self._load_input(to_load[0], dataset_path)}
+        pool = None
+        if to_load:
+            pool = cf.ThreadPoolExecutor(max_workers=min(len(to_load), n_jobs(), MAX_LOAD_THREADS),
+                                         thread_name_prefix='process_edge-load')
+            futures.update({name: pool.submit(self._load_input_elsewhere, name, dataset_path) for name in to_load})
+        try:
+            loaded = {}
+            for name in ds_names:
+                loaded[name], io = futures[name].result()
+                count_bytes(read=io['bytes_read'], written=io['bytes_written'])
+            return loaded
+        finally:
+            if pool is not None:
+                for future in futures.values():
+                    future.cancel()
+                pool.shutdown(wait=True)
+
+    @instrumented('process_chain', lambda self, chain, *args, **kwargs: ' -> '.join(chain))
+    def process_chain(self, chain, write_dataset=True, overwrite_catalog=False, dataset_path=None,
+                      input_datasets=None, chunk_size=None, materialize=True, on_commit=None):
+        """Process a chain of streaming edges, piping chunks from each edge to the next
+
+        Chunks flow through the whole chain as they are produced, so only a chunk
+        at a time of any dataset in the chain needs to be in memory. Each (non-ephemeral)
+        output along the chain is written to disk chunk by chunk (see `ChunkWriter`).
+
+        The hashes of a chunked dataset are computed from its rows, chunk by chunk
+        (see `ChunkHasher`), so they don't depend on `chunk_size`.
+
+        Parameters
+        ----------
+        chain: list of edge names
+            streaming edges (see `is_streaming`), each of which takes the single output
+            of the previous one as its single input (see `streaming_chains`)
+        chunk_size: int or None
+            rows per chunk, when splitting non-chunked inputs. Default: `DEFAULT_CHUNK_SIZE`
+        materialize: Boolean
+            If True, return the outputs of the last edge as complete Datasets.
+            If False, outputs written to disk are returned as metadata-only Datasets.
+        on_commit: callable or None
+            called as `on_commit(edge_name, dsdict)` once the outputs of each edge along the
+            chain are on disk, with metadata-only Datasets of its committed outputs
+            (e.g. `RunJournal.record`)
+
+        Other parameters are as per `process_edge`
+
+        Returns
+        -------
+        dict {dataset_name: Dataset} of the outputs of the last edge in the chain,
+        or None if any output failed hash validation
+        """
+        if overwrite_catalog is True and write_dataset is False:
+            raise ValueError("Overwrite_Catalog=True requires write_dataset=True")
+        if dataset_path is None:
+            dataset_path = self._dataset_cache_path
+        if input_datasets is None:
+            input_datasets = {}
+        chain = list(chain)
+        for edge_name in chain:
+            if not self.is_streaming(edge_name):
+                raise EasydataError(f"Edge '{edge_name}' is not a streaming edge")
+        for upstream, downstream in zip(chain, chain[1:]):
+            if len(self._edge_outputs[upstream]) != 1 or self._edge_inputs[downstream] != self._edge_outputs[upstream]:
+                raise EasydataError(f"Edge '{downstream}' does not take the single output of '{upstream}' as its input")
+        head, tail = chain[0], chain[-1]
+        if not self.fully_satisfied(head, available=input_datasets):
+            raise EasydataError(f"Edge '{head}' has unsatisfied dependencies.")
+        head_fingerprint = self.fingerprint(head, input_datasets=input_datasets)
+
+        start_time = time.perf_counter()
+        streams = {}
+        for in_ds in self._edge_inputs[head]:
             if in_ds not in self.datasets:
-                raise NotFoundError(f"Edge '{edge_name}' specifies an input dataset, '{in_ds}' that is not in the dataset catalog")
-            ds = Dataset.from_disk(in_ds, check_hashes=True)
-            dsdict[in_ds] = ds
+                raise NotFoundError(f"Edge '{head}' specifies an input dataset, '{in_ds}' that is not in the dataset catalog")
+            streams[in_ds] = self._input_chunks(in_ds, input_datasets, dataset_path, chunk_size)
+        chunks = zip_chunks(streams)
+
+        # Every output along the chain is hashed (and written, unless ephemeral) as it streams past
+        sinks = {}
+        for edge_name in chain:
+            for _, transformer in self._transformers(edge_name):
+                chunks = transformer(chunks)
+            for ds_name in self._edge_outputs[edge_name]:
+                if write_dataset and not self.is_ephemeral(ds_name):
+                    sinks[ds_name] = ChunkWriter(ds_name, dump_path=dataset_path)
+                elif edge_name == tail:
+                    sinks[ds_name] = ChunkWriter(ds_name)  # kept in memory
+                else:
+                    sinks[ds_name] = ChunkHasher(ds_name)
+            chunks = self._record_chunks(chunks, {name: sinks[name] for name in self._edge_outputs[edge_name]})
 
-        for xform_dict in edge.get('transformations', ()):
-            fail_func = partial(default_transformer, transformer_name=xform_dict['transformer_name'])
-            transformer = deserialize_partial(xform_dict, key_base="transformer", fail_func=fail_func)
-            logger.debug(f"process_edge:Applying transformer: {xform_dict} to input datasets: {list(dsdict.keys())}")
-            dsdict = transformer(dsdict)
-            logger.info(f"Generated output datasets: {list(dsdict.keys())} via edge:'{edge_name}'")
-            on_disk_datasets = processed_datasets(dataset_path=dataset_path)
+        try:
+            with span(f"chain: {' -> '.join(chain)}", cat='transformer'), MemoryWatch() as memory:
+                for _ in chunks:
+                    pass
+            metadata = {ds_name: sink.finish() for ds_name, sink in sinks.items()}
             success = True
-            for ds_name, ds in dsdict.items():
-                if ds is None:
-                    logger.warning(f"Failed to generate output Dataset: '{ds_name}'")
+            for ds_name, meta in metadata.items():
+                if overwrite_catalog:
+                    with self._lock:
+                        self.datasets[ds_name] = meta
+                    self._invalidate_satisfaction(ds_name)
+                elif ds_name not in self.datasets:
+                    logger.warning(f"Dataset:{ds_name} not in catalog. Cannot verify generated hashes")
+                elif not self.check_dataset_hashes(ds_name, meta['hashes']):
+                    catalog_hashes = self.datasets[ds_name].get('hashes', {})
+                    logger.warning(f"Hash Validation Failed. Dataset:'{ds_name}' hashes:{meta['hashes']} do not match catalog hashes:{catalog_hashes}")
                     success = False
+        except BaseException:
+            for sink in sinks.values():
+                if isinstance(sink, ChunkWriter):
+                    sink.abort()
+            raise
+        if not success:
+            for sink in sinks.values():
+                if isinstance(sink, ChunkWriter):
+                    sink.abort()
+            annotate(status='failed')
+            return None
+
+        self.flush(sinks, dataset_path=dataset_path)  # don't race an earlier write of these outputs
+        dsdict = {}
+        for edge_name in chain:
+            committed = {}
+            for ds_name in self._edge_outputs[edge_name]:
+                sink = sinks[ds_name]
+                if not isinstance(sink, ChunkWriter) or sink.dump_path is None:
+                    if edge_name == tail:
+                        dsdict[ds_name] = sink.load()
                     continue
-                # Dataset is created, but doesn't have hashes yet
-                ds.update_hashes()
-                generated_hashes = ds.metadata.get("hashes", {})
-                if overwrite_catalog:
-                    logger.debug(f"process_edge: Updating catalog entry for {ds.name}")
-                    self.datasets[ds_name] = ds.metadata
-                else: # don't overwrite catalog
-                    if ds_name not in self.datasets:
-                        logger.warning(f"Dataset:{ds_name} not in catalog. Cannot verify generated hashes")
-                    else: # ds_name is in self.datasets. Check its hash
-                        catalog_hashes = self.datasets[ds_name].get("hashes", {})
-                        if not ds.verify_hashes(catalog_hashes):
-                            logger.warning(f"Hash Validation Failed. Dataset:'{ds.name}' hashes:{ds.HASHES} do not match catalog hashes:{catalog_hashes}")
-                            success = False
-                            continue
-
-                if write_dataset and (overwrite_catalog or ds_name not in on_disk_datasets):
-                    if overwrite_catalog:
-                        logger.debug(f"process_edge: Overwriting '{ds_name}' in `dataset_path`")
+                if overwrite_catalog or not (pathlib.Path(dataset_path) / f"{ds_name}.metadata").exists():
+                    sink.commit()
+                    self._invalidate_satisfaction(ds_name)
+                else:
+                    sink.abort()  # keep the (verified) copy already on disk
+                committed[ds_name] = Dataset(ds_name, metadata=metadata[ds_name], update_hashes=False)
+                if edge_name == tail:
+                    if materialize:
+                        dsdict[ds_name] = Dataset.from_disk(ds_name, data_path=dataset_path, check_hashes=False)
                     else:
-                        logger.debug(f"process_edge: Writing '{ds_name}' to `dataset_path`")
-                    ds.dump(dump_path=dataset_path, exists_ok=True, update_catalog=overwrite_catalog)
-            logger.debug(f"process_edge: Reloading Dataset catalog after processing edge:'{edge_name}'")
-            self._update_catalogs(transformers=False, datasets=True, create=False)
-            if success is False:
-                return None
+                        dsdict[ds_name] = committed[ds_name]
+            if on_commit is not None:
+                on_commit(edge_name, committed)
+        logger.info(f"Generated output datasets: {list(dsdict.keys())} via edges:{chain}")
+
+        self._record_fingerprint(head, head_fingerprint)
+        for edge_name in chain[1:]:
+            input_hashes = {ds_name: metadata[ds_name]['hashes'] for ds_name in self._edge_inputs[edge_name]}
+            self._record_fingerprint(edge_name, edge_fingerprint(self.transformers[edge_name].get('transformations', []),
+                                                                 input_hashes))
+        self._record_edge_stats(tail, time.perf_counter() - start_time, dataset_path, memory.peak)
+        annotate(outputs=len(dsdict))
         return dsdict
 
+    def _input_chunks(self, ds_name, input_datasets, dataset_path, chunk_size):
+        """Iterate over the chunks of an input dataset: in memory, chunked on disk, or (split from) on disk"""
+        if ds_name in input_datasets:
+            logger.debug(f"process_chain: Using in-memory Input Dataset '{ds_name}'")
+            return iter_chunks(input_datasets[ds_name], chunk_size=chunk_size)
+        self.flush([ds_name], dataset_path=dataset_path)
+        self._fetch_remote(ds_name, dataset_path)
+        meta = Dataset.from_disk(ds_name, data_path=dataset_path, metadata_only=True, check_hashes=True,
+                                 catalog_path=self._catalog_path, dataset_path=self._dataset_path)
+        if meta.get('chunks') is not None:
+            logger.debug(f"process_chain: Reading chunked Input Dataset '{ds_name}'")
+            return read_chunks(ds_name, dataset_path)
+        logger.debug(f"process_chain: Loading Input Dataset '{ds_name}'")
+        ds = Dataset.from_disk(ds_name, data_path=dataset_path, check_hashes=True,
+                               catalog_path=self._catalog_path, dataset_path=self._dataset_path)
+        return iter_chunks(ds, chunk_size=chunk_size)
+
+    @staticmethod
+    def _record_chunks(chunks, sinks):
+        """Pass on a stream of chunk dicts, handing each output chunk to its ChunkWriter (or ChunkHasher)"""
+        for chunk_dict in chunks:
+            for ds_name, sink in sinks.items():
+                if chunk_dict.get(ds_name) is None:
+                    raise EasydataError(f"Streaming transformer yielded a chunk without output dataset '{ds_name}'")
+                sink.write(chunk_dict[ds_name])
+            yield {ds_name: chunk_dict[ds_name] for ds_name in sinks}
+
+    def flush(self, dataset_names=None, dataset_path=None):
+        """Wait until Datasets queued for writing (see `write_behind`) are on disk
+
+        Parameters
+        ----------
+        dataset_names: iterable of str, or None
+            Wait for these Datasets only. Default: all pending Datasets
+        dataset_path: path or None
+            Location of the awaited Datasets. Default: the graph's `dataset_cache_path`
+
+        Raises
+        ------
+        EasydataError, if any of the awaited Datasets could not be written
+        """
+        if self.write_behind is None:
+            return
+        if dataset_names is None:
+            self.write_behind.wait()
+        else:
+            self.write_behind.wait(dataset_names, dump_path=dataset_path or self._dataset_cache_path)
+
+    def _record_outputs(self, dsdict, write_dataset, overwrite_catalog, dataset_path):
+        """Verify (or catalog) and write the output datasets of an edge
+
+        Used by `process_edge`. Returns False if any output is missing, or fails hash validation.
+        """
+        success = True
+        for ds_name, ds in dsdict.items():
+            if ds is None:
+                logger.warning(f"Failed to generate output Dataset: '{ds_name}'")
+                success = False
+                continue
+            # Dataset is created, but doesn't have hashes yet
+            ds.update_hashes()
+            if overwrite_catalog:
+                logger.debug(f"process_edge: Updating catalog entry for {ds.name}")
+                with self._lock:
+                    self.datasets[ds_name] = ds.metadata
+                self._invalidate_satisfaction(ds_name)
+            else: # don't overwrite catalog
+                if ds_name not in self.datasets:
+                    logger.warning(f"Dataset:{ds_name} not in catalog. Cannot verify generated hashes")
+                else: # ds_name is in self.datasets. Check its hash
+                    catalog_hashes = self.datasets[ds_name].get("hashes", {})
+                    if not ds.verify_hashes(catalog_hashes):
+                        logger.warning(f"Hash Validation Failed. Dataset:'{ds.name}' hashes:{ds.HASHES} do not match catalog hashes:{catalog_hashes}")
+                        success = False
+                        continue
+
+            if self.is_ephemeral(ds_name):
+                logger.debug(f"process_edge: Not writing ephemeral Dataset '{ds_name}'")
+            elif write_dataset and (overwrite_catalog or
+                                    not (pathlib.Path(dataset_path) / f"{ds_name}.metadata").exists()):
+                if overwrite_catalog:
+                    logger.debug(f"process_edge: Overwriting '{ds_name}' in `dataset_path`")
+                else:
+                    logger.debug(f"process_edge: Writing '{ds_name}' to `dataset_path`")
+                # the catalog entry (if any) was updated above
+                dump_kwargs = {'exists_ok': True, 'update_catalog': False, 'remote_cache': self.remote_cache}
+                if self.write_behind is None:
+                    ds.dump(dump_path=dataset_path, **dump_kwargs)
+                    self._invalidate_satisfaction(ds_name)
+                else:
+                    self.write_behind.submit(ds, dataset_path, callback=partial(self._invalidate_satisfaction, ds_name),
+                                             **dump_kwargs)
+        if not success:
+            annotate(status='failed')
+        return success
+
+    def _build_cache_key(self, edge_name, input_datasets=None):
+        """Compute the build cache key of an edge
+
+        The key is derived from the edge's transformations and the hashes of its inputs
+        (taken from `input_datasets` if present there, or the Dataset catalog otherwise).
+        Returns None if the edge can't be cached. Edges with ephemeral outputs are never cached.
+        """
+        if any(self.is_ephemeral(node) for node in self._edge_outputs[edge_name]):
+            return None
+        return self.build_cache.key(self.transformers[edge_name].get('transformations', []),
+                                    self._input_hashes(edge_name, input_datasets))
+
+    def _input_hashes(self, edge_name, input_datasets=None):
+        """Hashes of an edge's inputs
+
+        Taken from `input_datasets` if present there, or the Dataset catalog otherwise.
+
+        Returns
+        -------
+        dict {dataset_name: hash_dict}
+        """
+        if input_datasets is None:
+            input_datasets = {}
+        input_hashes = {}
+        for in_ds in self._edge_inputs[edge_name]:
+            if in_ds in input_datasets:
+                input_hashes[in_ds] = input_datasets[in_ds].metadata.get('hashes', {})
+            else:
+                input_hashes[in_ds] = self.datasets.get(in_ds, {}).get('hashes', {})
+        return input_hashes
+
+    def fingerprint(self, edge_name, input_datasets=None):
+        """Compute the current fingerprint of an edge
+
+        The fingerprint covers the edge's transformations and the hashes of its inputs.
+        When an edge is processed, its fingerprint is recorded in the fingerprint catalog,
+        (see `outdated()`).
+
+        Parameters
+        ----------
+        edge_name: str
+            name of the edge (in the transformer catalog)
+        input_datasets: dict {dataset_name: Dataset} or None
+            Input datasets already in memory. Their hashes take precedence over the Dataset catalog.
+
+        Returns
+        -------
+        fingerprint (str)
+        """
+        return edge_fingerprint(self.transformers[edge_name].get('transformations', []),
+                                self._input_hashes(edge_name, input_datasets))
+
+    def _record_edge_stats(self, edge_name, wall_time, dataset_path, peak_memory):
+        """Record the cost of processing an edge
+
+        Stored statistics are:
+
+        wall_time: float
+            seconds taken to load the inputs, apply the transformations, and write the outputs
+        peak_memory: int or None
+            how far the process's resident memory rose (at its peak) while the edge loaded its
+            inputs and applied its transformations, in bytes (see `MemoryWatch`). This includes
+            the allocations of any edges running concurrently in the same process.
+            None if memory use can't be measured on this platform.
+        output_bytes: int
+            on-disk size of the edge's (non-ephemeral) outputs
+        """
+        output_bytes = sum(self._disk_usage(ds_name, dataset_path) for ds_name in self._edge_outputs[edge_name]
+                           if not self.is_ephemeral(ds_name))
+        stats = {
+            'wall_time': wall_time,
+            'peak_memory': peak_memory,
+            'output_bytes': output_bytes,
+        }
+        logger.debug(f"Edge '{edge_name}' statistics: {stats}")
+        annotate(peak_memory=peak_memory)
+        with self._lock:
+            self.edge_stats[edge_name] = stats
+
+    def _disk_usage(self, ds_name, dataset_path=None):
+        """On-disk size of a Dataset (in bytes). 0 if it isn't on disk"""
+        dataset_path = pathlib.Path(self._dataset_cache_path if dataset_path is None else dataset_path)
+        size = 0
+        for suffix in ('.dataset', '.metadata'):
+            try:
+                size += (dataset_path / f"{ds_name}{suffix}").stat().st_size
+            except FileNotFoundError:
+                pass
+        chunk_dir = dataset_path / f"{ds_name}.chunks"
+        if chunk_dir.is_dir():
+            size += sum(chunk.stat().st_size for chunk in chunk_dir.iterdir())
+        return size
+
+    def _record_fingerprint(self, edge_name, fingerprint):
+        """Record the fingerprint an edge was (successfully) processed with"""
+        with self._lock:
+            self.fingerprints[edge_name] = {'fingerprint': fingerprint}
 
     def check_dataset_hashes(self, ds_name, hash_dict):
         """Verify that the supplied hash dictionary is a subset of the hashes in the Dataset catalog
@@ -2108,38 +2916,110 @@ class DatasetGraph:
                 return False
         return True
 
-    def fully_satisfied(self, edge):
+    def dataset_state(self, ds_name):
+        """Determine the on-disk state of a dataset
+
+        Only the on-disk metadata is examined.
+        During a traversal or generation, the result for each node is remembered
+        (until the node is rewritten), so the metadata is only read once.
+
+        Returns
+        -------
+        One of:
+            'cached': present on disk, with hashes matching the Dataset catalog,
+                or available from the remote cache (it is downloaded when loaded; see `_fetch_remote`)
+            'missing': not present on disk
+            'hash mismatch': present on disk, but hashes do not match the Dataset catalog
+            'ephemeral': never written to disk
+        """
+        if self.is_ephemeral(ds_name):
+            return 'ephemeral'
+        self.flush([ds_name])
+        cache = self._satisfaction_cache
+        if cache is not None and ds_name in cache:
+            return cache[ds_name]
+        ds_meta = Dataset.from_disk(ds_name, data_path=self._dataset_cache_path, metadata_only=True,
+                                    errors=False, check_hashes=False)
+        if not ds_meta:  # does not exist
+            logger.debug(f"No cached dataset found for dataset '{ds_name}'.")
+            state = 'missing'
+        else:
+            if ds_name not in self.datasets:
+                raise NotFoundError(f"Missing '{ds_name}' in dataset catalog")
+            if self.check_dataset_hashes(ds_name, ds_meta['hashes']):
+                state = 'cached'
+            else:
+                state = 'hash mismatch'
+        if state != 'cached' and self.remote_cache is not None and ds_name in self.datasets:
+            # only check that the remote cache has it: planning shouldn't download anything
+            catalog_hashes = self.datasets[ds_name].get('hashes')
+            if catalog_hashes and (ds_name, catalog_hashes) in self.remote_cache:
+                state = 'cached'
+        if cache is not None:
+            cache[ds_name] = state
+        return state
+
+    def is_cached(self, ds_name):
+        """Determine whether a dataset is present (cached) on disk with hashes matching the Dataset catalog
+
+        Ephemeral datasets are never considered cached. See `dataset_state()`
+        """
+        return self.dataset_state(ds_name) == 'cached'
+
+    def fully_satisfied(self, edge, available=None):
         """Determine whether all dependencies of the given edge (transformer) are satisfied
 
-        Satisfied here means all input datasets are present (cached) on disk with valid hashes.
+        Satisfied here means all input datasets are either `available` in memory,
+        or present (cached) on disk with valid hashes.
         Sources are always considered satisfied
+
+        available: collection of dataset names, or None
+            Datasets that are already available in memory
         """
         if self.is_source(edge):
             return True
+        if available is None:
+            available = ()
 
         input_datasets = self.transformers[edge].get('input_datasets', [])
 
         for ds_name in input_datasets:
-            ds_meta = Dataset.from_disk(ds_name, metadata_only=True, errors=False, check_hashes=False)
-            if not ds_meta:  # does not exist
-                logger.debug(f"No cached dataset found for dataset '{ds_name}'.")
-                return False
-            if ds_name not in self.datasets:
-                raise NotFoundError(f"Missing '{ds_name}' in dataset catalog")
-            if not self.check_dataset_hashes(ds_name, ds_meta['hashes']):
+            if ds_name in available:
+                continue
+            if not self.is_cached(ds_name):
                 return False
 
-
         return True
 
-    def generate(self, dataset_name, write_datasets=True, overwrite_catalog=False, exhaustive=False):
+    def plan(self, dataset_names, exhaustive=False, force=None):
+        """Determine which edges must be processed to generate the given datasets, and why
+
+        Parameters
+        ----------
+        dataset_names: str or iterable of str
+            Names of datasets to generate
+        exhaustive: Boolean
+            If True, plan to regenerate all upstream Datasets (back to sources),
+            even if they are present on-disk with valid hashes
+        force: dict {edge_name: reason}, iterable of edge names, or None
+            Additional edges to process
+
+        Returns
+        -------
+        ExecutionPlan. Use `plan.explain()` for a readable description.
+        """
+        with self._memoized_satisfaction():
+            return ExecutionPlan(self, dataset_names, exhaustive=exhaustive, force=force)
+
+    @traced('generate', lambda self, dataset_name, *args, **kwargs: f"generate: {dataset_name}")
+    def generate(self, dataset_name, write_datasets=True, overwrite_catalog=False, exhaustive=False,
+                 executor=None, max_workers=None, resume=False):
         """Generate a dsdict containing the specified node (dataset) and its siblings
 
         If the edge that generates dataset_name produces additional (sibling) datsets,
         these will also be present in the returned dsdict
 
-        Traverse the edge list, executing all transformers needed to genereate `dataset_name`.
-        All the heavy lifting is done in traverse()
+        Executes the `plan()` for `dataset_name`: every transformer needed to generate it.
 
         Parameters
         ----------
@@ -2152,16 +3032,236 @@ class DatasetGraph:
             If True, and hashes match, write updated Datasets to processed_data_path
         overwrite_catalog: Boolean
             If True, write updated metadata to Catalog files. Requires write_datasets=True
+        executor: {None, 'serial', 'thread', 'process', 'streaming'} or DAGExecutor
+            How to run the edges. If None or 'serial', edges are processed one at a time.
+            'thread' and 'process' process independent edges concurrently, using a pool of
+            threads or processes respectively. To run edges on other machines, pass
+            `DAGExecutor('distributed', coordinator=...)` (see `Coordinator`).
+            'streaming' processes edges one at a time, piping chains of streaming edges
+            together (see `streaming_transformer`).
+        max_workers: int or None
+            Maximum number of concurrent edges for a parallel `executor`. Default: number of CPUs
+        resume: Boolean
+            If True, and an earlier run with the same arguments was interrupted, continue it:
+            edges it completed are skipped, without re-planning or re-verifying them.
+            (Runs that write datasets always keep a `RunJournal` until they succeed.)
+
+        Datasets generated along the way are handed to downstream edges in memory.
+        If generation fails because a transformer raised an exception, that exception is re-raised.
         """
-        logger.debug(f"Generating edge traversal list for Dataset:'{dataset_name}'")
-        _, edge_list = self.traverse(dataset_name, exhaustive=exhaustive)
-        logger.debug(f"Traversal complete. Edges to process: {edge_list}")
-        for edge in edge_list:
-            dsdict = self.process_edge(edge, write_dataset=write_datasets, overwrite_catalog=overwrite_catalog)
-            if dsdict is None:
-                logger.error("Generation from DatasetGraph failed.")
-                return None
-        return dsdict
+        if executor is None:
+            executor = 'serial'
+        if isinstance(executor, str):
+            executor = DAGExecutor(kind=executor, max_workers=max_workers)
+        _, target_edge, _ = self.find_child(dataset_name)
+        results = self._run_journaled([dataset_name], executor, keep=[target_edge], exhaustive=exhaustive,
+                                      resume=resume, write_dataset=write_datasets,
+                                      overwrite_catalog=overwrite_catalog)
+        if target_edge not in results:
+            logger.error("Generation from DatasetGraph failed.")
+            for err in executor.failed_.values():
+                if err is not None:
+                    raise err
+            return None
+        return results[target_edge]
+
+    @traced('generate_many')
+    def generate_many(self, dataset_names, write_datasets=True, overwrite_catalog=False, exhaustive=False,
+                      executor=None, max_workers=None, resume=False):
+        """Generate several datasets, sharing the work needed by common ancestors
+
+        The subgraphs needed to generate each dataset are combined, so that every edge
+        is processed at most once, in dependency order.
+
+        Parameters
+        ----------
+        dataset_names: iterable of str
+            Names of datasets to generate. Each must be a node in the graph
+        executor: {None, 'serial', 'thread', 'process', 'streaming'} or DAGExecutor
+            How to run the edges. Default 'serial'. See `generate`
+        max_workers: int or None
+            Maximum number of concurrent edges for a parallel `executor`.
+
+        Other parameters are as per `generate`
+
+        Returns
+        -------
+        dict {dataset_name: Dataset} of the requested datasets that were generated successfully
+        """
+        dataset_names = list(dict.fromkeys(normalize_to_list(dataset_names)))
+        if not dataset_names:
+            return {}
+        target_edges = {name: self.find_child(name)[1] for name in dataset_names}
+        if executor is None:
+            executor = 'serial'
+        if isinstance(executor, str):
+            executor = DAGExecutor(kind=executor, max_workers=max_workers)
+
+        results = self._run_journaled(dataset_names, executor, keep=set(target_edges.values()),
+                                      exhaustive=exhaustive, resume=resume, write_dataset=write_datasets,
+                                      overwrite_catalog=overwrite_catalog)
+
+        generated = {}
+        for name, edge in target_edges.items():
+            dsdict = results.get(edge)
+            if dsdict is None or name not in dsdict:
+                logger.error(f"Generation of Dataset:'{name}' from DatasetGraph failed.")
+                continue
+            generated[name] = dsdict[name]
+        return generated
+
+    def _run_journaled(self, dataset_names, executor, keep, exhaustive=False, resume=False, **edge_kwargs):
+        """Plan and run the edges needed to generate `dataset_names`, keeping a `RunJournal`
+
+        If `resume` is True and an unfinished journal of the same run exists, only the
+        edges it has not completed are run. The journal is discarded once every edge in
+        `keep` has succeeded.
+
+        Returns
+        -------
+        dict {edge_name: dsdict}, as per `DAGExecutor.run`
+        """
+        journal = None
+        if edge_kwargs.get('write_dataset', True):
+            journal = RunJournal.for_run(self, dataset_names, exhaustive=exhaustive,
+                                         overwrite_catalog=edge_kwargs.get('overwrite_catalog', False))
+        with self._memoized_satisfaction():
+            edges = None
+            if resume and journal is not None and journal.exists():
+                edges = journal.remaining(keep=keep)
+            if edges is None:
+                edges = self.plan(dataset_names, exhaustive=exhaustive)
+                logger.debug(edges.explain())
+                if journal is not None:
+                    journal.start(edges, targets=dataset_names)
+            results = executor.run(self, edges, keep=keep, journal=journal, **edge_kwargs)
+        self.flush()
+        if journal is not None and all(edge in results for edge in keep):
+            journal.discard()
+        return results
+
+    def toposort(self, edges=None):
+        """Order edges so that every edge follows the edges that produce its inputs
+
+        Parameters
+        ----------
+        edges: iterable of edge names, or None
+            Edges to sort. Only dependencies within this set are considered.
+            Default: every edge in the graph
+
+        Returns
+        -------
+        list of edge names, in dependency order. Ties are broken by edge name.
+        """
+        if edges is None:
+            edges = self.edges
+        edges = set(edges)
+        upstream = {}
+        for edge in edges:
+            upstream[edge] = {self._producers[node] for node in self._edge_inputs[edge]
+                              if self._producers.get(node) in edges} - {edge}
+        downstream = defaultdict(set)
+        for edge, deps in upstream.items():
+            for dep in deps:
+                downstream[dep].add(edge)
+        pending = {edge: len(deps) for edge, deps in upstream.items()}
+        ready = sorted(edge for edge, count in pending.items() if count == 0)
+        order = []
+        while ready:
+            edge = ready.pop(0)
+            order.append(edge)
+            for child in sorted(downstream[edge]):
+                pending[child] -= 1
+                if pending[child] == 0:
+                    ready.append(child)
+        if len(order) < len(edges):
+            cyclic = sorted(edges - set(order))
+            logger.error(f"Edges {cyclic} could not be ordered. Is there a cycle in the graph?")
+            order.extend(cyclic)
+        return order
+
+    def edge_changed(self, edge_name):
+        """Determine whether an edge has changed since its outputs were written
+
+        An edge has changed if its current `fingerprint()` differs from the one recorded
+        when it was last processed. An edge with no recorded fingerprint has changed
+        if any of its outputs are on disk: what they were generated from is unknown
+        (e.g. they predate fingerprint tracking), so they are regenerated once.
+        Edges that have never been processed have not changed.
+
+        Returns
+        -------
+        Boolean
+        """
+        recorded = self.fingerprints.get(edge_name, {}).get('fingerprint')
+        if recorded is None:
+            changed = any((self._dataset_cache_path / f"{ds_name}.metadata").exists()
+                          for ds_name in self._edge_outputs[edge_name] if not self.is_ephemeral(ds_name))
+        else:
+            changed = recorded != self.fingerprint(edge_name)
+        if changed:
+            logger.debug(f"Edge '{edge_name}' has changed since it was last processed")
+        return changed
+
+    def outdated(self):
+        """Find edges whose outputs are out of date
+
+        An edge is outdated if its transformations or the hashes of its inputs have changed
+        since it was last processed (see `edge_changed`), or if any upstream edge is outdated.
+
+        Returns
+        -------
+        list of outdated edge names, in dependency order
+        """
+        # edges may have been processed by another process since we loaded the fingerprints
+        self.fingerprints = self._bookkeeping_catalog(self._fingerprint_path)
+        dirty = set()
+        order = self.toposort()
+        for edge in order:
+            if edge in dirty or not self.edge_changed(edge):
+                continue
+            queue = deque([edge])
+            while queue:
+                stale = queue.popleft()
+                if stale in dirty:
+                    continue
+                dirty.add(stale)
+                for node in self._edge_outputs[stale]:
+                    queue.extend(self._consumers.get(node, ()))
+        return [edge for edge in order if edge in dirty]
+
+    def rebuild_outdated(self, executor=None, max_workers=None):
+        """Regenerate the outputs of every `outdated()` edge
+
+        Only the outdated edges (plus any edges needed to regenerate missing inputs) are processed.
+        Their reason in the `plan()` is 'outdated'.
+        As the outputs are expected to change, the Dataset catalog is updated with their new hashes.
+
+        Parameters
+        ----------
+        executor: {None, 'serial', 'thread', 'process', 'streaming'} or DAGExecutor
+            How to run the edges. Default 'serial'. See `generate`
+        max_workers: int or None
+            Maximum number of concurrent edges for a parallel `executor`.
+
+        Returns
+        -------
+        list of outdated edges that were successfully rebuilt
+        """
+        if executor is None:
+            executor = 'serial'
+        if isinstance(executor, str):
+            executor = DAGExecutor(kind=executor, max_workers=max_workers)
+        with self._memoized_satisfaction():
+            dirty = self.outdated()
+            if not dirty:
+                logger.info("No outdated edges.")
+                return []
+            plan = self.plan([], force={edge: 'outdated' for edge in dirty})
+            logger.info(plan.explain())
+            executor.run(self, plan, keep=(), write_dataset=True, overwrite_catalog=True)
+        self.flush()
+        return [edge for edge in dirty if edge in executor.completed_]
 
 
 
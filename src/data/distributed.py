@@ -0,0 +1,331 @@
+"""
+Distributed execution of DatasetGraph edges: a coordinator, and workers that may run on other machines
+"""
+import concurrent.futures as cf
+import multiprocessing
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+import uuid
+from multiprocessing.managers import BaseManager
+
+from ..exceptions import EasydataError
+from ..log import logger
+from . import execution
+
+__all__ = [
+    'Coordinator',
+    'LocalCluster',
+    'run_worker',
+]
+
+# Queues shared through the coordinator (only populated in the coordinator's server process)
+_queues = {}
+
+
+def _shared_queue(name):
+    return _queues.setdefault(name, queue.Queue())
+
+
+def _task_queue():
+    return _shared_queue('tasks')
+
+
+def _result_queue():
+    return _shared_queue('results')
+
+
+class _CoordinatorManager(BaseManager):
+    pass
+
+
+_CoordinatorManager.register('tasks', callable=_task_queue)
+_CoordinatorManager.register('results', callable=_result_queue)
+
+
+def _parse_address(address):
+    if isinstance(address, str):
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return tuple(address)
+
+
+def _authkey(authkey):
+    if authkey is None:
+        authkey = os.environ.get('EASYDATA_COORDINATOR_AUTHKEY')
+        if authkey is None:
+            return None
+    if isinstance(authkey, str):
+        authkey = authkey.encode()
+    return authkey
+
+
+class Coordinator:
+    """Dispatches DatasetGraph edges to workers, which may run on other machines.
+
+    The coordinator serves a queue of tasks (edges to process) and a queue of
+    their results. Workers (see `run_worker`) connect to it, take tasks as they
+    become free, and process each edge with their own DatasetGraph. The
+    scheduling itself (which edges are ready to run) stays with the
+    `DAGExecutor` in the process that owns the coordinator.
+
+    Workers read and write catalogs and datasets directly, so the graph's
+    `catalog_path` and `dataset_cache_path` (and any build cache) must be on a
+    filesystem shared by every worker, at the same paths.
+
+    Use with `DAGExecutor(kind='distributed', coordinator=...)`. Only one run
+    at a time can use a coordinator.
+
+    To start a worker on another machine::
+
+        EASYDATA_COORDINATOR_AUTHKEY=<authkey> python -m src.data.distributed <host>:<port>
+    """
+
+    def __init__(self, address=('127.0.0.1', 0), authkey=None, task_timeout=None):
+        """
+        Parameters
+        ----------
+        address: (host, port) tuple or "host:port" string
+            Address to listen on. Port 0 picks a free port (see `address` once started).
+            To accept workers on other machines, listen on an externally visible interface.
+        authkey: bytes, str, or None
+            Key workers must present to connect. Default: the EASYDATA_COORDINATOR_AUTHKEY
+            environment variable if set, otherwise a random key (see `authkey`)
+        task_timeout: float or None
+            If given, fail any task that has not returned a result after this many seconds
+            (e.g. because its worker died)
+        """
+        self._requested_address = _parse_address(address)
+        self.authkey = _authkey(authkey) or uuid.uuid4().hex.encode()
+        self.task_timeout = task_timeout
+        self._manager = None
+        self._busy = threading.Lock()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(address={self.address})"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+    @property
+    def address(self):
+        """The (host, port) the coordinator is listening on"""
+        if self._manager is None:
+            return self._requested_address
+        return self._manager.address
+
+    def start(self):
+        """Start serving the task and result queues (in a separate process)"""
+        if self._manager is not None:
+            return
+        self._manager = _CoordinatorManager(address=self._requested_address, authkey=self.authkey)
+        self._manager.start()
+        logger.info(f"Coordinator listening on {self.address[0]}:{self.address[1]}")
+
+    def shutdown(self):
+        """Stop the coordinator. Connected workers exit once they notice."""
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def pool(self, context):
+        """An Executor-like pool that runs tasks on this coordinator's workers (used by `DAGExecutor`)
+
+        Parameters
+        ----------
+        context: tuple
+            arguments for `execution._init_process_worker` (the DatasetGraph
+            options, and collectors to activate in the worker)
+        """
+        self.start()
+        return _DistributedPool(self, context)
+
+
+class _DistributedPool:
+    """Minimal concurrent.futures-style Executor that sends tasks through a Coordinator"""
+
+    def __init__(self, coordinator, context):
+        self.coordinator = coordinator
+        self.context = context
+        self.job_id = uuid.uuid4().hex
+        self._tasks = coordinator._manager.tasks()
+        self._results = coordinator._manager.results()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reader = threading.Thread(target=self._read_results, name='easydata-coordinator', daemon=True)
+
+    def __enter__(self):
+        if not self.coordinator._busy.acquire(blocking=False):
+            raise EasydataError(f"{self.coordinator} is already in use by another run")
+        self._reader.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._reader.join()
+        self.coordinator._busy.release()
+        return False
+
+    def submit(self, func, *args, **kwargs):
+        future = cf.Future()
+        task_id = uuid.uuid4().hex
+        with self._lock:
+            self._futures[task_id] = (future, time.monotonic())
+        self._tasks.put((task_id, self.job_id, self.context, func, args, kwargs))
+        return future
+
+    def _read_results(self):
+        while not self._stop.is_set():
+            try:
+                task_id, ok, value = self._results.get(timeout=0.2)
+            except queue.Empty:
+                self._expire_tasks()
+                continue
+            except (EOFError, OSError) as err:
+                self._fail_all(EasydataError(f"Lost connection to coordinator: {err!r}"))
+                return
+            with self._lock:
+                future, _ = self._futures.pop(task_id, (None, None))
+            if future is None:
+                logger.debug(f"Ignoring result of unknown task {task_id}")
+            elif ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _expire_tasks(self):
+        timeout = self.coordinator.task_timeout
+        if timeout is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            expired = [task_id for task_id, (_, submitted) in self._futures.items() if now - submitted > timeout]
+            futures = [self._futures.pop(task_id)[0] for task_id in expired]
+        for future in futures:
+            future.set_exception(TimeoutError(f"No result from a worker within {timeout}s"))
+
+    def _fail_all(self, err):
+        with self._lock:
+            futures = [future for future, _ in self._futures.values()]
+            self._futures.clear()
+        for future in futures:
+            future.set_exception(err)
+
+
+def run_worker(address, authkey=None, connect_timeout=60, poll_interval=1.0):
+    """Process tasks from a Coordinator until it shuts down
+
+    Parameters
+    ----------
+    address: (host, port) tuple or "host:port" string
+        Address of the coordinator
+    authkey: bytes, str, or None
+        The coordinator's key. Default: the EASYDATA_COORDINATOR_AUTHKEY environment variable
+    connect_timeout: float
+        How long to keep retrying if the coordinator isn't listening yet
+    poll_interval: float
+        How often to check for tasks
+
+    Returns
+    -------
+    number of tasks processed
+    """
+    address = _parse_address(address)
+    manager = _CoordinatorManager(address=address, authkey=_authkey(authkey))
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            manager.connect()
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(min(poll_interval, 1.0))
+    tasks, results = manager.tasks(), manager.results()
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Worker {worker} connected to coordinator at {address[0]}:{address[1]}")
+    job_id = None
+    n_tasks = 0
+    while True:
+        try:
+            task_id, task_job, context, func, args, kwargs = tasks.get(timeout=poll_interval)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError):
+            break
+        if task_job != job_id:
+            # a new run: rebuild the DatasetGraph, in case the catalogs have changed
+            execution._init_process_worker(*context)
+            job_id = task_job
+        try:
+            reply = (task_id, True, func(*args, **kwargs))
+        except Exception as err:
+            reply = (task_id, False, err)
+        n_tasks += 1
+        try:
+            try:
+                results.put(reply)
+            except Exception as err:
+                if isinstance(err, (EOFError, OSError)):
+                    raise
+                # e.g. an unpicklable result or exception
+                results.put((task_id, False, EasydataError(f"Worker {worker} could not return result: {err!r}")))
+        except (EOFError, OSError):
+            break
+    logger.info(f"Worker {worker} exiting after {n_tasks} tasks")
+    return n_tasks
+
+
+class LocalCluster(Coordinator):
+    """A Coordinator with workers in local processes, standing in for a cluster of machines.
+
+    Useful for testing distributed runs on a single machine:
+
+        with LocalCluster(n_workers=4) as cluster:
+            dag.generate('my_dataset', executor=DAGExecutor('distributed', coordinator=cluster))
+    """
+
+    def __init__(self, n_workers=None, **kwargs):
+        """
+        Parameters
+        ----------
+        n_workers: int or None
+            Number of worker processes. Default: number of CPUs
+        **kwargs:
+            passed to `Coordinator`
+        """
+        super().__init__(**kwargs)
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self._workers = []
+
+    def start(self):
+        if self._manager is not None:
+            return
+        super().start()
+        for i in range(self.n_workers):
+            process = multiprocessing.Process(target=run_worker, args=(self.address, self.authkey),
+                                              kwargs={'poll_interval': 0.2},
+                                              name=f"easydata-worker-{i}", daemon=True)
+            process.start()
+            self._workers.append(process)
+
+    def shutdown(self):
+        super().shutdown()
+        for process in self._workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._workers = []
+
+
+if __name__ == '__main__':
+    run_worker(sys.argv[1])
@@ -0,0 +1,727 @@
+"""
+Execution of the transformer edges of a DatasetGraph
+"""
+import concurrent.futures as cf
+import heapq
+from collections import Counter, defaultdict, deque
+from contextlib import nullcontext
+from itertools import islice
+
+from ..log import logger
+from . import metrics as _metrics, parallelism as _parallelism, profiling as _profiling, runlog as _runlog, tracing as _tracing
+from .metrics import Metrics, active_metrics
+from .parallelism import active_parallelism, thread_limits
+from .profiling import active_profiler
+from .runlog import active_runlog
+from .tracing import Tracer, active_tracer
+
+__all__ = [
+    'DAGExecutor',
+    'ExecutionPlan',
+    'estimate_memory',
+]
+
+# DatasetGraph instance used by process-pool workers (one per worker process)
+_worker_graph = None
+
+# Ratio of an edge's estimated peak memory to the size of its inputs and outputs (see `estimate_memory`)
+MEMORY_FACTOR = 2.0
+
+def _init_process_worker(graph_opts, runlog=None, trace=False, metrics=False, profiler=None, threads=None):
+    """Process-pool initializer: build a DatasetGraph in the worker process
+
+    If a RunLog is given, stages run in the worker are recorded to it.
+    If a Profiler is given, it profiles the transformers it selects in the worker.
+    If `trace` or `metrics` are True, spans or metrics are collected in the worker,
+    and returned with each result.
+    If `threads` is given, the worker's thread pools (and `n_jobs()`) are limited to it.
+    """
+    global _worker_graph
+    from .datasets import DatasetGraph
+    # Forked workers inherit the parent's collectors (and their contents); start afresh
+    for module in (_runlog, _tracing, _metrics, _profiling, _parallelism):
+        module._active.clear()
+    _runlog._observers.clear()
+    for collector in (runlog, profiler):
+        if collector is not None:
+            collector.activate()
+    if trace:
+        Tracer().activate()
+    if metrics:
+        Metrics().activate()
+    if threads is not None:
+        _parallelism._limit_threads(threads)
+    _worker_graph = DatasetGraph(**graph_opts)
+
+class _InlinePool:
+    """Minimal stand-in for a concurrent.futures Executor that runs tasks immediately"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, func, *args, **kwargs):
+        future = cf.Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as err:
+            future.set_exception(err)
+        return future
+
+class _Prefetcher:
+    """Loads on-disk Datasets in background threads, ahead of the edges that need them"""
+    def __init__(self, graph, dataset_path=None, max_workers=2):
+        self.graph = graph
+        self.dataset_path = graph._dataset_cache_path if dataset_path is None else dataset_path
+        self._pool = cf.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='DAGExecutor-prefetch')
+        self._futures = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._pool.shutdown(wait=True)
+        return False
+
+    def prefetch(self, ds_name):
+        """Start loading `ds_name` (unless it is already being loaded)"""
+        if ds_name not in self._futures:
+            logger.debug(f"DAGExecutor: prefetching '{ds_name}'")
+            self._futures[ds_name] = self._pool.submit(self.graph._load_input_elsewhere, ds_name, self.dataset_path)
+
+    def take(self, ds_names):
+        """Hand over the loads of `ds_names` that have been started: {dataset_name: Future}"""
+        return {name: self._futures.pop(name) for name in ds_names if name in self._futures}
+
+def _process_edge_in_worker(edge_name, dataset_entries, input_datasets, edge_kwargs):
+    """Process-pool task: process a single edge using the worker's DatasetGraph
+
+    dataset_entries: dict
+        Current Dataset catalog entries for the edge's inputs and outputs,
+        as known to the parent process
+    input_datasets: dict
+        In-memory input Datasets (e.g. ephemeral ones)
+
+    Returns
+    -------
+    (dsdict, telemetry), where telemetry is a dict of trace events and metrics
+    collected while processing the edge (see `DAGExecutor._merge_telemetry`)
+    """
+    _worker_graph._sync_datasets(dataset_entries)
+    try:
+        dsdict = _worker_graph.process_edge(edge_name, input_datasets=input_datasets, **edge_kwargs)
+    except Exception as err:
+        err.telemetry = _drain_telemetry()
+        raise
+    return dsdict, _drain_telemetry()
+
+def _drain_telemetry():
+    """Collect (and reset) the trace events and metrics recorded in this worker process"""
+    tracer, metrics = active_tracer(), active_metrics()
+    return {
+        'trace': [] if tracer is None else tracer.drain(),
+        'metrics': {} if metrics is None else metrics.drain(),
+    }
+
+
+def estimate_memory(graph, edges, factor=MEMORY_FACTOR):
+    """Estimate the peak memory needed to process each of a set of edges
+
+    An edge's estimate is the peak memory recorded when it was last processed
+    (see `DatasetGraph.edge_stats`). For edges without a recorded peak, it is
+    `factor` times the size of their inputs and outputs. Input sizes are their
+    current on-disk sizes or, for inputs produced by other edges in `edges`, the
+    output size recorded when their producer was last processed. Output sizes
+    are also taken from the recorded statistics, and assumed to match the
+    inputs if none are recorded.
+
+    Parameters
+    ----------
+    edges: iterable of edge names, in dependency order
+
+    Returns
+    -------
+    dict {edge_name: estimated peak memory, in bytes}
+    """
+    edges = list(edges)
+    edge_set = set(edges)
+    output_bytes = {}
+    estimates = {}
+    for edge in edges:
+        input_bytes = 0
+        for node in graph._edge_inputs[edge]:
+            producer = graph._producers.get(node)
+            if producer in edge_set and producer in output_bytes:
+                input_bytes += output_bytes[producer] / len(graph._edge_outputs[producer])
+            else:
+                input_bytes += graph._disk_usage(node)
+        stats = graph.edge_stats.get(edge, {})
+        recorded = stats.get('output_bytes')
+        output_bytes[edge] = input_bytes if recorded is None else recorded
+        if stats.get('peak_memory') is not None:
+            estimates[edge] = stats['peak_memory']
+        else:
+            estimates[edge] = int(factor * (input_bytes + output_bytes[edge]))
+    return estimates
+
+
+class ExecutionPlan:
+    """The edges of a DatasetGraph that must be processed to generate a set of datasets.
+
+    Edges are deduplicated, in dependency order (see `DatasetGraph.toposort`),
+    and each is annotated with the reasons it needs to run. Reasons are
+    (reason, dataset_name) tuples, where reason is one of:
+
+    'requested': the edge produces a requested dataset
+    'missing': an output needed downstream is not on disk
+    'hash mismatch': an output needed downstream is on disk, but its hashes don't match the catalog
+    'ephemeral': an output needed downstream is never written to disk, so must be regenerated
+    'forced': the edge was explicitly requested (e.g. `exhaustive=True`), even though its outputs are cached
+    or any other reason supplied via `force`.
+
+    An ExecutionPlan can be iterated over (yielding edge names), and passed to `DAGExecutor.run`.
+
+    Using the statistics recorded the last time each edge was processed
+    (`DatasetGraph.edge_stats`), a plan can also estimate its cost: the
+    `total_time()` of processing its edges one at a time, its `critical_path()`
+    (the chain of dependent edges that bounds any parallel run), and the
+    `estimated_time()` on a given number of workers. When run in parallel,
+    ready edges with the longest remaining path are started first.
+    Edges with no recorded statistics are assumed to cost the mean of those that have them.
+
+    The peak `memory` needed by each edge is also estimated (see `estimate_memory`),
+    for use by a `DAGExecutor` with a `memory_budget`.
+    """
+
+    def __init__(self, graph, targets, exhaustive=False, force=None):
+        """
+        Parameters
+        ----------
+        graph: DatasetGraph
+        targets: str or iterable of str
+            names of the datasets to generate
+        exhaustive: Boolean
+            if True, process every upstream edge, all the way to the sources,
+            even if its outputs are cached
+        force: dict {edge_name: reason}, iterable of edge names, or None
+            Additional edges that must be processed (with reason 'forced', if not given).
+            Their upstream dependencies are planned as for `targets`.
+        """
+        if isinstance(targets, str):
+            targets = [targets]
+        self.targets = list(dict.fromkeys(targets))
+        self.exhaustive = exhaustive
+        if force is None:
+            force = {}
+        elif not isinstance(force, dict):
+            force = {edge: 'forced' for edge in force}
+
+        self.reasons = defaultdict(list)
+        expanded = set()
+        queue = deque()
+
+        def add(edge, reason, ds_name):
+            if (reason, ds_name) not in self.reasons[edge]:
+                self.reasons[edge].append((reason, ds_name))
+            if edge not in expanded:
+                expanded.add(edge)
+                queue.append(edge)
+
+        for ds_name in self.targets:
+            add(graph.find_child(ds_name)[1], 'requested', ds_name)
+        for edge, reason in force.items():
+            add(edge, reason, None)
+
+        while queue:
+            edge = queue.popleft()
+            for ds_name in graph._edge_inputs[edge]:
+                state = graph.dataset_state(ds_name)
+                if state == 'cached':
+                    if not exhaustive:
+                        continue
+                    state = 'forced'
+                add(graph.find_child(ds_name)[1], state, ds_name)
+
+        self.edges = graph.toposort(self.reasons)
+        self.reasons = {edge: self.reasons[edge] for edge in self.edges}
+
+        self.upstream, self.downstream = DAGExecutor.dependencies(graph, self.edges)
+        self.recorded_costs = {edge: graph.edge_stats.get(edge, {}).get('wall_time')
+                               for edge in self.edges}
+        known = [cost for cost in self.recorded_costs.values() if cost is not None]
+        default_cost = sum(known) / len(known) if known else 0.0
+        self.costs = {edge: default_cost if cost is None else cost
+                      for edge, cost in self.recorded_costs.items()}
+        self.memory = estimate_memory(graph, self.edges)
+
+        # Length of the longest (most expensive) path from each edge to the end of the plan
+        self.priorities = {}
+        for edge in reversed(self.edges):
+            tail = max((self.priorities[child] for child in self.downstream[edge]), default=0.0)
+            self.priorities[edge] = self.costs[edge] + tail
+
+    def __iter__(self):
+        return iter(self.edges)
+
+    def __len__(self):
+        return len(self.edges)
+
+    def __contains__(self, edge):
+        return edge in self.reasons
+
+    def __repr__(self):
+        return f"ExecutionPlan(targets={self.targets}, edges={self.edges})"
+
+    def total_time(self):
+        """Estimated time (in seconds) to process every edge in the plan, one at a time"""
+        return sum(self.costs.values())
+
+    def critical_path(self):
+        """The most expensive chain of dependent edges in the plan
+
+        No parallel execution of the plan can take less time than this chain.
+
+        Returns
+        -------
+        (edges, seconds): the edges on the critical path (in order), and its estimated duration
+        """
+        if not self.edges:
+            return [], 0.0
+        edge = max((e for e in self.edges if not self.upstream[e]), key=self.priorities.get)
+        length = self.priorities[edge]
+        path = [edge]
+        while self.downstream[edge]:
+            edge = max(self.downstream[edge], key=self.priorities.get)
+            path.append(edge)
+        return path, length
+
+    def estimated_time(self, max_workers=1):
+        """Estimated time (in seconds) to process the plan using `max_workers` concurrent edges
+
+        This simulates the longest-path-first scheduling done by `DAGExecutor`.
+        """
+        pending = {edge: len(deps) for edge, deps in self.upstream.items()}
+        ready = [(-self.priorities[e], i, e) for i, e in enumerate(self.edges) if pending[e] == 0]
+        heapq.heapify(ready)
+        order = {edge: i for i, edge in enumerate(self.edges)}
+        running = []  # heap of (finish_time, edge)
+        now = 0.0
+        while ready or running:
+            while ready and len(running) < max_workers:
+                _, _, edge = heapq.heappop(ready)
+                heapq.heappush(running, (now + self.costs[edge], edge))
+            now, edge = heapq.heappop(running)
+            for child in self.downstream[edge]:
+                pending[child] -= 1
+                if pending[child] == 0:
+                    heapq.heappush(ready, (-self.priorities[child], order[child], child))
+        return now
+
+    def explain(self, max_workers=None):
+        """Describe the plan: which edges will be processed, in what order, why,
+        and (where statistics are available) how long it is expected to take
+
+        Parameters
+        ----------
+        max_workers: int or None
+            If given, also estimate the time needed with this many concurrent workers
+
+        Returns
+        -------
+        report (str)
+        """
+        lines = [f"Execution plan for {self.targets}: {len(self.edges)} edge(s)"]
+        width = max((len(edge) for edge in self.edges), default=0)
+        for i, edge in enumerate(self.edges, 1):
+            reasons = ", ".join(reason if ds_name is None else f"{reason} '{ds_name}'"
+                                for reason, ds_name in self.reasons[edge])
+            cost = self.recorded_costs[edge]
+            cost = "     ?  " if cost is None else f"{cost:>7.2f}s"
+            lines.append(f"{i:>4}. {edge:<{width}}  {cost}  {reasons}")
+        if self.edges:
+            unknown = sum(cost is None for cost in self.recorded_costs.values())
+            path, length = self.critical_path()
+            lines.append(f"Estimated time: {self.total_time():.2f}s serial, "
+                         f"{length:.2f}s critical path ({' -> '.join(path)})")
+            if max_workers is not None:
+                lines.append(f"Estimated time with {max_workers} workers: {self.estimated_time(max_workers):.2f}s")
+            if unknown:
+                lines.append(f"({unknown} edge(s) have no recorded statistics)")
+        return "\n".join(lines)
+
+
+class DAGExecutor:
+    """Run a set of DatasetGraph edges, executing independent edges concurrently.
+
+    Edges are scheduled as soon as all of the edges that produce their inputs
+    have completed. When more edges are ready than there are workers, and the
+    edges are given as an ExecutionPlan, those with the most expensive remaining
+    path (according to recorded edge statistics) are started first. With a
+    `memory_budget`, edges are only started while their estimated peak memory
+    fits. If an edge fails (raises an exception, or returns None),
+    only the edges downstream of it are cancelled; independent branches
+    continue to run.
+
+    Datasets produced during a run are handed to downstream edges in memory,
+    and released once every edge that uses them has finished. (A process pool
+    only hands over ephemeral Datasets this way; other inputs are read from disk.)
+    Inputs read from disk are loaded concurrently, and (for serial and thread
+    runs) prefetched in the background while earlier edges are processed.
+
+    Edges can also be distributed to workers on other machines, through a
+    `Coordinator` (see `src.data.distributed`). Distributed workers behave like
+    a process pool, reading and writing datasets on a shared filesystem.
+
+    The 'streaming' kind runs edges one at a time, but pipes chains of streaming
+    edges together (see `streaming_transformer` and `DatasetGraph.streaming_chains`),
+    so their intermediate datasets are never held in memory all at once.
+
+    After `run()`, the following attributes are set:
+
+    results_: dict {edge_name: dsdict}
+        outputs of every kept edge that completed successfully
+    completed_: set
+        edges that completed successfully
+    failed_: dict {edge_name: Exception or None}
+        edges that failed, and the exception they raised (if any)
+    cancelled_: set
+        edges that were not run because an upstream edge failed
+    """
+
+    def __init__(self, kind='thread', max_workers=None, coordinator=None, chunk_size=None, prefetch=1,
+                 memory_budget=None, exclusive_fraction=0.5):
+        """
+        Parameters
+        ----------
+        kind: {'serial', 'thread', 'process', 'distributed', 'streaming'}
+            Whether to run edges one at a time (in dependency order),
+            concurrently in a pool of threads or processes, on the workers of a `coordinator`,
+            or one at a time with chains of streaming edges piped together
+        max_workers: int or None
+            Maximum number of edges to run at once. Default: the threads in the active
+            `ParallelismBudget` (i.e. the number of CPUs), or for 'distributed', no limit
+            (workers take edges as they become free)
+        coordinator: Coordinator or None
+            Required for (and only used by) kind='distributed'
+        chunk_size: int or None
+            For kind='streaming': rows per chunk when splitting non-chunked inputs
+            of streaming edges. Default: `DEFAULT_CHUNK_SIZE`
+        prefetch: int
+            For kinds 'serial' and 'thread': when an edge starts, begin loading the on-disk
+            inputs of this many of the following edges (in plan order), so that loading
+            overlaps with processing. 0 disables prefetching.
+        memory_budget: int or None
+            If given, only start an edge while the estimated peak memory of the running edges
+            (see `estimate_memory`), including it, fits within this many bytes.
+            An edge is always started if nothing else is running.
+        exclusive_fraction: float
+            With a `memory_budget`: edges estimated to need more than this fraction of
+            the budget run on their own.
+        """
+        if kind not in ('serial', 'thread', 'process', 'distributed', 'streaming'):
+            raise ValueError(f"Unknown kind: {kind}")
+        if (kind == 'distributed') != (coordinator is not None):
+            raise ValueError("A coordinator is required for (and only used by) kind='distributed'")
+        if kind in ('serial', 'streaming'):
+            max_workers = 1
+        elif max_workers is None and kind != 'distributed':
+            max_workers = active_parallelism().threads
+        self.kind = kind
+        self.max_workers = max_workers
+        self.coordinator = coordinator
+        self.chunk_size = chunk_size
+        self.prefetch = prefetch
+        self.memory_budget = memory_budget
+        self.exclusive_fraction = exclusive_fraction
+
+    @property
+    def _in_workers(self):
+        """True if edges are run by separate worker processes, with their own DatasetGraph"""
+        return self.kind in ('process', 'distributed')
+
+    @staticmethod
+    def _worker_context(graph, threads=None):
+        """Arguments for `_init_process_worker`: how to build `graph`, which collectors to use,
+        and how many threads to allow, in a worker"""
+        return (graph._constructor_opts(), active_runlog(), active_tracer() is not None,
+                active_metrics() is not None, active_profiler(), threads)
+
+    def _threads_per_edge(self, n_edges):
+        """Each concurrently running edge's share of the active ParallelismBudget"""
+        n_workers = self.max_workers or getattr(self.coordinator, 'n_workers', None) or 1
+        return active_parallelism().share(min(n_workers, max(n_edges, 1)))
+
+    def _pool(self, graph, threads=None):
+        if self.kind == 'serial':
+            return _InlinePool()
+        if self.kind == 'thread':
+            return cf.ThreadPoolExecutor(max_workers=self.max_workers,
+                                         thread_name_prefix='DAGExecutor')
+        if self.kind == 'distributed':
+            return self.coordinator.pool(self._worker_context(graph, threads))
+        return cf.ProcessPoolExecutor(max_workers=self.max_workers,
+                                      initializer=_init_process_worker,
+                                      initargs=self._worker_context(graph, threads))
+
+    def _submit(self, pool, graph, edge_name, edge_kwargs, available, prefetcher=None):
+        inputs = graph._edge_inputs[edge_name]
+        if self.kind in ('serial', 'thread'):
+            input_datasets = {n: available[n] for n in inputs if n in available}
+            prefetched = None if prefetcher is None else prefetcher.take(inputs)
+            return pool.submit(graph.process_edge, edge_name, input_datasets=input_datasets,
+                               prefetched=prefetched, **edge_kwargs)
+        input_datasets = {n: available[n] for n in inputs if n in available and graph.is_ephemeral(n)}
+        nodes = inputs + graph._edge_outputs[edge_name]
+        entries = {n: graph.datasets[n] for n in nodes if n in graph.datasets}
+        return pool.submit(_process_edge_in_worker, edge_name, entries, input_datasets, edge_kwargs)
+
+    @staticmethod
+    def _merge_telemetry(telemetry):
+        """Add trace events and metrics collected by a worker process to the active Tracer and Metrics"""
+        if not telemetry:
+            return
+        tracer, metrics = active_tracer(), active_metrics()
+        if tracer is not None and telemetry['trace']:
+            tracer.extend(telemetry['trace'])
+        if metrics is not None and telemetry['metrics']:
+            metrics.merge(telemetry['metrics'])
+
+    @staticmethod
+    def dependencies(graph, edges):
+        """Compute the dependencies between a set of edges
+
+        Only dependencies within `edges` are considered.
+
+        Returns
+        -------
+        (upstream, downstream) where
+            upstream: dict {edge: set(edge)}
+                edges that must complete before each edge can run
+            downstream: dict {edge: set(edge)}
+                edges that depend on each edge
+        """
+        edge_set = set(edges)
+        upstream = {}
+        downstream = defaultdict(set)
+        for edge in edges:
+            deps = set()
+            for node in graph._edge_inputs[edge]:
+                producer = graph._producers.get(node)
+                if producer in edge_set and producer != edge:
+                    deps.add(producer)
+            upstream[edge] = deps
+            for dep in deps:
+                downstream[dep].add(edge)
+        return upstream, downstream
+
+    def _cancel_downstream(self, edge, downstream):
+        """Cancel all edges downstream of `edge`, returning the newly cancelled ones"""
+        cancelled = []
+        stack = list(downstream[edge])
+        while stack:
+            child = stack.pop()
+            if child not in self.cancelled_:
+                logger.warning(f"Cancelling edge '{child}': upstream edge '{edge}' failed")
+                self.cancelled_.add(child)
+                cancelled.append(child)
+                stack.extend(downstream[child])
+        return cancelled
+
+    def run(self, graph, edges, keep=None, journal=None, **edge_kwargs):
+        """Process the given edges of `graph`, respecting their dependencies
+
+        Parameters
+        ----------
+        graph: DatasetGraph
+        edges: iterable of edge names (e.g. an ExecutionPlan)
+            Duplicates are ignored.
+        keep: iterable of edge names, or None
+            Edges whose outputs should be returned. If None, keep the outputs of every edge.
+            Outputs of other edges are released as soon as they are no longer needed.
+        journal: RunJournal or None
+            If given, each edge is recorded in it as it completes
+        **edge_kwargs:
+            Passed to `DatasetGraph.process_edge`
+
+        Returns
+        -------
+        dict {edge_name: dsdict} of successfully processed (kept) edges
+        """
+        if self.kind == 'streaming':
+            with thread_limits(active_parallelism().threads):
+                return self._run_streaming(graph, edges, keep=keep, journal=journal, **edge_kwargs)
+        priorities = getattr(edges, 'priorities', {})
+        memory = getattr(edges, 'memory', None)
+        edges = list(dict.fromkeys(edges))
+        if self.memory_budget is not None and memory is None:
+            memory = estimate_memory(graph, edges)
+        order = {edge: i for i, edge in enumerate(edges)}
+        if keep is not None:
+            keep = set(keep)
+        upstream, downstream = self.dependencies(graph, edges)
+        pending = {edge: len(deps) for edge, deps in upstream.items()}
+        self.results_ = {}
+        self.completed_ = set()
+        self.failed_ = {}
+        self.cancelled_ = set()
+
+        # Datasets produced in this run, and how many edges still need them
+        available = {}
+        consumers_left = Counter()
+        for edge in edges:
+            for node in graph._edge_inputs[edge]:
+                if graph._producers.get(node) in upstream[edge]:
+                    consumers_left[node] += 1
+
+        def release_inputs(edge):
+            for node in graph._edge_inputs[edge]:
+                if consumers_left[node] > 0:
+                    consumers_left[node] -= 1
+                    if consumers_left[node] == 0:
+                        available.pop(node, None)
+
+        logger.debug(f"DAGExecutor: running {len(edges)} edges using {self.max_workers or 'all'} {self.kind} workers")
+        # Ready edges, most expensive remaining path first (see ExecutionPlan)
+        ready = [(-priorities.get(edge, 0), order[edge], edge) for edge in edges if pending[edge] == 0]
+        heapq.heapify(ready)
+
+        # Edges in this process share its thread pools; workers limit their own (see `_init_process_worker`)
+        threads = self._threads_per_edge(len(edges))
+        prefetcher = None
+        if self.prefetch and self.kind in ('serial', 'thread'):
+            # prefetching loads the inputs of upcoming edges, within an edge's share of the budget
+            prefetcher = _Prefetcher(graph, edge_kwargs.get('dataset_path'), max_workers=threads)
+        started = set()
+        upcoming = deque(edges)
+
+        def prefetch_upcoming():
+            """Start loading the on-disk inputs of the next edges (in plan order)"""
+            while upcoming and (upcoming[0] in started or upcoming[0] in self.cancelled_):
+                upcoming.popleft()
+            pending_edges = (e for e in upcoming if e not in started and e not in self.cancelled_)
+            for edge in islice(pending_edges, self.prefetch):
+                for node in graph._edge_inputs[edge]:
+                    # outputs of this run are handed over in memory
+                    if graph._producers.get(node) not in upstream[edge] and graph.is_cached(node):
+                        prefetcher.prefetch(node)
+
+        limits = nullcontext() if self._in_workers else thread_limits(threads)
+        with self._pool(graph, threads) as pool, (prefetcher or nullcontext()), limits:
+            running = {}
+
+            def admit(edge):
+                """Can `edge` start now, within the memory budget?"""
+                if self.memory_budget is None or not running:
+                    return True
+                exclusive = self.exclusive_fraction * self.memory_budget
+                if memory[edge] > exclusive or any(memory[e] > exclusive for e in running.values()):
+                    return False
+                return sum(memory[e] for e in running.values()) + memory[edge] <= self.memory_budget
+
+            def submit_ready():
+                while ready and (self.max_workers is None or len(running) < self.max_workers):
+                    edge = ready[0][2]
+                    if edge not in self.cancelled_ and not admit(edge):
+                        logger.debug(f"DAGExecutor: '{edge}' is waiting for memory ({memory[edge]} bytes estimated)")
+                        break
+                    heapq.heappop(ready)
+                    if edge not in self.cancelled_:
+                        started.add(edge)
+                        if prefetcher is not None:
+                            prefetch_upcoming()
+                        running[self._submit(pool, graph, edge, edge_kwargs, available, prefetcher)] = edge
+
+            submit_ready()
+            while running:
+                done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+                for future in done:
+                    edge = running.pop(future)
+                    release_inputs(edge)
+                    try:
+                        dsdict = future.result()
+                        if self._in_workers:
+                            dsdict, telemetry = dsdict
+                            self._merge_telemetry(telemetry)
+                    except Exception as err:
+                        if self._in_workers:
+                            self._merge_telemetry(getattr(err, 'telemetry', None))
+                        logger.error(f"Edge '{edge}' failed: {err!r}")
+                        self.failed_[edge] = err
+                        dsdict = None
+                    if dsdict is None:
+                        self.failed_.setdefault(edge, None)
+                        for cancelled in self._cancel_downstream(edge, downstream):
+                            release_inputs(cancelled)
+                        continue
+                    self.completed_.add(edge)
+                    if journal is not None:
+                        journal.record(edge, dsdict)
+                    if keep is None or edge in keep:
+                        self.results_[edge] = dsdict
+                    for name, ds in dsdict.items():
+                        if consumers_left[name] > 0:
+                            available[name] = ds
+                    if self._in_workers and edge_kwargs.get('overwrite_catalog', False):
+                        graph._sync_datasets({name: ds.metadata for name, ds in dsdict.items()})
+                    for child in downstream[edge]:
+                        pending[child] -= 1
+                        if pending[child] == 0 and child not in self.cancelled_:
+                            heapq.heappush(ready, (-priorities.get(child, 0), order[child], child))
+                submit_ready()
+
+        unscheduled = set(edges) - self.completed_ - self.failed_.keys() - self.cancelled_
+        if unscheduled:
+            logger.error(f"Edges {sorted(unscheduled)} were never scheduled. Is there a cycle in the graph?")
+        return self.results_
+
+    def _run_streaming(self, graph, edges, keep=None, journal=None, **edge_kwargs):
+        """`run` for kind='streaming': process edges in order, piping chains of streaming edges together"""
+        edges = list(dict.fromkeys(edges))
+        if keep is not None:
+            keep = set(keep)
+        upstream, downstream = self.dependencies(graph, edges)
+        self.results_ = {}
+        self.completed_ = set()
+        self.failed_ = {}
+        self.cancelled_ = set()
+
+        # Datasets produced in this run that were not written to disk (e.g. ephemeral ones)
+        available = {}
+        chains = graph.streaming_chains(edges, keep=keep)
+        logger.debug(f"DAGExecutor: running {len(edges)} edges as {len(chains)} chains")
+        for chain in chains:
+            head, tail = chain[0], chain[-1]
+            if head in self.cancelled_:
+                continue
+            input_datasets = {n: available[n] for n in graph._edge_inputs[head] if n in available}
+            try:
+                if graph.is_streaming(head):
+                    materialize = keep is None or tail in keep
+                    # each edge along the chain is journalled as its outputs are committed
+                    dsdict = graph.process_chain(chain, input_datasets=input_datasets, chunk_size=self.chunk_size,
+                                                 materialize=materialize,
+                                                 on_commit=None if journal is None else journal.record, **edge_kwargs)
+                else:
+                    dsdict = graph.process_edge(head, input_datasets=input_datasets, **edge_kwargs)
+            except Exception as err:
+                logger.error(f"Edge '{head}' failed: {err!r}")
+                self.failed_[head] = err
+                dsdict = None
+            if dsdict is None:
+                self.failed_.setdefault(head, None)
+                self._cancel_downstream(head, downstream)
+                continue
+            self.completed_.update(chain)
+            if journal is not None and not graph.is_streaming(head):
+                journal.record(tail, dsdict)
+            if keep is None or tail in keep:
+                self.results_[tail] = dsdict
+            write_dataset = edge_kwargs.get('write_dataset', True)
+            for name, ds in dsdict.items():
+                if graph.is_ephemeral(name) or not write_dataset:
+                    available[name] = ds
+        return self.results_
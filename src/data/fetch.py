@@ -17,6 +17,8 @@ from tqdm.auto import tqdm
 
 from .. import paths
 from ..log import logger
+from .runlog import count_bytes, instrumented
+from .tracing import traced
 
 __all__ = [
     'available_hashes',
@@ -115,6 +117,7 @@ def hash_object(obj, hash_type="sha1"):
     data_hash = joblib.hash(obj, hash_name=hash_type).hexdigest()
     return f"{hash_type}:{data_hash}"
 
+@instrumented('hash_file', lambda fname, *args, **kwargs: pathlib.Path(fname).name)
 def hash_file(fname, algorithm="sha1", block_size=4096):
     '''Compute the hash of an on-disk file
 
@@ -138,6 +141,7 @@ def hash_file(fname, algorithm="sha1", block_size=4096):
             hashval.update(chunk)
     return f"{algorithm}:{hashval.hexdigest()}"
 
+@traced('download', lambda url, *args, **kwargs: f"download: {url}")
 def tqdm_download(url, url_options=None, filename=None,
                   download_path=None,chunk_size=1024):
     """Download a URL via requests, displaying a tqdm status bar
@@ -187,6 +191,7 @@ def tqdm_download(url, url_options=None, filename=None,
         for data in resp.iter_content(chunk_size=chunk_size):
             size = file.write(data)
             bar.update(size)
+            count_bytes(written=size)
     resp.raise_for_status()
 
     return filename
@@ -291,6 +296,7 @@ def infer_filename(url=None, file_name=None, source_file=None, **kwargs):
     return file_name
 
 
+@traced('fetch_file', lambda *args, **kwargs: f"fetch_file: {kwargs.get('file_name') or kwargs.get('url')}")
 def fetch_file(url=None, url_options=None, contents=None,
                file_name=None, dst_dir=None,
                force=False, source_file=None,
@@ -458,6 +464,7 @@ def fetch_file(url=None, url_options=None, contents=None,
             gdown.download(url_google_drive, str(raw_data_file), quiet=False)
         except Exception as err:
             return False, err, None
+        count_bytes(written=raw_data_file.stat().st_size)
         raw_file_hash = hash_file(raw_data_file, algorithm=hash_type)
         return True, raw_data_file, raw_file_hash
     elif fetch_action == 'create':
@@ -467,6 +474,7 @@ def fetch_file(url=None, url_options=None, contents=None,
             logger.debug(f"Hash value ({hash_value}) ignored for fetch_action=='create'")
         with open(raw_data_file, 'w') as fw:
             fw.write(contents)
+        count_bytes(written=raw_data_file.stat().st_size)
         logger.debug(f"Generating {file_name} hash...")
         raw_file_hash = hash_file(raw_data_file, algorithm=hash_type)
         return True, raw_data_file, raw_file_hash
@@ -475,6 +483,7 @@ def fetch_file(url=None, url_options=None, contents=None,
             raise Exception("fetch_action == 'copy' but `copy` unspecified")
         logger.warning(f"Hardcoded paths for fetch_action == 'copy' may not be reproducible. Consider using fetch_action='message' instead")
         shutil.copyfile(source_file, raw_data_file)
+        count_bytes(read=raw_data_file.stat().st_size, written=raw_data_file.stat().st_size)
         logger.debug(f"Checking hash of {file_name}...")
         raw_file_hash = hash_file(raw_data_file, algorithm=hash_type)
         source_file = pathlib.Path(source_file)
@@ -491,6 +500,7 @@ def fetch_file(url=None, url_options=None, contents=None,
     logger.debug(f'Retrieved {raw_data_file.name} ({hash_type}:{raw_file_hash})')
     return results.status_code, raw_data_file, raw_file_hash
 
+@traced('unpack', lambda filename, *args, **kwargs: f"unpack: {filename}")
 def unpack(filename, dst_dir=None, src_dir=None, create_dst=True, unpack_action=None):
     '''Unpack a compressed file
 
@@ -578,15 +588,21 @@ def unpack(filename, dst_dir=None, src_dir=None, create_dst=True, unpack_action=
     else:
         raise Exception(f"Unknown unpack_action: {unpack_action}")
 
+    count_bytes(read=os.path.getsize(path))
     with opener(path, mode) as f_in:
         if archive:
             logger.debug(f"Extracting {filename.name}...")
             f_in.extractall(path=dst_dir)
+            if unpack_action == 'zip':
+                count_bytes(written=sum(info.file_size for info in f_in.infolist()))
+            else:
+                count_bytes(written=sum(member.size for member in f_in.getmembers() if member.isfile()))
         else:
             outfile = pathlib.Path(outfile).name
             logger.debug(f"{verb} {outfile}...")
             with open(pathlib.Path(dst_dir) / outfile, outmode) as f_out:
                 shutil.copyfileobj(f_in, f_out)
+                count_bytes(written=f_out.tell())
 
 def get_dataset_filename(ds_dict):
     """Figure out the downloaded filename for a dataset entry
@@ -0,0 +1,352 @@
+"""
+Size-budgeted garbage collection of raw, interim, and processed data
+"""
+import os
+import pathlib
+import shutil
+import sys
+import time
+from collections import defaultdict
+
+import joblib
+
+from .. import paths
+from ..log import logger
+from ..utils import load_json, save_json
+from .catalog import Catalog
+from .datasets import DataSource
+from .journal import RunJournal
+
+__all__ = [
+    'GarbageCollector',
+]
+
+_UNITS = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+
+
+def _parse_size(size):
+    """Convert a size such as 500000, '200M' or '10GB' to bytes"""
+    if size is None or isinstance(size, (int, float)):
+        return size
+    text = str(size).strip().upper().rstrip('B').rstrip('I')
+    unit = text[-1] if text and text[-1] in _UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * _UNITS[unit])
+
+
+def _format_size(n_bytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n_bytes) < 1024:
+            return f"{n_bytes:.1f} {unit}" if unit != 'B' else f"{n_bytes} B"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f} TB"
+
+
+class GarbageCollector:
+    """Keep the data directories within a size budget, by evicting cold artifacts.
+
+    The data directories (by default: raw, interim, processed, and the build
+    cache) are divided into artifacts: each top-level file or directory, except
+    that a processed Dataset's `.metadata` and `.dataset` files form a single
+    artifact, as does each build cache entry.
+
+    An artifact is *referenced* if the current catalogs use it:
+
+    * processed Datasets whose on-disk hashes match the Dataset catalog
+    * raw files listed in (the file_dict of) a DataSource in the DataSource catalog
+    * unpacked DataSources in the interim directory (`interim/<datasource_name>`)
+
+    Anything else (stale Dataset versions, unpacked archives of removed
+    DataSources, executed notebooks, old build cache entries, ...) is unreferenced.
+
+    When collecting, unreferenced artifacts are evicted first, least recently used
+    first, until the total size is within the budget. Referenced artifacts are only
+    evicted if `evict_referenced=True`. Artifacts used within the last `min_age`
+    seconds are never evicted.
+
+    Collecting also removes the run journals of abandoned runs (see `RunJournal.expire`).
+
+    Disk usage is accounted incrementally: the size of every scanned directory is
+    remembered (in `index_path`), and a directory is only re-read if its
+    modification time has changed. Files rewritten in place (which doesn't change
+    their directory's modification time) are only re-measured by a `full` scan.
+    """
+
+    def __init__(self, budget=None, roots=None, catalog_path=None, index_path=None,
+                 min_age=3600, dataset_path='datasets', datasource_path='datasources'):
+        """
+        Parameters
+        ----------
+        budget: int, str, or None
+            Maximum total size of the data directories, in bytes, or as a string like '50G'.
+            None: no budget (collect only reports usage)
+        roots: dict {label: path} or None
+            Directories to manage. Default: raw, interim and processed data paths,
+            and the build cache (EASYDATA_BUILD_CACHE, or `paths['cache_path']/build`)
+        catalog_path: path or None
+            Location of the Dataset and DataSource catalogs. Default: `paths['catalog_path']`
+        index_path: path or None
+            Where to store the disk usage index. Default: `paths['interim_data_path']/.gc_index.json`
+        min_age: float
+            Artifacts used (read or modified) more recently than this many seconds ago are kept
+        dataset_path, datasource_path: str
+            names of the Dataset and DataSource catalogs, relative to `catalog_path`
+        """
+        if roots is None:
+            roots = {
+                'raw': paths['raw_data_path'],
+                'interim': paths['interim_data_path'],
+                'processed': paths['processed_data_path'],
+                'build_cache': os.environ.get('EASYDATA_BUILD_CACHE') or paths['cache_path'] / 'build',
+            }
+        self.roots = {label: pathlib.Path(path) for label, path in roots.items()}
+        self.budget = _parse_size(budget)
+        self.catalog_path = catalog_path
+        if index_path is None:
+            index_path = paths['interim_data_path'] / '.gc_index.json'
+        self.index_path = pathlib.Path(index_path)
+        self.min_age = min_age
+        self.dataset_path = dataset_path
+        self.datasource_path = datasource_path
+
+    def __repr__(self):
+        budget = None if self.budget is None else _format_size(self.budget)
+        return f"GarbageCollector(budget={budget}, roots={sorted(self.roots)})"
+
+    def _load_catalog(self, name):
+        try:
+            return Catalog.load(name, catalog_path=self.catalog_path, create=False)
+        except FileNotFoundError:
+            return {}
+
+    def referenced(self):
+        """The set of paths that the current catalogs reference (see class docstring)"""
+        refs = set()
+        processed = self.roots.get('processed')
+        if processed is not None:
+            for ds_name, entry in self._load_catalog(self.dataset_path).items():
+                catalog_hashes = entry.get('hashes')
+                metadata_fq = processed / f'{ds_name}.metadata'
+                if not catalog_hashes or not metadata_fq.exists():
+                    continue
+                try:
+                    on_disk = joblib.load(metadata_fq).get('hashes', {})
+                except Exception as err:
+                    logger.debug(f"Unable to read {metadata_fq}: {err!r}")
+                    continue
+                if catalog_hashes.items() <= on_disk.items():
+                    refs.add(processed / ds_name)
+        for dsrc_name, entry in self._load_catalog(self.datasource_path).items():
+            try:
+                dsrc = DataSource.from_dict(entry)
+            except Exception as err:
+                logger.debug(f"Unable to load DataSource '{dsrc_name}': {err!r}")
+                continue
+            for filename in dsrc.file_dict:
+                refs.add(dsrc.download_dir_fq / filename)
+            if 'interim' in self.roots:
+                refs.add(self.roots['interim'] / dsrc_name)
+        return refs
+
+    def _tree_usage(self, path, index, seen):
+        """(size, last_used) of a directory tree, reusing the indexed totals of unchanged directories"""
+        st = os.stat(path)
+        key = str(path)
+        seen.add(key)
+        entry = index.get(key)
+        if entry is None or entry['mtime_ns'] != st.st_mtime_ns:
+            size, last_used, subdirs = 0, 0.0, []
+            with os.scandir(path) as children:
+                for child in children:
+                    if child.is_dir(follow_symlinks=False):
+                        subdirs.append(child.name)
+                    else:
+                        child_st = child.stat(follow_symlinks=False)
+                        size += child_st.st_size
+                        last_used = max(last_used, child_st.st_atime, child_st.st_mtime)
+            entry = {'mtime_ns': st.st_mtime_ns, 'size': size, 'last_used': last_used, 'subdirs': subdirs}
+            index[key] = entry
+        size = entry['size']
+        # not the directory's atime: listing it (e.g. by this scan) counts as an access
+        last_used = max(entry['last_used'], st.st_mtime)
+        for subdir in entry['subdirs']:
+            try:
+                sub_size, sub_used = self._tree_usage(path / subdir, index, seen)
+            except FileNotFoundError:
+                continue
+            size += sub_size
+            last_used = max(last_used, sub_used)
+        return size, last_used
+
+    def _load_index(self, full):
+        if full or not self.index_path.exists():
+            return {}
+        try:
+            return load_json(self.index_path).get('dirs', {})
+        except (OSError, ValueError) as err:
+            logger.warning(f"Ignoring unreadable disk usage index {self.index_path}: {err!r}")
+            return {}
+
+    def scan(self, full=False):
+        """Measure the artifacts in the managed directories
+
+        Parameters
+        ----------
+        full: Boolean
+            if True, ignore the disk usage index and re-read every directory
+
+        Returns
+        -------
+        list of dicts, with keys:
+            root: label of the directory containing the artifact
+            path: pathlib.Path of the artifact (for processed Datasets, without the file suffix)
+            files: list of the files or directories that make up the artifact
+            size: total size in bytes
+            last_used: time of the most recent access or modification
+            referenced: True if a current catalog uses the artifact
+        """
+        index = self._load_index(full)
+        seen = set()
+        refs = self.referenced()
+        other_roots = [root.resolve() for root in self.roots.values()]
+        artifacts = []
+        for label, root in self.roots.items():
+            if not root.is_dir():
+                continue
+            grouped = defaultdict(list)
+            for child_path in self._artifact_paths(root, other_roots):
+                stem = child_path.with_suffix('') if label == 'processed' else child_path
+                grouped[stem].append(child_path)
+            for stem, members in grouped.items():
+                size, last_used = 0, 0.0
+                for member in members:
+                    try:
+                        if member.is_dir() and not member.is_symlink():
+                            member_size, member_used = self._tree_usage(member, index, seen)
+                        else:
+                            st = member.stat()
+                            member_size, member_used = st.st_size, max(st.st_atime, st.st_mtime)
+                    except FileNotFoundError:
+                        continue
+                    size += member_size
+                    last_used = max(last_used, member_used)
+                referenced = any(member == ref or member in ref.parents or ref in member.parents
+                                 for member in [stem, *members] for ref in refs)
+                artifacts.append({'root': label, 'path': stem, 'files': sorted(members), 'size': size,
+                                  'last_used': last_used, 'referenced': referenced})
+        try:
+            save_json(self.index_path, {'dirs': {key: value for key, value in index.items() if key in seen}})
+        except OSError as err:
+            logger.warning(f"Unable to save disk usage index {self.index_path}: {err!r}")
+        return artifacts
+
+    def _artifact_paths(self, directory, other_roots):
+        """The children of `directory` that are artifacts
+
+        Other managed roots are left out. Directories containing another root
+        (e.g. `interim/cache`, holding the build cache) are descended into,
+        so only the nested root itself is left out.
+        """
+        with os.scandir(directory) as children:
+            for child in children:
+                if child.name.startswith('.'):
+                    continue  # indexes, in-progress writes
+                child_path = pathlib.Path(child.path)
+                resolved = child_path.resolve()
+                if resolved in other_roots:
+                    continue  # managed as a root of its own
+                if child.is_dir() and any(resolved in other.parents for other in other_roots):
+                    yield from self._artifact_paths(child_path, other_roots)
+                else:
+                    yield child_path
+
+    def _is_hot(self, artifact, now):
+        return now - artifact['last_used'] < self.min_age
+
+    def eviction_order(self, artifacts, evict_referenced=False):
+        """Artifacts that may be evicted, in the order they would be: unreferenced
+        before referenced (if `evict_referenced`), least recently used first"""
+        now = time.time()
+        candidates = [a for a in artifacts
+                      if not self._is_hot(a, now) and (evict_referenced or not a['referenced'])]
+        return sorted(candidates, key=lambda a: (a['referenced'], a['last_used']))
+
+    def reclaimable(self, artifacts=None):
+        """Total size (in bytes) of the unreferenced artifacts that are not in use"""
+        if artifacts is None:
+            artifacts = self.scan()
+        return sum(artifact['size'] for artifact in self.eviction_order(artifacts))
+
+    def report(self, artifacts=None):
+        """Describe disk usage per directory, and how much space could be reclaimed
+
+        Returns
+        -------
+        report (str)
+        """
+        if artifacts is None:
+            artifacts = self.scan()
+        total = sum(artifact['size'] for artifact in artifacts)
+        budget = "" if self.budget is None else f" (budget {_format_size(self.budget)})"
+        lines = [f"Data usage: {_format_size(total)}{budget}"]
+        for label in self.roots:
+            in_root = [a for a in artifacts if a['root'] == label]
+            unreferenced = [a for a in in_root if not a['referenced']]
+            lines.append(f"  {label}: {_format_size(sum(a['size'] for a in in_root))} in {len(in_root)} artifact(s), "
+                         f"{len(unreferenced)} unreferenced ({_format_size(sum(a['size'] for a in unreferenced))})")
+        candidates = self.eviction_order(artifacts)
+        lines.append(f"Reclaimable: {_format_size(sum(a['size'] for a in candidates))} "
+                     f"in {len(candidates)} unreferenced artifact(s) unused for {self.min_age:g}s")
+        return "\n".join(lines)
+
+    def collect(self, budget=None, evict_referenced=False, dry_run=False):
+        """Evict artifacts until the data directories are within budget
+
+        Parameters
+        ----------
+        budget: int, str, or None
+            Size budget (see `__init__`). Default: this collector's `budget`
+        evict_referenced: Boolean
+            if True, referenced artifacts may also be evicted (after all unreferenced ones);
+            processed Datasets can be regenerated, and raw files fetched again
+        dry_run: Boolean
+            if True, only report what would be evicted
+
+        Returns
+        -------
+        list of the evicted artifacts (see `scan`)
+        """
+        budget = self.budget if budget is None else _parse_size(budget)
+        if not dry_run and 'processed' in self.roots:
+            RunJournal.expire(self.roots['processed'] / '.journals')
+        artifacts = self.scan()
+        total = sum(artifact['size'] for artifact in artifacts)
+        if budget is None or total <= budget:
+            logger.debug(f"Data usage {_format_size(total)} is within budget")
+            return []
+        evicted = []
+        for artifact in self.eviction_order(artifacts, evict_referenced=evict_referenced):
+            if total <= budget:
+                break
+            if not dry_run:
+                for member in artifact['files']:
+                    try:
+                        if member.is_dir() and not member.is_symlink():
+                            shutil.rmtree(member)
+                        else:
+                            member.unlink()
+                    except FileNotFoundError:
+                        pass
+            logger.info(f"{'Would evict' if dry_run else 'Evicted'} {artifact['path']} "
+                        f"({_format_size(artifact['size'])}{', referenced' if artifact['referenced'] else ''})")
+            total -= artifact['size']
+            evicted.append(artifact)
+        if total > budget:
+            logger.warning(f"Data usage {_format_size(total)} still exceeds budget {_format_size(budget)}; "
+                           "remaining artifacts are referenced or in use")
+        return evicted
+
+
+if __name__ == '__main__':
+    collector = GarbageCollector(budget=sys.argv[1] if len(sys.argv) > 1 else None)
+    collector.collect()
+    print(collector.report())
@@ -0,0 +1,189 @@
+"""
+Run journals: checkpoints of DatasetGraph.generate runs, so interrupted runs can be resumed
+"""
+import pathlib
+import shutil
+import time
+from functools import partial
+
+import joblib
+
+from ..log import logger
+from ..utils import load_json, save_json
+from .catalog import Catalog
+
+__all__ = [
+    'RunJournal',
+]
+
+# Journals of runs not resumed within this many seconds are removed (see `RunJournal.expire`)
+JOURNAL_MAX_AGE = 7 * 24 * 3600
+
+
+class RunJournal:
+    """Checkpoint of a `DatasetGraph.generate` (or `generate_many`) run.
+
+    When a run starts, its plan (the edges to be processed, in order) is
+    recorded, and as each edge completes, the hashes of its outputs are added.
+    If the run is interrupted, `generate(..., resume=True)` continues from the
+    journal: completed edges are skipped without re-planning or re-verifying
+    them (other than checking their outputs are still on disk), as are any
+    upstream edges that only they needed. A journal is removed once its run succeeds.
+
+    Only edges whose outputs are all written to disk are recorded; edges with
+    ephemeral outputs are always re-run.
+
+    Journals are kept in `<dataset_cache_path>/.journals/<run key>/`, where
+    the run key is derived from the requested datasets and the run options.
+    The plan is in `plan.json`; completed edges are a Catalog (`completed/`).
+    Journals of runs that are never resumed are removed once they have been
+    inactive for `JOURNAL_MAX_AGE` (when another run starts, or by `GarbageCollector`).
+    """
+
+    def __init__(self, graph, path):
+        """
+        Parameters
+        ----------
+        graph: DatasetGraph
+        path: path
+            directory holding the journal
+        """
+        self.graph = graph
+        self.path = pathlib.Path(path)
+        self._completed = None
+
+    @classmethod
+    def for_run(cls, graph, targets, **options):
+        """The journal of a run of `graph` generating `targets`, with the given options"""
+        key = joblib.hash([sorted(targets), sorted(options.items())])
+        return cls(graph, graph._dataset_cache_path / '.journals' / key)
+
+    def __repr__(self):
+        return f"RunJournal('{self.path}')"
+
+    @property
+    def completed(self):
+        """Catalog of completed edges: {edge_name: {'outputs': {dataset_name: hashes}}}"""
+        if self._completed is None:
+            self._completed = Catalog('completed', catalog_path=self.path)
+        return self._completed
+
+    def exists(self):
+        """Is there a journal of an earlier (unfinished) run?"""
+        return (self.path / 'plan.json').exists()
+
+    def _transformations_hash(self, edges):
+        return joblib.hash([self.graph.transformers[edge].get('transformations', []) for edge in edges])
+
+    def last_active(self):
+        """When the journal was last written to (as a timestamp), or None if it doesn't exist"""
+        times = [path.stat().st_mtime for path in (self.path, self.path / 'plan.json', self.path / 'completed')
+                 if path.exists()]
+        return max(times, default=None)
+
+    @classmethod
+    def expire(cls, journals_path, max_age=JOURNAL_MAX_AGE, keep=None):
+        """Remove the journals in `journals_path` that have been inactive for more than `max_age` seconds
+
+        Parameters
+        ----------
+        keep: path or None
+            journal to leave alone
+
+        Returns
+        -------
+        list of the removed journal directories
+        """
+        journals_path = pathlib.Path(journals_path)
+        if not journals_path.is_dir():
+            return []
+        now = time.time()
+        expired = []
+        for path in journals_path.iterdir():
+            if not path.is_dir() or (keep is not None and path == pathlib.Path(keep)):
+                continue
+            journal = cls(None, path)
+            last_active = journal.last_active()
+            if last_active is not None and now - last_active > max_age:
+                logger.info(f"Removing {journal}, inactive since {time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(last_active))}")
+                journal.discard()
+                expired.append(path)
+        return expired
+
+    def start(self, edges, targets=()):
+        """Begin a new journal (replacing any earlier one) for a run of `edges`
+
+        Abandoned journals of other runs are expired (see `expire`)
+        """
+        edges = list(edges)
+        self.expire(self.path.parent, keep=self.path)
+        self.discard()
+        self.path.mkdir(parents=True)
+        save_json(self.path / 'plan.json', {
+            'targets': list(targets),
+            'edges': edges,
+            'transformations': self._transformations_hash(edges),
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+
+    def record(self, edge_name, dsdict):
+        """Record that `edge_name` completed, producing `dsdict`
+
+        If the outputs are being written behind (see `DatasetGraph.write_behind`),
+        the edge is recorded once they are on disk.
+        """
+        outputs = {}
+        for ds_name in self.graph._edge_outputs[edge_name]:
+            ds = dsdict.get(ds_name)
+            if ds is None or self.graph.is_ephemeral(ds_name):
+                return
+            outputs[ds_name] = ds.metadata.get('hashes', {})
+        if self.graph.write_behind is None:
+            self.completed[edge_name] = {'outputs': outputs}
+        else:
+            self.graph.write_behind.when_written(outputs, self.graph._dataset_cache_path,
+                                                 partial(self.completed.__setitem__, edge_name, {'outputs': outputs}))
+
+    def remaining(self, keep=()):
+        """The edges of the journalled plan still to be processed, in order
+
+        Completed edges are skipped if their outputs are still on disk. Edges
+        in `keep` (e.g. those producing the requested datasets) are always included.
+
+        Returns
+        -------
+        list of edge names, or None if the journal is unusable (e.g. the
+        transformations of the planned edges have changed since it was written)
+        """
+        plan = load_json(self.path / 'plan.json')
+        edges = plan['edges']
+        if any(edge not in self.graph.transformers for edge in edges) or \
+           plan['transformations'] != self._transformations_hash(edges):
+            logger.warning(f"Transformations have changed since {self} was written. Not resuming.")
+            return None
+        dataset_path = self.graph._dataset_cache_path
+        done = {edge for edge in edges if edge in self.completed and edge not in keep and
+                all((dataset_path / f"{ds_name}.metadata").exists()
+                    for ds_name in self.completed[edge]['outputs'])}
+        # an unfinished edge is needed if it is kept, or feeds an edge that is still to run
+        needed = set()
+        for edge in reversed(edges):
+            if edge in done:
+                continue
+            if edge in keep or any(consumer in needed for ds_name in self.graph._edge_outputs[edge]
+                                   for consumer in self.graph.find_consumers(ds_name)):
+                needed.add(edge)
+        remaining = [edge for edge in edges if edge in needed]
+        logger.info(f"Resuming run from {self}: {len(done)} of {len(edges)} edges already completed, "
+                    f"{len(remaining)} to run")
+        return remaining
+
+    def discard(self):
+        """Remove the journal"""
+        self._completed = None
+        if self.path.exists():
+            shutil.rmtree(self.path)
+            try:
+                self.path.parent.rmdir()  # the last journal
+            except OSError:
+                pass
@@ -0,0 +1,187 @@
+"""
+Leases: cross-process locks, so that only one process generates a given Dataset at a time
+"""
+import json
+import os
+import pathlib
+import socket
+import threading
+import time
+import uuid
+
+from ..exceptions import EasydataError
+from ..log import logger
+
+__all__ = [
+    'Lease',
+]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class Lease:
+    """A lease file, held by at most one process (or thread) at a time.
+
+    The lease is a file created exclusively, and recording who holds it.
+    While held, a background thread refreshes its modification time every
+    `heartbeat` seconds. A lease is stale, and may be broken by a waiting
+    process, if it hasn't been refreshed for `stale_after` seconds (e.g. its
+    holder's machine died), or if its holder was a process on this machine
+    that no longer exists.
+
+    Use as a context manager, which waits for (and then holds) the lease:
+
+        with Lease(path):
+            ...
+
+    The lease directory must be on a filesystem shared by every process
+    contending for the lease, and which supports exclusive file creation.
+    """
+
+    def __init__(self, path, heartbeat=10.0, stale_after=60.0, poll_interval=0.5, timeout=None):
+        """
+        Parameters
+        ----------
+        path: path
+            the lease file
+        heartbeat: float
+            seconds between refreshes of a held lease
+        stale_after: float
+            seconds without a refresh after which a lease is considered abandoned
+        poll_interval: float
+            seconds between checks, while waiting for the lease
+        timeout: float or None
+            If given, give up waiting for the lease after this many seconds
+        """
+        if stale_after <= heartbeat:
+            raise ValueError("stale_after must be longer than heartbeat")
+        self.path = pathlib.Path(path)
+        self.heartbeat = heartbeat
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._token = None
+        self._stop = None
+        self._thread = None
+
+    def __repr__(self):
+        return f"Lease('{self.path}')"
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    @property
+    def held(self):
+        """True if this Lease object holds the lease"""
+        return self._token is not None
+
+    def holder(self):
+        """Who holds the lease: {'host', 'pid', 'token', 'acquired'}, or None if nobody does"""
+        try:
+            with open(self.path, encoding='utf-8') as fd:
+                return json.load(fd)
+        except FileNotFoundError:
+            return None
+        except ValueError:  # being written
+            return {}
+
+    def try_acquire(self):
+        """Take the lease if it is free (or stale). Returns True if the lease is now held"""
+        if self.held:
+            return True
+        os.makedirs(self.path.parent, exist_ok=True)
+        token = uuid.uuid4().hex
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            if self._is_stale():
+                self._break()
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as fw:
+            json.dump({'host': socket.gethostname(), 'pid': os.getpid(), 'token': token,
+                       'acquired': time.time()}, fw)
+        self._token = token
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._refresh, name='easydata-lease', daemon=True)
+        self._thread.start()
+        return True
+
+    def acquire(self):
+        """Wait for the lease, and take it
+
+        Raises
+        ------
+        EasydataError, if the lease could not be taken within `timeout`
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        waiting = False
+        while not self.try_acquire():
+            if not waiting:
+                logger.info(f"Waiting for {self} (held by {self.holder()})")
+                waiting = True
+            if deadline is not None and time.monotonic() > deadline:
+                raise EasydataError(f"Timed out waiting for {self}, held by {self.holder()}")
+            time.sleep(self.poll_interval)
+
+    def release(self):
+        """Give up the lease (if held)"""
+        if not self.held:
+            return
+        self._stop.set()
+        self._thread.join()
+        holder = self.holder()
+        if holder and holder.get('token') == self._token:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+        else:
+            logger.warning(f"{self} was broken by another process while held")
+        self._token = None
+
+    def _refresh(self):
+        while not self._stop.wait(self.heartbeat):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                return
+
+    def _is_stale(self):
+        try:
+            age = time.time() - self.path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        if age > self.stale_after:
+            return True
+        holder = self.holder()
+        return bool(holder) and holder.get('host') == socket.gethostname() and not _pid_alive(holder['pid'])
+
+    def _break(self):
+        """Remove a stale lease. Only one of several processes breaking it at once succeeds"""
+        stale = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex}.stale")
+        try:
+            os.rename(self.path, stale)
+        except FileNotFoundError:
+            return
+        if not Lease(stale, self.heartbeat, self.stale_after)._is_stale():
+            # the lease changed hands since we checked it: put it back
+            try:
+                os.link(stale, self.path)
+            except OSError:
+                pass
+        else:
+            logger.warning(f"Broke stale {self}")
+        stale.unlink()
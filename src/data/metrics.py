@@ -0,0 +1,190 @@
+"""
+Prometheus metrics (in node-exporter textfile format) for pipeline runs
+"""
+import os
+import pathlib
+import threading
+import time
+import uuid
+
+from ..log import logger
+from .runlog import add_observer, remove_observer
+
+__all__ = [
+    'Metrics',
+    'active_metrics',
+]
+
+# Metrics that are currently collecting, innermost last
+_active = []
+
+# name: (type, help)
+METRIC_DEFINITIONS = {
+    'easydata_datasets_total': ('counter', "Datasets obtained, by source (disk, generated, build_cache)"),
+    'easydata_build_cache_requests_total': ('counter', "Build cache lookups by result (hit, miss)"),
+    'easydata_hash_seconds_total': ('counter', "Time spent hashing, by kind (dataset, file)"),
+    'easydata_fetch_bytes_total': ('counter', "Bytes downloaded (or copied) when fetching DataSources"),
+    'easydata_unpack_bytes_total': ('counter', "Bytes of fetched files unpacked"),
+    'easydata_edge_duration_seconds': ('gauge', "Duration of the last run of each edge"),
+    'easydata_edge_runs_total': ('counter', "Edge runs, by status (ok, failed, error)"),
+    'easydata_edge_failures_total': ('counter', "Edge runs that failed or raised an exception"),
+    'easydata_run_duration_seconds': ('gauge', "Duration of the last workflow run"),
+    'easydata_run_timestamp_seconds': ('gauge', "Completion time of the last workflow run"),
+}
+
+
+class Metrics:
+    """Collect pipeline metrics while active, and write them as a Prometheus textfile.
+
+    Metrics are derived from the same instrumentation as the run log (see `RunLog`):
+    datasets loaded from disk vs. generated (or restored from the build cache),
+    build cache hits, hashing time, bytes fetched and unpacked, and the duration
+    and outcome of each edge. Metrics collected in process-pool workers are
+    returned to the parent with each edge's result.
+
+    The textfile is meant for the node-exporter textfile collector. If the
+    environment variable EASYDATA_METRICS_TEXTFILE is set, `make_target`
+    (i.e. `make datasets` / `make datasources`) writes its metrics there.
+
+    >>> with Metrics() as metrics:
+    ...     metrics.inc('easydata_datasets_total', source='disk')
+    >>> print(metrics.to_textfile().splitlines()[-1])
+    easydata_datasets_total{source="disk"} 1
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, *exc):
+        self.deactivate()
+        return False
+
+    def activate(self):
+        """Start collecting metrics from instrumented stages"""
+        _active.append(self)
+        add_observer(self.observe)
+
+    def deactivate(self):
+        """Stop collecting metrics"""
+        remove_observer(self.observe)
+        if self in _active:
+            _active.remove(self)
+
+    @staticmethod
+    def _key(name, labels):
+        if name not in METRIC_DEFINITIONS:
+            raise KeyError(f"Unknown metric: {name}")
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Increment a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, name, **labels):
+        """Current value of a metric (None if it has not been recorded)"""
+        with self._lock:
+            return self._values.get(self._key(name, labels))
+
+    def observe(self, record):
+        """Update metrics from a completed stage record (see `RunLog`)"""
+        stage, name = record['stage'], record['name']
+        if stage == 'process_edge':
+            status = record['status']
+            self.set('easydata_edge_duration_seconds', record['wall_time'], edge=name)
+            self.inc('easydata_edge_runs_total', edge=name, status=status)
+            if status != 'ok':
+                self.inc('easydata_edge_failures_total', edge=name)
+            cache = record.get('build_cache')
+            if cache is not None:
+                self.inc('easydata_build_cache_requests_total', result=cache)
+            if status == 'ok':
+                source = 'build_cache' if cache == 'hit' else 'generated'
+                self.inc('easydata_datasets_total', record.get('outputs', 0), source=source)
+        elif stage == 'from_disk':
+            self.inc('easydata_datasets_total', source='disk')
+        elif stage == 'hash':
+            self.inc('easydata_hash_seconds_total', record['wall_time'], kind='dataset')
+        elif stage == 'hash_file':
+            self.inc('easydata_hash_seconds_total', record['wall_time'], kind='file')
+        elif stage == 'fetch':
+            self.inc('easydata_fetch_bytes_total', record['bytes_written'])
+        elif stage == 'unpack':
+            self.inc('easydata_unpack_bytes_total', record['bytes_read'])
+
+    def drain(self):
+        """Remove and return the collected values (see `merge`)"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        """Add values collected elsewhere (e.g. by a worker process).
+
+        Counters are summed; gauges are replaced.
+        """
+        with self._lock:
+            for (name, labels), value in values.items():
+                if METRIC_DEFINITIONS[name][0] == 'counter':
+                    value += self._values.get((name, labels), 0)
+                self._values[(name, labels)] = value
+
+    def to_textfile(self):
+        """The metrics, in Prometheus text exposition format"""
+        with self._lock:
+            values = dict(self._values)
+        lines = []
+        for name, (kind, help_text) in METRIC_DEFINITIONS.items():
+            samples = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                if label_str:
+                    label_str = f"{{{label_str}}}"
+                lines.append(f"{name}{label_str} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, filename):
+        """Write the metrics to `filename`
+
+        The file is replaced atomically, so the collector never sees a partial file.
+        """
+        filename = pathlib.Path(filename)
+        tmp_file = filename.parent / f".{filename.name}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(filename.parent, exist_ok=True)
+        with open(tmp_file, 'w') as fw:
+            fw.write(self.to_textfile())
+        os.replace(tmp_file, filename)
+        logger.debug(f"Wrote metrics to {filename}")
+
+    def record_run(self, start_time):
+        """Set the run duration and completion time gauges, given the run's start time (from `time.time()`)"""
+        end_time = time.time()
+        self.set('easydata_run_duration_seconds', end_time - start_time)
+        self.set('easydata_run_timestamp_seconds', end_time)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def active_metrics():
+    """The innermost active Metrics, or None if metrics are not being collected"""
+    if _active:
+        return _active[-1]
+    return None
@@ -0,0 +1,122 @@
+"""
+A machine-wide parallelism budget, shared between DAG workers, n_jobs and BLAS/OpenMP thread pools
+"""
+import os
+from contextlib import contextmanager
+
+from ..log import logger
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+__all__ = [
+    'ParallelismBudget',
+    'active_parallelism',
+    'n_jobs',
+]
+
+# Parallelism budgets that are currently active, innermost last
+_active = []
+
+# Threads available to each edge of the DAGExecutor run in progress (if any)
+_worker_threads = None
+
+
+class ParallelismBudget:
+    """The number of threads a pipeline may use in total.
+
+    `DAGExecutor` divides the budget between the edges it runs at once: each
+    concurrent edge (thread or process worker) gets `share(n_workers)` threads.
+    While a run is in progress, BLAS and OpenMP thread pools (numpy, scipy,
+    scikit-learn) are limited to that share (if threadpoolctl is installed), and
+    `n_jobs()` returns it, so transformers can pass it on as `n_jobs`
+    (as `sklearn_transform` does).
+
+    The budget defaults to the number of CPUs, or the EASYDATA_THREADS
+    environment variable if set. To use a different budget, activate one:
+
+        with ParallelismBudget(threads=16):
+            dag.generate('my_dataset', executor='process')
+    """
+
+    def __init__(self, threads=None):
+        """
+        Parameters
+        ----------
+        threads: int or None
+            Total number of threads. Default: EASYDATA_THREADS, or the number of CPUs
+        """
+        if threads is None:
+            threads = int(os.environ.get('EASYDATA_THREADS', 0)) or os.cpu_count() or 1
+        if threads < 1:
+            raise ValueError(f"A parallelism budget needs at least one thread, not {threads}")
+        self.threads = threads
+
+    def __repr__(self):
+        return f"ParallelismBudget(threads={self.threads})"
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, *exc):
+        self.deactivate()
+        return False
+
+    def activate(self):
+        """Use this budget"""
+        _active.append(self)
+
+    def deactivate(self):
+        """Stop using this budget"""
+        if self in _active:
+            _active.remove(self)
+
+    def share(self, n_workers):
+        """Threads available to each of `n_workers` concurrent workers (at least one)"""
+        return max(1, self.threads // max(1, n_workers))
+
+
+def active_parallelism():
+    """The innermost active ParallelismBudget (or the default one, if none is active)"""
+    if _active:
+        return _active[-1]
+    return ParallelismBudget()
+
+
+def n_jobs():
+    """Number of threads (or processes) the caller may use, e.g. as an sklearn estimator's `n_jobs`
+
+    Within a `DAGExecutor` run, this is the share of the parallelism budget of
+    the edge being processed. Otherwise, it is the whole budget.
+    """
+    if _worker_threads is not None:
+        return _worker_threads
+    return active_parallelism().threads
+
+
+def _limit_threads(threads):
+    """Limit this process's BLAS and OpenMP thread pools (and `n_jobs()`) to `threads`, until further notice"""
+    global _worker_threads
+    _worker_threads = threads
+    if threadpool_limits is not None:
+        threadpool_limits(limits=threads)
+
+
+@contextmanager
+def thread_limits(threads):
+    """Context manager: limit `n_jobs()`, and BLAS and OpenMP thread pools, to `threads`"""
+    global _worker_threads
+    previous = _worker_threads
+    _worker_threads = threads
+    logger.debug(f"Limiting each edge to {threads} threads")
+    try:
+        if threadpool_limits is None:
+            yield
+        else:
+            with threadpool_limits(limits=threads):
+                yield
+    finally:
+        _worker_threads = previous
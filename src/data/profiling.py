@@ -0,0 +1,189 @@
+"""
+On-demand profiling of selected transformers
+"""
+import cProfile
+import os
+import pathlib
+import sys
+import threading
+import time
+from collections import Counter
+
+from .. import paths
+from ..log import logger
+from .runlog import active_runlog, annotate
+
+__all__ = [
+    'Profiler',
+    'active_profiler',
+]
+
+# Profilers that are currently active, innermost last
+_active = []
+
+_MODES = ('cprofile', 'sampling')
+
+
+class Profiler:
+    """Profile selected transformers when they are applied by `DatasetGraph.process_edge`.
+
+    Transformers are selected by `transformer_name`, or by the name of the edge
+    that applies them. Only the selected transformers are profiled; other edges
+    run without any profiling overhead.
+
+    For each profiled transformer, two files are written to `profile_path`:
+
+    <edge>.<transformer>.<timestamp>-<pid>.prof
+        cProfile statistics (readable with `pstats`, snakeviz, etc.). Only in 'cprofile' mode.
+    <edge>.<transformer>.<timestamp>-<pid>.collapsed
+        sampled call stacks in collapsed-stack format (one `frame;frame;... count` per line),
+        suitable for flamegraph.pl, speedscope, or https://www.speedscope.app
+
+    The filenames are also recorded in the run log (as the `profile` field of the
+    edge's `process_edge` record).
+
+    Profiling can be switched on without code changes by setting the environment
+    variable EASYDATA_PROFILE to a comma-separated list of transformer and/or edge
+    names (or '*' to profile everything). EASYDATA_PROFILER may be set to 'sampling'
+    to skip cProfile, whose overhead is considerably higher than sampling.
+    """
+
+    def __init__(self, targets, mode='cprofile', profile_path=None, interval=0.005):
+        """
+        Parameters
+        ----------
+        targets: str or iterable of str
+            transformer names and/or edge names to profile. '*' profiles every transformer.
+        mode: {'cprofile', 'sampling'}
+            'cprofile' writes cProfile statistics as well as sampled stacks;
+            'sampling' only samples stacks.
+        profile_path: path or None
+            directory for the profile files. Default: a `profiles` directory next to the
+            active run log (if any), otherwise `paths['interim_data_path']/profiles`.
+        interval: float
+            sampling interval, in seconds
+        """
+        if isinstance(targets, str):
+            targets = [targets]
+        if mode not in _MODES:
+            raise ValueError(f"Unknown profiler mode: '{mode}'. Must be one of {_MODES}")
+        self.targets = {target.strip() for target in targets if target.strip()}
+        self.mode = mode
+        self.profile_path = None if profile_path is None else pathlib.Path(profile_path)
+        self.interval = interval
+
+    def __repr__(self):
+        return f"Profiler(targets={sorted(self.targets)}, mode='{self.mode}')"
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, *exc):
+        self.deactivate()
+        return False
+
+    def activate(self):
+        """Start profiling the selected transformers"""
+        _active.append(self)
+
+    def deactivate(self):
+        """Stop profiling"""
+        if self in _active:
+            _active.remove(self)
+
+    def selects(self, edge_name, transformer_name):
+        """True if the given transformer (or edge) should be profiled"""
+        return '*' in self.targets or edge_name in self.targets or transformer_name in self.targets
+
+    def _output_path(self):
+        if self.profile_path is not None:
+            return self.profile_path
+        runlog = active_runlog()
+        if runlog is not None:
+            return runlog.path.parent / 'profiles'
+        return paths['interim_data_path'] / 'profiles'
+
+    def run(self, func, *args, label, **kwargs):
+        """Call `func(*args, **kwargs)` under the profiler, and write the profile files
+
+        Parameters
+        ----------
+        label: str
+            prefix for the profile filenames
+
+        Returns
+        -------
+        the return value of `func`
+        """
+        profile_path = self._output_path()
+        os.makedirs(profile_path, exist_ok=True)
+        stem = profile_path / f"{label}.{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        sampler = _StackSampler(threading.get_ident(), sys._getframe(), self.interval)
+        profile = cProfile.Profile() if self.mode == 'cprofile' else None
+        sampler.start()
+        try:
+            if profile is None:
+                return func(*args, **kwargs)
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            sampler.stop()
+            written = []
+            try:
+                if profile is not None:
+                    profile.dump_stats(f"{stem}.prof")
+                    written.append(f"{stem}.prof")
+                sampler.save(f"{stem}.collapsed")
+                written.append(f"{stem}.collapsed")
+            except OSError as err:
+                logger.warning(f"Unable to write profile for {label}: {err}")
+            if written:
+                logger.info(f"Wrote profile of {label} to {', '.join(written)}")
+                annotate(profile=written)
+
+
+class _StackSampler:
+    """Periodically sample the call stack of one thread, below a given frame"""
+
+    def __init__(self, thread_id, base_frame, interval):
+        self.thread_id = thread_id
+        self.base_frame = base_frame
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='easydata-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not self.base_frame:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({pathlib.Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def save(self, filename):
+        """Write the samples in collapsed-stack format"""
+        with open(filename, 'w') as fw:
+            for stack, count in sorted(self.stacks.items()):
+                fw.write(f"{stack} {count}\n")
+
+
+def active_profiler():
+    """The innermost active Profiler, or None if no transformers are being profiled"""
+    if _active:
+        return _active[-1]
+    targets = os.environ.get('EASYDATA_PROFILE')
+    if targets:
+        _active.append(Profiler(targets.split(','), mode=os.environ.get('EASYDATA_PROFILER', 'cprofile')))
+        return _active[-1]
+    return None
@@ -0,0 +1,431 @@
+"""
+Structured run statistics (timing, memory, and I/O) for pipeline stages
+"""
+import functools
+import json
+import os
+import pathlib
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from .. import paths
+from ..log import logger
+from ..utils import peak_memory
+from .tracing import span
+
+__all__ = [
+    'RunLog',
+    'active_runlog',
+    'instrument',
+    'instrumented',
+    'count_bytes',
+    'io_counter',
+    'annotate',
+    'capture',
+    'attached',
+    'add_observer',
+    'remove_observer',
+]
+
+# RunLogs that are currently recording, innermost last
+_active = []
+# Callables that receive every completed stage record (e.g. Metrics)
+_observers = []
+# Serializes writes to run log files from within a process
+_write_lock = threading.Lock()
+# Per-thread stack of open records, so nested stages can be attributed to their parents
+_local = threading.local()
+# Guards updates of records that may be shared between threads (see `capture`)
+_lock = threading.Lock()
+# {id(record): number of captures of the record that are still attached}
+_holds = Counter()
+# {id(record): (record, parent, runlog)} for records of finished stages that are still held
+_deferred = {}
+
+
+class RunLog:
+    """A log of per-stage run statistics.
+
+    While a RunLog is active (e.g. within a `with RunLog():` block), every
+    instrumented stage appends a record to it. Instrumented stages are
+    `DatasetGraph.process_edge`, `DataSource.fetch`, `DataSource.unpack`,
+    `DataSource.process`, `Dataset.dump` and `Dataset.from_disk` (full loads only).
+
+    Records are stored as JSON lines, one per stage invocation, with fields:
+
+    run_id: str
+        identifies the run (i.e. the RunLog activation) that produced the record
+    stage: str
+        e.g. 'process_edge', 'dump'
+    name: str
+        the edge, dataset, or datasource name
+    start: float
+        start time (seconds since the epoch)
+    wall_time: float
+        elapsed time in seconds
+    process_peak_memory: int or None
+        peak resident memory of the whole process (its high-water mark) when the stage
+        ended, in bytes. This is not attributable to the stage: it includes everything
+        the process (and its other threads) allocated before, and during, the stage
+    bytes_read, bytes_written: int
+        bytes read from, and written to disk. This includes the I/O of nested stages
+        (e.g. the `dump` of each output of a `process_edge`, even when it is written
+        behind; the record is then written once the dump has finished)
+    status: {'ok', 'error', 'failed'}
+        'error' if the stage raised an exception, 'failed' if it reported a failure
+        (e.g. an edge whose outputs failed hash validation)
+    pid, thread:
+        process id and thread name that ran the stage
+
+    Stages may add other fields (see `annotate`); e.g. `process_edge` records
+    `build_cache` ('hit' or 'miss'), the number of `outputs` it generated, and its own
+    `peak_memory` (see `DatasetGraph.edge_stats`).
+
+    If the environment variable EASYDATA_RUNLOG is set to a filename, a RunLog
+    writing to that file is active in every process (EASYDATA_RUN_ID may be set
+    to share a run_id between processes).
+    """
+
+    def __init__(self, path=None, run_id=None):
+        """
+        Parameters
+        ----------
+        path: path or None
+            JSON-lines file to write. Default: `paths['interim_data_path']/runlog.jsonl`
+        run_id: str or None
+            Identifier for this run. Default: generated from the current time
+        """
+        if path is None:
+            path = paths['interim_data_path'] / 'runlog.jsonl'
+        self.path = pathlib.Path(path)
+        if run_id is None:
+            run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.run_id = run_id
+
+    def __repr__(self):
+        return f"RunLog(path='{self.path}', run_id='{self.run_id}')"
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, *exc):
+        self.deactivate()
+        return False
+
+    def activate(self):
+        """Start recording instrumented stages to this RunLog"""
+        _active.append(self)
+
+    def deactivate(self):
+        """Stop recording to this RunLog"""
+        if self in _active:
+            _active.remove(self)
+
+    def write(self, record):
+        """Append a record to the log"""
+        line = json.dumps({'run_id': self.run_id, **record}, sort_keys=True)
+        with _write_lock:
+            os.makedirs(self.path.parent, exist_ok=True)
+            with open(self.path, 'a') as fw:
+                fw.write(line + "\n")
+
+    def records(self, run_id=None, stage=None, name=None):
+        """Read the records in the log
+
+        Parameters
+        ----------
+        run_id: str, True, or None
+            If given, only return records from this run. If True, only this RunLog's own run.
+        stage, name: str or None
+            If given, only return records for this stage / name
+
+        Returns
+        -------
+        list of record dicts, in the order they were written
+        """
+        if run_id is True:
+            run_id = self.run_id
+        if not self.path.exists():
+            return []
+        records = []
+        with open(self.path) as fr:
+            for line in fr:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed run log record in {self.path}")
+                    continue
+                if run_id is not None and record.get('run_id') != run_id:
+                    continue
+                if stage is not None and record.get('stage') != stage:
+                    continue
+                if name is not None and record.get('name') != name:
+                    continue
+                records.append(record)
+        return records
+
+    def runs(self):
+        """List the run_ids in the log, oldest first"""
+        return list(dict.fromkeys(record['run_id'] for record in self.records()))
+
+    def summary(self, run_id=None):
+        """Aggregate statistics per (stage, name)
+
+        Parameters
+        ----------
+        run_id: str, True, or None
+            run to summarize (see `records`). Default: the most recent run in the log.
+
+        Returns
+        -------
+        dict {(stage, name): dict} with keys `count`, `wall_time` (total), `process_peak_memory` (max),
+        `bytes_read` and `bytes_written` (totals), and `errors`.
+        """
+        if run_id is None:
+            runs = self.runs()
+            if not runs:
+                return {}
+            run_id = runs[-1]
+        summary = defaultdict(lambda: {'count': 0, 'wall_time': 0.0, 'process_peak_memory': None,
+                                       'bytes_read': 0, 'bytes_written': 0, 'errors': 0})
+        for record in self.records(run_id=run_id):
+            entry = summary[(record['stage'], record['name'])]
+            entry['count'] += 1
+            entry['wall_time'] += record['wall_time']
+            if record.get('process_peak_memory') is not None:
+                entry['process_peak_memory'] = max(entry['process_peak_memory'] or 0, record['process_peak_memory'])
+            entry['bytes_read'] += record.get('bytes_read', 0)
+            entry['bytes_written'] += record.get('bytes_written', 0)
+            entry['errors'] += record.get('status') != 'ok'
+        return dict(summary)
+
+    def compare(self, baseline, run_id=None, key='wall_time'):
+        """Compare a run against a baseline run, to find stages that regressed
+
+        Parameters
+        ----------
+        baseline: str
+            run_id of the baseline run
+        run_id: str, True, or None
+            run to compare. Default: the most recent run in the log
+        key: {'wall_time', 'process_peak_memory', 'bytes_read', 'bytes_written'}
+            statistic to compare
+
+        Returns
+        -------
+        list of (stage, name, baseline_value, value, change) tuples, largest increase first.
+        Stages missing from either run are omitted.
+        """
+        before = self.summary(run_id=baseline)
+        after = self.summary(run_id=run_id)
+        changes = []
+        for stage_name in before.keys() & after.keys():
+            old, new = before[stage_name][key], after[stage_name][key]
+            if old is None or new is None:
+                continue
+            changes.append((*stage_name, old, new, new - old))
+        return sorted(changes, key=lambda change: change[-1], reverse=True)
+
+
+def active_runlog():
+    """The innermost active RunLog, or None if no stages are being recorded"""
+    if _active:
+        return _active[-1]
+    env_path = os.environ.get('EASYDATA_RUNLOG')
+    if env_path:
+        _active.append(RunLog(env_path, run_id=os.environ.get('EASYDATA_RUN_ID')))
+        return _active[-1]
+    return None
+
+
+def _open_records():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def instrument(stage, name):
+    """Record the timing, memory use, and I/O of a stage in the active RunLog
+
+    The stage is also recorded as a span in the active Tracer (if any).
+    Does nothing (beyond running the enclosed code) if no RunLog or Tracer is active.
+    Use `count_bytes` within the block to account for I/O.
+
+    Parameters
+    ----------
+    stage: str
+        kind of stage; e.g. 'process_edge'
+    name: str
+        name of the object being processed
+    """
+    with span(f"{stage}: {name}", cat=stage):
+        runlog = active_runlog()
+        if runlog is None and not _observers:
+            yield None
+        else:
+            with _recording(runlog, stage, name) as record:
+                yield record
+
+
+@contextmanager
+def _recording(runlog, stage, name):
+    """Record the enclosed stage in `runlog` (if any), and pass it to any observers (see `instrument`)"""
+    record = {
+        'stage': stage,
+        'name': name,
+        'start': time.time(),
+        'bytes_read': 0,
+        'bytes_written': 0,
+        'status': 'ok',
+        'pid': os.getpid(),
+        'thread': threading.current_thread().name,
+    }
+    stack = _open_records()
+    stack.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        record['status'] = 'error'
+        raise
+    finally:
+        record['wall_time'] = time.perf_counter() - start
+        record['process_peak_memory'] = peak_memory()
+        stack.pop()
+        parent = stack[-1] if stack else None
+        with _lock:
+            if _holds[id(record)]:
+                # work attached elsewhere (e.g. a write-behind dump) is still adding to the record
+                _deferred[id(record)] = (record, parent, runlog)
+                record = None
+            else:
+                _roll_up(record, parent)
+        if record is not None:
+            _emit(record, runlog)
+
+
+def _roll_up(record, parent):
+    """Add the I/O of a finished stage to its parent's record. Call with `_lock` held"""
+    if parent is not None:
+        parent['bytes_read'] += record['bytes_read']
+        parent['bytes_written'] += record['bytes_written']
+
+
+def _emit(record, runlog):
+    """Pass a completed record to the observers, and write it to `runlog` (if any)"""
+    for observer in list(_observers):
+        observer(record)
+    if runlog is not None:
+        try:
+            runlog.write(record)
+        except OSError as err:
+            logger.warning(f"Unable to write to run log {runlog.path}: {err}")
+
+
+def instrumented(stage, name):
+    """Decorator version of `instrument`
+
+    Parameters
+    ----------
+    stage: str
+        kind of stage
+    name: callable
+        called with the decorated function's arguments; returns the name to record
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with instrument(stage, name(*args, **kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_bytes(read=0, written=0):
+    """Attribute disk I/O to the innermost instrumented stage (if any) of the current thread"""
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        with _lock:
+            stack[-1]['bytes_read'] += read
+            stack[-1]['bytes_written'] += written
+
+
+@contextmanager
+def io_counter():
+    """Count the disk I/O of the enclosed code (including its nested stages), without recording a stage
+
+    Yields a dict with `bytes_read` and `bytes_written`. Use this to measure I/O done on
+    behalf of a stage before it starts (e.g. prefetching its inputs), then `count_bytes` it.
+    """
+    counts = {'bytes_read': 0, 'bytes_written': 0}
+    stack = _open_records()
+    stack.append(counts)
+    try:
+        yield counts
+    finally:
+        stack.remove(counts)
+
+
+def annotate(**fields):
+    """Add fields to the record of the innermost instrumented stage (if any) of the current thread"""
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        stack[-1].update(fields)
+
+
+def capture():
+    """Capture the open stages of the current thread, so work done elsewhere can be attributed to them
+
+    Pass the result to `attached` exactly once (e.g. in another thread). The records of the
+    captured stages are held until then: if a stage finishes first, its record is
+    completed (rolled up into its parent, written, and passed to observers) only once
+    the attached work is done.
+    """
+    captured = tuple(getattr(_local, 'stack', ()))
+    with _lock:
+        for record in captured:
+            _holds[id(record)] += 1
+    return captured
+
+
+@contextmanager
+def attached(captured):
+    """Attribute the I/O of the enclosed code (and its nested stages) to stages captured by `capture`"""
+    previous = _open_records()
+    _local.stack = list(captured)
+    try:
+        yield
+    finally:
+        _local.stack = previous
+        completed = []
+        with _lock:
+            for record in reversed(captured):  # innermost first, so each rolls up before its parent
+                _holds[id(record)] -= 1
+                if _holds[id(record)]:
+                    continue
+                del _holds[id(record)]
+                if id(record) in _deferred:
+                    record, parent, runlog = _deferred.pop(id(record))
+                    _roll_up(record, parent)
+                    completed.append((record, runlog))
+        for record, runlog in completed:
+            _emit(record, runlog)
+
+
+def add_observer(observer):
+    """Call `observer(record)` with the record of every instrumented stage, as it completes"""
+    _observers.append(observer)
+
+
+def remove_observer(observer):
+    """Stop passing stage records to `observer`"""
+    if observer in _observers:
+        _observers.remove(observer)
@@ -0,0 +1,302 @@
+"""
+Streaming transformers: process Datasets as sequences of chunks, with bounded memory
+"""
+import copy
+import hashlib
+import os
+import pathlib
+import shutil
+import uuid
+
+import joblib
+import numpy as np
+
+from ..exceptions import EasydataError
+from ..log import logger
+from .runlog import count_bytes
+
+__all__ = [
+    'ChunkHasher',
+    'ChunkWriter',
+    'DEFAULT_CHUNK_SIZE',
+    'concat_chunks',
+    'is_streaming',
+    'iter_chunks',
+    'read_chunks',
+    'streaming_transformer',
+    'zip_chunks',
+]
+
+# Rows per chunk, when splitting a materialized Dataset into chunks
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def streaming_transformer(func):
+    """Decorator: mark a transformer function as streaming.
+
+    A streaming transformer takes an iterator of chunk dicts, and yields chunk dicts:
+
+        @streaming_transformer
+        def scale(chunks, *, output_dataset, factor):
+            for chunk_dict in chunks:
+                ds = chunk_dict['input']
+                yield {output_dataset: Dataset(output_dataset, data=ds.data * factor)}
+
+    Each chunk dict maps every input (or output) dataset name of the edge to a
+    Dataset holding the next chunk of its rows; the chunks of an edge's inputs
+    are aligned. Sources (edges without inputs) are passed an empty iterator.
+    Only one chunk of each dataset needs to be in memory at a time.
+
+    Streaming edges (whose transformers are all streaming) can be piped
+    together by `DatasetGraph.process_chain`, or the 'streaming' DAGExecutor;
+    their outputs are written to disk chunk by chunk (see `ChunkWriter`).
+    """
+    func.easydata_streaming = True
+    return func
+
+
+def is_streaming(transformer):
+    """True if `transformer` (a function, or a partial of one) is a streaming transformer"""
+    return getattr(getattr(transformer, 'func', transformer), 'easydata_streaming', False)
+
+
+def _slice(value, start, stop):
+    if value is None:
+        return None
+    if hasattr(value, 'iloc'):
+        return value.iloc[start:stop]
+    return value[start:stop]
+
+
+def iter_chunks(ds, chunk_size=None):
+    """Split a (materialized) Dataset into chunks of `chunk_size` rows
+
+    `data` and `target` are sliced along their first axis.
+
+    Yields
+    ------
+    Datasets, with a copy of the metadata of `ds`
+    """
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    n_rows = 0 if ds.data is None else len(ds.data)
+    for start in range(0, max(n_rows, 1), chunk_size):
+        metadata = {k: v for k, v in copy.deepcopy(ds.metadata).items() if k != 'hashes'}
+        yield type(ds)(ds.name, data=_slice(ds.data, start, start + chunk_size),
+                       target=_slice(ds.target, start, start + chunk_size),
+                       metadata=metadata)
+
+
+def _concat(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    if hasattr(values[0], 'iloc'):
+        import pandas as pd
+        return pd.concat(values)
+    if isinstance(values[0], np.ndarray):
+        return np.concatenate(values)
+    return sum(values[1:], values[0])
+
+
+def concat_chunks(chunks, metadata=None):
+    """Assemble chunks into a single (materialized) Dataset
+
+    Parameters
+    ----------
+    chunks: iterable of Datasets
+    metadata: dict or None
+        metadata of the assembled Dataset (e.g. from `ChunkWriter.finish`),
+        including its hashes. Default: that of the first chunk
+
+    Returns
+    -------
+    Dataset, or None if there are no chunks and no `metadata`
+    """
+    chunks = list(chunks)
+    if metadata is None:
+        if not chunks:
+            return None
+        metadata = chunks[0].metadata
+    # once assembled, the Dataset is no longer chunked
+    metadata = {k: v for k, v in metadata.items() if k != 'chunks'}
+    cls = type(chunks[0]) if chunks else None
+    if cls is None:
+        from .datasets import Dataset
+        cls = Dataset
+    return cls(metadata['dataset_name'], data=_concat(c.data for c in chunks),
+               target=_concat(c.target for c in chunks), metadata=metadata, update_hashes=False)
+
+
+def read_chunks(dataset_name, data_path):
+    """Iterate over the chunks of a Dataset written by a ChunkWriter, reading one at a time
+
+    Hashes are not checked (see `Dataset.from_disk`).
+    """
+    chunk_dir = pathlib.Path(data_path) / f'{dataset_name}.chunks'
+    if not chunk_dir.is_dir():
+        raise FileNotFoundError(f"No chunked dataset {dataset_name} in {data_path}")
+    for chunk_file in sorted(chunk_dir.glob('*.dataset')):
+        with open(chunk_file, 'rb') as fd:
+            chunk = joblib.load(fd)
+        count_bytes(read=chunk_file.stat().st_size)
+        yield chunk
+
+
+def zip_chunks(streams):
+    """Combine per-dataset chunk iterators into an iterator of aligned chunk dicts"""
+    iterators = {name: iter(stream) for name, stream in streams.items()}
+    if not iterators:
+        return
+    sentinel = object()
+    while True:
+        chunk_dict = {name: next(iterator, sentinel) for name, iterator in iterators.items()}
+        exhausted = [name for name, chunk in chunk_dict.items() if chunk is sentinel]
+        if len(exhausted) == len(chunk_dict):
+            return
+        if exhausted:
+            raise EasydataError(f"Streaming inputs have different numbers of chunks: {exhausted} ended early")
+        yield chunk_dict
+
+
+def _row_bytes(value):
+    """The content of a chunk of rows, as a sequence of byte strings
+
+    Concatenating the rows of several chunks concatenates their byte strings,
+    so a hash of these doesn't depend on how the rows were chunked.
+    """
+    if hasattr(value, 'iloc'):  # pandas: one 64-bit hash per row (including its index)
+        import pandas as pd
+        yield np.ascontiguousarray(pd.util.hash_pandas_object(value, index=True).values).tobytes()
+    elif isinstance(value, np.ndarray) and not value.dtype.hasobject:
+        yield np.ascontiguousarray(value).tobytes()
+    else:
+        for row in value:
+            yield joblib.hash(row).encode('ascii')
+
+
+def _layout(value):
+    """The parts of a chunk's type that all chunks share (e.g. dtype and columns, but not the number of rows)"""
+    if value is None:
+        return repr(None)
+    if hasattr(value, 'iloc'):
+        return repr((type(value).__name__, list(getattr(value, 'columns', [])),
+                     [str(dtype) for dtype in np.atleast_1d(value.dtypes)]))
+    if isinstance(value, np.ndarray):
+        return repr(('ndarray', str(value.dtype), value.shape[1:]))
+    return repr(type(value).__name__)
+
+
+class ChunkHasher:
+    """Accumulate the hashes of a chunked Dataset, one chunk at a time
+
+    A chunked Dataset's hash for each attribute (e.g. 'data') is computed by a
+    single running hash function, fed the attribute's layout (e.g. dtype), and
+    then the content of its rows, chunk by chunk, in order. It therefore
+    doesn't depend on how the Dataset was chunked, so a streaming edge's outputs
+    hash the same whatever `chunk_size` they were produced with.
+    (These hashes differ from those of `Dataset.update_hashes`, which hashes a
+    whole attribute at once; streaming edges' outputs are always hashed this way.)
+    """
+
+    def __init__(self, dataset_name, hash_type='sha1'):
+        self.dataset_name = dataset_name
+        self.hash_type = hash_type
+        self.n_chunks = 0
+        self.metadata = None
+        self._hashers = {}
+
+    def add(self, chunk):
+        for key, value in chunk.items():
+            if key == 'metadata' or key.startswith('__'):
+                continue
+            hasher = self._hashers.get(key)
+            if hasher is None:
+                hasher = self._hashers[key] = hashlib.new(self.hash_type)
+                hasher.update(_layout(value).encode('utf-8'))
+            if value is not None:
+                for row_bytes in _row_bytes(value):
+                    hasher.update(row_bytes)
+        if self.metadata is None:
+            self.metadata = {k: v for k, v in chunk.metadata.items() if k != 'hashes'}
+        self.n_chunks += 1
+
+    def write(self, chunk):
+        """Add the next chunk (only its hashes are kept)"""
+        self.add(chunk)
+
+    def hashes(self):
+        return {key: f"{self.hash_type}:{hasher.hexdigest()}" for key, hasher in self._hashers.items()}
+
+    def finish(self):
+        """Metadata of the chunked Dataset: that of its first chunk, with combined hashes and the number of chunks"""
+        metadata = dict(self.metadata or {})
+        metadata['dataset_name'] = self.dataset_name
+        metadata['hashes'] = self.hashes()
+        metadata['chunks'] = self.n_chunks
+        return metadata
+
+
+class ChunkWriter(ChunkHasher):
+    """Write a Dataset chunk by chunk.
+
+    Chunks are written to `dump_path/<dataset_name>.chunks/`, one file per
+    chunk, followed (on `commit`) by the `<dataset_name>.metadata` file. The
+    metadata records the number of chunks; `Dataset.from_disk` reassembles
+    chunked Datasets, and `read_chunks` reads them a chunk at a time.
+
+    If `dump_path` is None, chunks are kept in memory instead (see `load`).
+    """
+
+    def __init__(self, dataset_name, dump_path=None, hash_type='sha1'):
+        super().__init__(dataset_name, hash_type=hash_type)
+        self.dump_path = None if dump_path is None else pathlib.Path(dump_path)
+        self._chunks = []
+        self._tmp_dir = None
+        if self.dump_path is not None:
+            self._tmp_dir = self.dump_path / f'.{dataset_name}.chunks.{uuid.uuid4().hex}.tmp'
+            os.makedirs(self._tmp_dir)
+
+    def write(self, chunk):
+        """Add the next chunk"""
+        self.add(chunk)
+        if self.dump_path is None:
+            self._chunks.append(chunk)
+            return
+        chunk_file = self._tmp_dir / f'{self.n_chunks - 1:06d}.dataset'
+        with open(chunk_file, 'wb') as fo:
+            joblib.dump(chunk, fo)
+        count_bytes(written=chunk_file.stat().st_size)
+
+    def commit(self):
+        """Move the written chunks into place, and write the metadata file"""
+        metadata = self.finish()
+        if self.dump_path is None:
+            return metadata
+        chunk_dir = self.dump_path / f'{self.dataset_name}.chunks'
+        if chunk_dir.exists():
+            shutil.rmtree(chunk_dir)
+        os.replace(self._tmp_dir, chunk_dir)
+        self._tmp_dir = None
+        stale = self.dump_path / f'{self.dataset_name}.dataset'
+        if stale.exists():
+            stale.unlink()
+        metadata_fq = self.dump_path / f'{self.dataset_name}.metadata'
+        with open(metadata_fq, 'wb') as fo:
+            joblib.dump(metadata, fo)
+        count_bytes(written=metadata_fq.stat().st_size)
+        logger.debug(f"Wrote chunked Dataset: {self.dataset_name} ({self.n_chunks} chunks)")
+        return metadata
+
+    def abort(self):
+        """Discard the written chunks"""
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+        self._chunks = []
+
+    def load(self):
+        """The complete Dataset, assembled from its chunks"""
+        if self.dump_path is None:
+            return concat_chunks(self._chunks, self.finish())
+        return concat_chunks(read_chunks(self.dataset_name, self.dump_path), self.finish())
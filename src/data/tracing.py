@@ -0,0 +1,171 @@
+"""
+Execution tracing: nested timing spans, exportable as Chrome trace JSON
+"""
+import functools
+import json
+import os
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+
+from ..log import logger
+
+__all__ = [
+    'Tracer',
+    'active_tracer',
+    'span',
+    'traced',
+]
+
+# Tracers that are currently recording, innermost last
+_active = []
+
+
+class Tracer:
+    """Collects timing spans for the pipeline stages run while it is active.
+
+    Spans are recorded for `DatasetGraph.generate` (and `generate_many`), each
+    `process_edge`, the transformers it applies, and the `dump` of its outputs;
+    for fetching (`fetch_file` with its download and hash steps) and unpacking
+    files; and for the other stages instrumented for the run log (see `RunLog`).
+    Each span records the process and thread that ran it, so concurrent edges
+    appear on separate tracks.
+
+    Spans recorded in process-pool workers are returned to the parent with
+    each edge's result.
+
+    The trace can be saved in the Chrome trace event format, and viewed in
+    chrome://tracing or https://ui.perfetto.dev
+
+    >>> with Tracer() as tracer:
+    ...     with span('example', cat='doctest'):
+    ...         pass
+    >>> [event['name'] for event in tracer.events]
+    ['example']
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, *exc):
+        self.deactivate()
+        return False
+
+    def activate(self):
+        """Start recording spans to this Tracer"""
+        _active.append(self)
+
+    def deactivate(self):
+        """Stop recording spans to this Tracer"""
+        if self in _active:
+            _active.remove(self)
+
+    def add(self, event):
+        """Record a (completed) trace event"""
+        with self._lock:
+            self.events.append(event)
+
+    def extend(self, events):
+        """Record events collected elsewhere (e.g. by a worker process)"""
+        with self._lock:
+            self.events.extend(events)
+
+    def drain(self):
+        """Remove and return the events recorded so far"""
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def to_dict(self):
+        """The trace, as a dict in Chrome trace event format"""
+        with self._lock:
+            events = list(self.events)
+        thread_names = {}
+        for event in events:
+            thread_names.setdefault((event['pid'], event['tid']), event['args'].get('thread'))
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                    for (pid, tid), name in thread_names.items() if name]
+        return {'traceEvents': metadata + sorted(events, key=lambda e: e['ts']),
+                'displayTimeUnit': 'ms'}
+
+    def save(self, filename):
+        """Write the trace to `filename` as Chrome trace JSON"""
+        filename = pathlib.Path(filename)
+        with open(filename, 'w') as fw:
+            json.dump(self.to_dict(), fw)
+        logger.debug(f"Wrote {len(self.events)} trace events to {filename}")
+
+
+def active_tracer():
+    """The innermost active Tracer, or None if spans are not being recorded"""
+    if _active:
+        return _active[-1]
+    return None
+
+
+@contextmanager
+def span(name, cat='easydata', **args):
+    """Record a timing span in the active Tracer
+
+    Does nothing (beyond running the enclosed code) if no Tracer is active.
+
+    Parameters
+    ----------
+    name: str
+        name of the span, as shown on the timeline
+    cat: str
+        category of the span; e.g. 'process_edge'
+    **args:
+        additional (JSON-serializable) information to attach to the span
+    """
+    tracer = active_tracer()
+    if tracer is None:
+        yield
+        return
+    ts = time.time_ns() // 1000
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as err:
+        args['error'] = repr(err)
+        raise
+    finally:
+        tracer.add({
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': ts,
+            'dur': (time.perf_counter() - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': {**args, 'thread': threading.current_thread().name},
+        })
+
+
+def traced(cat, name=None):
+    """Decorator: record each call of the decorated function as a span
+
+    Parameters
+    ----------
+    cat: str
+        category of the span
+    name: callable or None
+        called with the decorated function's arguments; returns the span name.
+        Default: `cat`
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if active_tracer() is None:
+                return func(*args, **kwargs)
+            span_name = cat if name is None else name(*args, **kwargs)
+            with span(span_name, cat=cat):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
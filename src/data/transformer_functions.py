@@ -1,3 +1,4 @@
+import inspect
 import pathlib
 
 import pandas as pd
@@ -8,6 +9,7 @@ from sklearn.model_selection import train_test_split
 from . import Dataset, deserialize_partial
 from .. import paths
 from ..log import logger
+from .parallelism import n_jobs
 from .utils import deserialize_partial
 from ..utils import run_notebook
 
@@ -121,7 +123,8 @@ def sklearn_transform(ds_dict, transformer_name, transformer_opts=None, subselec
     transformer_name: string
         sklearn style transformer with a .fit_transform method avaible via sklearn_transformers.
     transformer_opts: dict
-        options to pass on to the transformer
+        options to pass on to the transformer. If the transformer takes `n_jobs`
+        and none is given, it is set to `n_jobs()` (see ParallelismBudget)
     subselect_column: string
         column name for dset.data to run the transformer on
     return_whole: boolean
@@ -136,7 +139,12 @@ def sklearn_transform(ds_dict, transformer_name, transformer_opts=None, subselec
     new_dsdict = {}
     for ds_name, dset in ds_dict.items():
         if transformer_name in sklearn_transformers():
-            transformer = sklearn_transformers(keys_only=False).get(transformer_name)(**transformer_opts)
+            transformer_cls = sklearn_transformers(keys_only=False).get(transformer_name)
+            opts_ = dict(transformer_opts or {})
+            if 'n_jobs' in inspect.signature(transformer_cls).parameters:
+                # use this edge's share of the parallelism budget, unless told otherwise
+                opts_.setdefault('n_jobs', n_jobs())
+            transformer = transformer_cls(**opts_)
         else:
             raise ValueError(f"Invalid transformer name: {transformer_name}. See sklearn_transformers for available names.")
         if subselect_column:
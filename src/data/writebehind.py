@@ -0,0 +1,180 @@
+"""
+Write-behind of Datasets: dump them in a background thread, overlapping with other work
+"""
+import pathlib
+import sys
+import threading
+from collections import Counter, deque
+
+from ..exceptions import EasydataError
+from ..log import logger
+from .runlog import attached, capture
+
+__all__ = [
+    'WriteBehind',
+]
+
+# Default bound on the (estimated) size of Datasets waiting to be written
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def _estimated_size(ds):
+    """Rough in-memory size of a Dataset's data and target, in bytes"""
+    size = 0
+    for value in (ds.data, ds.target):
+        if value is None:
+            continue
+        if hasattr(value, 'memory_usage'):  # pandas
+            usage = value.memory_usage(deep=True)
+            size += int(getattr(usage, 'sum', lambda: usage)())
+        elif hasattr(value, 'nbytes'):
+            size += int(value.nbytes)
+        else:
+            size += sys.getsizeof(value)
+    return size
+
+
+class WriteBehind:
+    """Queue of Datasets to be dumped by a background writer thread.
+
+    `DatasetGraph` uses this (see its `write_behind` option) so that hashing,
+    pickling and writing an edge's outputs overlaps with downstream edges,
+    rather than holding them up.
+
+    Datasets are written in the order they were submitted. Submitting blocks
+    while the Datasets waiting to be written would exceed `max_bytes`
+    (by estimated in-memory size), so a slow disk can't exhaust memory.
+
+    `wait()` is a durability barrier: it blocks until the given (or all)
+    pending Datasets are on disk, and raises an EasydataError if any of them
+    could not be written. Errors are kept until they have been raised by a `wait()`.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Parameters
+        ----------
+        max_bytes: int
+            Bound on the estimated size of the Datasets waiting to be written.
+            A single larger Dataset is still accepted (once the queue is empty).
+        """
+        self.max_bytes = max_bytes
+        self._queue = deque()
+        self._pending = Counter()  # {(dump_path, dataset_name): number of queued or running writes}
+        self._pending_bytes = 0
+        self._errors = {}  # {(dump_path, dataset_name): exception}
+        self._waiting = []  # [(set of keys, callback)], see `when_written`
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def __repr__(self):
+        return f"WriteBehind(max_bytes={self.max_bytes}, pending={sum(self._pending.values())})"
+
+    @staticmethod
+    def _key(dataset_name, dump_path):
+        return (str(pathlib.Path(dump_path)), dataset_name)
+
+    def submit(self, ds, dump_path, callback=None, **dump_kwargs):
+        """Queue `ds` to be written by `ds.dump(dump_path=dump_path, **dump_kwargs)`
+
+        Parameters
+        ----------
+        callback: function or None
+            called (in the writer thread) once `ds` has been written
+
+        The write is attributed to the stages (see `RunLog`) open in the submitting thread.
+        """
+        size = _estimated_size(ds)
+        key = self._key(ds.name, dump_path)
+        with self._cond:
+            while self._pending_bytes and self._pending_bytes + size > self.max_bytes:
+                self._cond.wait()
+            self._queue.append((key, size, ds, dump_path, dump_kwargs, callback, capture()))
+            self._pending[key] += 1
+            self._pending_bytes += size
+            self._errors.pop(key, None)  # superseded
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write, name='easydata-write-behind', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _write(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                key, size, ds, dump_path, dump_kwargs, callback, stages = self._queue.popleft()
+            try:
+                with attached(stages):
+                    ds.dump(dump_path=dump_path, **dump_kwargs)
+                    if callback is not None:
+                        callback()
+                with self._cond:
+                    # this is the last pending write these callbacks were waiting for
+                    ready = [waiting for waiting in self._waiting if key in waiting[0] and
+                             all(self._pending[other] == (1 if other == key else 0) for other in waiting[0])]
+                    self._waiting = [waiting for waiting in self._waiting if waiting not in ready]
+                for _, waiting_callback in ready:
+                    waiting_callback()
+            except Exception as err:
+                logger.error(f"Write-behind of Dataset '{ds.name}' failed: {err!r}")
+                with self._cond:
+                    self._errors[key] = err
+                    self._waiting = [waiting for waiting in self._waiting if key not in waiting[0]]
+            finally:
+                with self._cond:
+                    self._pending[key] -= 1
+                    if not self._pending[key]:
+                        del self._pending[key]
+                    self._pending_bytes -= size
+                    self._cond.notify_all()
+
+    def when_written(self, dataset_names, dump_path, callback):
+        """Call `callback()` once the pending writes of `dataset_names` to `dump_path` are on disk
+
+        The callback is called immediately if none of them are pending, and otherwise in the
+        writer thread, after the last of them has been written. It is not called at all if
+        any of them can't be written.
+        """
+        keys = {self._key(name, dump_path) for name in dataset_names}
+        with self._cond:
+            if any(key in self._pending for key in keys):
+                self._waiting.append((keys, callback))
+                return
+        callback()
+
+    def pending(self):
+        """Names of the Datasets waiting to be written"""
+        with self._cond:
+            return sorted({name for _, name in self._pending})
+
+    def wait(self, dataset_names=None, dump_path=None):
+        """Block until pending writes have finished
+
+        Parameters
+        ----------
+        dataset_names: iterable of str, or None
+            Wait for these Datasets only. Default: wait for every pending write
+        dump_path: path or None
+            With `dataset_names`: only wait for writes to this directory
+
+        Raises
+        ------
+        EasydataError, if any of the awaited Datasets could not be written
+        """
+        names = None if dataset_names is None else set(dataset_names)
+        dump_path = None if dump_path is None else str(pathlib.Path(dump_path))
+
+        def selected(key):
+            return names is None or (key[1] in names and (dump_path is None or key[0] == dump_path))
+
+        with self._cond:
+            while any(selected(key) for key in self._pending):
+                self._cond.wait()
+            failed = {key: err for key, err in self._errors.items() if selected(key)}
+            for key in failed:
+                del self._errors[key]
+        if failed:
+            (path, name), err = next(iter(failed.items()))
+            others = f" (and {len(failed) - 1} other Datasets)" if len(failed) > 1 else ""
+            raise EasydataError(f"Failed to write Dataset '{name}' to {path}{others}: {err!r}") from err
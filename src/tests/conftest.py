@@ -0,0 +1,30 @@
+import pytest
+
+from src.tests.dag_helpers import add_inputs, add_transformers, always_fails, make_range, pipeline
+
+
+@pytest.fixture
+def join_catalog(tmpdir):
+    """Three independent sources feeding a join"""
+    add_transformers(tmpdir, {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(make_range, dataset_name='a', n=5)},
+        '_b': {'output_datasets': ['b'], 'transformations': pipeline(make_range, dataset_name='b', n=5)},
+        '_c': {'output_datasets': ['c'], 'transformations': pipeline(make_range, dataset_name='c', n=5)},
+        'join': {'input_datasets': ['a', 'b', 'c'], 'output_datasets': ['abc'],
+                 'transformations': pipeline(add_inputs, dataset_name='abc')},
+        '_broken': {'output_datasets': ['broken'], 'transformations': pipeline(always_fails)},
+        'broken_join': {'input_datasets': ['a', 'broken'], 'output_datasets': ['a_broken'],
+                        'transformations': pipeline(add_inputs, dataset_name='a_broken')},
+    })
+    yield tmpdir
+
+@pytest.fixture
+def diamond_catalog(tmpdir):
+    """A small graph: two sources joined, then split"""
+    add_transformers(tmpdir, {
+        '_a': {'output_datasets': ['a']},
+        '_b': {'output_datasets': ['b']},
+        'join': {'input_datasets': ['a', 'b'], 'output_datasets': ['ab']},
+        'split': {'input_datasets': ['ab'], 'output_datasets': ['ab_train', 'ab_test']},
+    })
+    yield tmpdir
@@ -0,0 +1,67 @@
+"""Transformers and catalog helpers used to build test dataset graphs
+
+Serialized pipelines refer to these functions by module, so they live
+here rather than in the test modules that use them.
+"""
+from collections import Counter
+from functools import partial
+
+import numpy as np
+
+from src.data import Catalog, Dataset, serialize_transformer_pipeline, streaming_transformer
+
+
+CALL_COUNTS = Counter()
+BROKEN = set()
+N_JOBS = {}
+
+
+def make_range(dsdict, *, dataset_name, n=10):
+    return {dataset_name: Dataset(dataset_name, data=np.arange(n))}
+
+def add_inputs(dsdict, *, dataset_name):
+    data = sum(ds.data for ds in dsdict.values())
+    return {dataset_name: Dataset(dataset_name, data=data)}
+
+def scale_inputs(dsdict, *, dataset_name, factor=1):
+    CALL_COUNTS[dataset_name] += 1
+    data = factor * sum(ds.data for ds in dsdict.values())
+    return {dataset_name: Dataset(dataset_name, data=data)}
+
+def always_fails(dsdict, **kwargs):
+    raise RuntimeError("transformer failure")
+
+def counted_range(dsdict, *, dataset_name, n=10):
+    CALL_COUNTS[dataset_name] += 1
+    return make_range(dsdict, dataset_name=dataset_name, n=n)
+
+def slow_range(dsdict, *, dataset_name, n=10):
+    import time
+    time.sleep(0.5)
+    return counted_range(dsdict, dataset_name=dataset_name, n=n)
+
+def fails_while_broken(dsdict, *, dataset_name):
+    if dataset_name in BROKEN:
+        raise RuntimeError(f"{dataset_name} is broken")
+    return add_inputs(dsdict, dataset_name=dataset_name)
+
+def record_n_jobs(dsdict, *, dataset_name, n=10):
+    from src.data import n_jobs
+    N_JOBS[dataset_name] = n_jobs()
+    return make_range(dsdict, dataset_name=dataset_name, n=n)
+
+@streaming_transformer
+def stream_affine(chunks, *, input_dataset, output_dataset, factor=1, offset=0):
+    for chunk_dict in chunks:
+        yield {output_dataset: Dataset(output_dataset, data=factor * chunk_dict[input_dataset].data + offset)}
+
+
+def add_transformers(catalog_path, transformers):
+    """Write transformer catalog entries to a test catalog"""
+    c = Catalog.load('transformers', catalog_path=catalog_path)
+    for name, entry in transformers.items():
+        c[name] = entry
+    return c
+
+def pipeline(func, **kwargs):
+    return serialize_transformer_pipeline([partial(func, **kwargs)])
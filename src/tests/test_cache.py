@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+
+from src.data import Dataset, DatasetGraph
+from src.tests.dag_helpers import CALL_COUNTS, add_inputs, add_transformers, counted_range, pipeline
+
+
+def test_default_build_cache(tmpdir, monkeypatch):
+    # the build cache is opt-in
+    monkeypatch.delenv('EASYDATA_BUILD_CACHE', raising=False)
+    add_transformers(tmpdir, {'_a': {'output_datasets': ['a']}})
+    assert DatasetGraph(catalog_path=tmpdir).build_cache is None
+    monkeypatch.setenv('EASYDATA_BUILD_CACHE', str(tmpdir / 'build_cache'))
+    dag = DatasetGraph(catalog_path=tmpdir)
+    assert dag.build_cache.cache_path == tmpdir / 'build_cache'
+    assert DatasetGraph(catalog_path=tmpdir, build_cache=False).build_cache is None
+    assert dag._constructor_opts()['build_cache'] == dag.build_cache
+
+def test_build_cache(tmpdir):
+    from src.data import BuildCache
+    add_transformers(tmpdir, {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(counted_range, dataset_name='a')},
+        'x': {'input_datasets': ['a'], 'output_datasets': ['x'],
+              'transformations': pipeline(add_inputs, dataset_name='x')},
+    })
+    cache = BuildCache(tmpdir / 'build_cache')
+    CALL_COUNTS.clear()
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'run1', build_cache=cache)
+    dag.generate('x', overwrite_catalog=True)
+    assert CALL_COUNTS['a'] == 1
+    assert dag._build_cache_key('x') in cache
+
+    # A fresh output location: everything is restored from the cache
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'run2', build_cache=cache)
+    dsdict = dag.generate('x')
+    assert CALL_COUNTS['a'] == 1
+    assert np.array_equal(dsdict['x'].data, np.arange(10))
+    assert (tmpdir / 'run2' / 'a.dataset').exists()
+
+    # Changing an edge's transformations invalidates its entry
+    add_transformers(tmpdir, {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(counted_range, dataset_name='a', n=4)},
+    })
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'run3', build_cache=cache)
+    dsdict = dag.generate('x', overwrite_catalog=True)
+    assert CALL_COUNTS['a'] == 2
+    assert np.array_equal(dsdict['x'].data, np.arange(4))
+
+def test_remote_cache(join_catalog):
+    from src.data import RemoteCache
+    remote = RemoteCache(f'memory://easydata-test/{join_catalog.basename}')
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed',
+                       remote_cache=remote)
+    dag.generate('abc', overwrite_catalog=True)
+    assert ('abc', dag.datasets['abc']['hashes']) in remote
+
+    # another user, with the same catalog, downloads rather than regenerates
+    other = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'other',
+                         remote_cache=remote)
+    assert list(other.plan('abc')) == ['join']
+    # planning only checks the remote cache; inputs are downloaded when loaded
+    assert not (join_catalog / 'other').exists()
+    assert np.array_equal(other.generate('abc')['abc'].data, 3 * np.arange(5))
+    assert (join_catalog / 'other' / 'a.dataset').exists()
+
+    ds = Dataset.load('abc', catalog_path=join_catalog, dataset_cache_path=join_catalog / 'third',
+                      remote_cache=remote)
+    assert np.array_equal(ds.data, 3 * np.arange(5))
+    assert sorted(os.listdir(join_catalog / 'third')) == ['abc.dataset', 'abc.metadata']
+    # entries that don't match the catalog hashes are never used
+    assert not remote.get('abc', {'data': 'sha1:0'}, join_catalog / 'fourth')
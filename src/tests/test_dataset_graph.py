@@ -0,0 +1,199 @@
+import os
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from src.data import Catalog, Dataset, DatasetGraph
+from src.exceptions import NotFoundError
+from src.tests.dag_helpers import (CALL_COUNTS, add_inputs, add_transformers, counted_range, make_range, pipeline,
+                                   scale_inputs)
+
+
+def test_adjacency(diamond_catalog):
+    dag = DatasetGraph(catalog_path=diamond_catalog)
+
+    assert dag.nodes == {'a', 'b', 'ab', 'ab_train', 'ab_test'}
+    assert dag.edges == {'_a', '_b', 'join', 'split'}
+    assert set(dag.sources) == {'a', 'b'}
+    assert set(dag.sinks) == {'ab_train', 'ab_test'}
+
+    assert dag.find_child('ab_test') == ({'ab'}, 'split', {'ab_train', 'ab_test'})
+    assert dag.find_child('a') == (set(), '_a', {'a'})
+    assert dag.find_consumers('a') == {'join'}
+    assert dag.find_consumers('ab_test') == set()
+    with pytest.raises(NotFoundError):
+        dag.find_child('missing')
+
+def test_add_edge_updates_adjacency(diamond_catalog):
+    dag = DatasetGraph(catalog_path=diamond_catalog)
+    dag.datasets['ab_train_scaled'] = {'dataset_name': 'ab_train_scaled'}
+    dag.add_edge(input_dataset='ab_train', output_dataset='ab_train_scaled',
+                 edge_name='scale', generate=False)
+    assert 'ab_train_scaled' in dag.nodes
+    assert dag.find_consumers('ab_train') == {'scale'}
+    assert 'ab_train' not in dag.sinks
+    assert 'ab_train_scaled' in dag.sinks
+
+def test_traverse_exhaustive(diamond_catalog):
+    dag = DatasetGraph(catalog_path=diamond_catalog)
+    nodes, edges = dag.traverse('ab_train', exhaustive=True)
+    assert set(nodes) == {'a', 'b', 'ab', 'ab_train'}
+    assert edges[-1] == 'split'
+    assert set(edges) == {'_a', '_b', 'join', 'split'}
+
+def test_traverse_long_chain(tmpdir):
+    n_edges = 2000
+    transformers = {'_n0': {'output_datasets': ['n0']}}
+    for i in range(1, n_edges):
+        transformers[f'_n{i}'] = {'input_datasets': [f'n{i-1}'], 'output_datasets': [f'n{i}']}
+    add_transformers(tmpdir, transformers)
+
+    dag = DatasetGraph(catalog_path=tmpdir)
+    assert len(dag.nodes) == n_edges
+    assert dag.sources == ['n0']
+    assert dag.sinks == [f'n{n_edges-1}']
+    nodes, edges = dag.traverse(f'n{n_edges-1}', exhaustive=True)
+    assert len(edges) == n_edges
+    assert edges[0] == '_n0'
+
+def test_generate_many_shares_ancestors(tmpdir):
+    add_transformers(tmpdir, {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(counted_range, dataset_name='a')},
+        'x': {'input_datasets': ['a'], 'output_datasets': ['x'],
+              'transformations': pipeline(add_inputs, dataset_name='x')},
+        'y': {'input_datasets': ['a'], 'output_datasets': ['y'],
+              'transformations': pipeline(add_inputs, dataset_name='y')},
+        'xy': {'input_datasets': ['x', 'y'], 'output_datasets': ['xy'],
+               'transformations': pipeline(add_inputs, dataset_name='xy')},
+    })
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'processed')
+    CALL_COUNTS.clear()
+    generated = dag.generate_many(['x', 'y', 'xy', 'x'])
+    assert CALL_COUNTS['a'] == 1
+    assert set(generated) == {'x', 'y', 'xy'}
+    assert np.array_equal(generated['xy'].data, 2 * np.arange(10))
+    assert dag.is_cached('xy')
+
+def test_generate_hands_off_in_memory(join_catalog):
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    dsdict = dag.generate('abc', write_datasets=False)
+    assert np.array_equal(dsdict['abc'].data, 3 * np.arange(5))
+    assert not (join_catalog / 'processed' / 'a.dataset').exists()
+
+@pytest.mark.parametrize('executor', ['serial', 'process'])
+def test_ephemeral_datasets(tmpdir, executor):
+    add_transformers(tmpdir, {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(make_range, dataset_name='a')},
+        'mid': {'input_datasets': ['a'], 'output_datasets': ['mid'], 'ephemeral_datasets': ['mid'],
+                'transformations': pipeline(add_inputs, dataset_name='mid')},
+        'out': {'input_datasets': ['mid'], 'output_datasets': ['out'],
+                'transformations': pipeline(add_inputs, dataset_name='out')},
+    })
+    processed = tmpdir / 'processed'
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=processed)
+    assert dag.is_ephemeral('mid')
+    dsdict = dag.generate('out', overwrite_catalog=True, executor=executor)
+    assert np.array_equal(dsdict['out'].data, np.arange(10))
+    assert not (processed / 'mid.dataset').exists()
+    assert (processed / 'out.dataset').exists()
+    assert dag.datasets['mid']['hashes']
+
+    dag.set_ephemeral('mid', False)
+    assert 'ephemeral_datasets' not in dag.transformers['mid']
+    dag.generate('out', overwrite_catalog=True)
+    assert (processed / 'mid.dataset').exists()
+
+def test_satisfaction_checks_are_memoized(tmpdir, monkeypatch):
+    n_consumers = 20
+    transformers = {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(make_range, dataset_name='a')},
+        '_b': {'output_datasets': ['b'], 'transformations': pipeline(make_range, dataset_name='b')},
+    }
+    for i in range(n_consumers):
+        transformers[f'c{i}'] = {'input_datasets': ['a', 'b'], 'output_datasets': [f'c{i}'],
+                                 'transformations': pipeline(add_inputs, dataset_name=f'c{i}')}
+    add_transformers(tmpdir, transformers)
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'processed')
+    dag.generate_many(['a', 'b'])
+
+    metadata_reads = Counter()
+    from_disk = Dataset.from_disk.__func__
+
+    def counting_from_disk(cls, dataset_name, *args, **kwargs):
+        if kwargs.get('metadata_only'):
+            metadata_reads[dataset_name] += 1
+        return from_disk(cls, dataset_name, *args, **kwargs)
+    monkeypatch.setattr(Dataset, 'from_disk', classmethod(counting_from_disk))
+
+    consumers = [f'c{i}' for i in range(n_consumers)]
+    _, edges = dag.traverse(consumers)
+    assert set(edges) == set(consumers)
+    assert metadata_reads == {'a': 1, 'b': 1}
+
+    # the cache only lives for the duration of a traversal
+    metadata_reads.clear()
+    dag.traverse('c0')
+    assert metadata_reads == {'a': 1, 'b': 1}
+
+    metadata_reads.clear()
+    generated = dag.generate_many(consumers)
+    assert len(generated) == n_consumers
+    assert metadata_reads == {'a': 1, 'b': 1}
+
+def test_process_edge_does_not_rescan(join_catalog, monkeypatch):
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    catalog_loads = Counter()
+    load = Catalog.load.__func__
+
+    def counting_load(cls, catalog_name, *args, **kwargs):
+        catalog_loads[catalog_name] += 1
+        return load(cls, catalog_name, *args, **kwargs)
+    monkeypatch.setattr(Catalog, 'load', classmethod(counting_load))
+    monkeypatch.setattr('src.data.datasets.processed_datasets', None)
+
+    dsdict = dag.generate('abc', overwrite_catalog=True)
+    assert np.array_equal(dsdict['abc'].data, 3 * np.arange(5))
+    assert not catalog_loads
+    # catalog entries were still written to disk
+    on_disk = Catalog.load('datasets', catalog_path=join_catalog)
+    assert on_disk['abc']['hashes'] == dag.datasets['abc']['hashes']
+    assert dag.is_cached('abc')
+
+def test_rebuild_outdated(tmpdir):
+    add_transformers(tmpdir, {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(counted_range, dataset_name='a')},
+        'x': {'input_datasets': ['a'], 'output_datasets': ['x'],
+              'transformations': pipeline(scale_inputs, dataset_name='x')},
+        'y': {'input_datasets': ['x'], 'output_datasets': ['y'],
+              'transformations': pipeline(scale_inputs, dataset_name='y')},
+        'z': {'input_datasets': ['a'], 'output_datasets': ['z'],
+              'transformations': pipeline(scale_inputs, dataset_name='z')},
+    })
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'processed')
+    # bookkeeping catalogs are only created once written to
+    assert not (tmpdir / 'fingerprints').exists() and not (tmpdir / 'edge_stats').exists()
+    order = dag.toposort()
+    assert order[0] == '_a' and order.index('x') < order.index('y')
+    dag.generate_many(['y', 'z'], overwrite_catalog=True)
+    assert dag.outdated() == []
+
+    # outputs written before fingerprints were recorded are regenerated once
+    os.remove(tmpdir / 'fingerprints' / 'z.json')
+    assert dag.outdated() == ['z']
+    assert dag.rebuild_outdated() == ['z']
+    assert dag.outdated() == []
+
+    add_transformers(tmpdir, {
+        'x': {'input_datasets': ['a'], 'output_datasets': ['x'],
+              'transformations': pipeline(scale_inputs, dataset_name='x', factor=2)},
+    })
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'processed')
+    assert dag.outdated() == ['x', 'y']
+
+    CALL_COUNTS.clear()
+    assert dag.rebuild_outdated() == ['x', 'y']
+    assert CALL_COUNTS == {'x': 1, 'y': 1}
+    assert dag.outdated() == []
+    y = Dataset.from_disk('y', data_path=tmpdir / 'processed', catalog_path=tmpdir)
+    assert np.array_equal(y.data, 2 * np.arange(10))
@@ -0,0 +1,265 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from src.data import Catalog, Dataset, DatasetGraph
+from src.tests.dag_helpers import (N_JOBS, add_inputs, add_transformers, counted_range, make_range, pipeline,
+                                   record_n_jobs, scale_inputs, stream_affine)
+
+
+@pytest.mark.parametrize('executor', ['serial', 'thread', 'process'])
+def test_generate_executors(join_catalog, executor):
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    dsdict = dag.generate('abc', executor=executor, max_workers=3, overwrite_catalog=True)
+    assert np.array_equal(dsdict['abc'].data, 3 * np.arange(5))
+    for name in ['a', 'b', 'c', 'abc']:
+        assert (join_catalog / 'processed' / f'{name}.dataset').exists()
+        assert dag.datasets[name]['hashes']
+
+def test_executor_cancels_downstream_only(join_catalog):
+    from src.data import DAGExecutor
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    executor = DAGExecutor(kind='thread', max_workers=2)
+    results = executor.run(dag, ['_a', '_broken', 'broken_join', '_b'])
+    assert set(results) == {'_a', '_b'}
+    assert set(executor.failed_) == {'_broken'}
+    assert executor.cancelled_ == {'broken_join'}
+
+def test_execution_plan(join_catalog):
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    dag.generate('a', overwrite_catalog=True)
+    plan = dag.plan('abc')
+    assert plan.edges in (['_b', '_c', 'join'], ['_c', '_b', 'join'])
+    assert '_a' not in plan
+    assert plan.reasons['join'] == [('requested', 'abc')]
+    assert plan.reasons['_b'] == [('missing', 'b')]
+    report = plan.explain()
+    assert "requested 'abc'" in report and "missing 'c'" in report
+
+    plan = dag.plan('abc', exhaustive=True)
+    assert plan.reasons['_a'] == [('forced', 'a')]
+    assert plan.edges[-1] == 'join'
+
+def test_execution_plan_diamond(tmpdir):
+    add_transformers(tmpdir, {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(counted_range, dataset_name='a')},
+        'x': {'input_datasets': ['a'], 'output_datasets': ['x'],
+              'transformations': pipeline(add_inputs, dataset_name='x')},
+        'y': {'input_datasets': ['a'], 'output_datasets': ['y'],
+              'transformations': pipeline(add_inputs, dataset_name='y')},
+        'xy': {'input_datasets': ['x', 'y'], 'output_datasets': ['xy'],
+               'transformations': pipeline(add_inputs, dataset_name='xy')},
+    })
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'processed')
+    plan = dag.plan('xy')
+    assert plan.edges == ['_a', 'x', 'y', 'xy']
+    assert plan.reasons['_a'] == [('missing', 'a')]
+
+def test_edge_stats_and_cost_estimates(tmpdir):
+    add_transformers(tmpdir, {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(make_range, dataset_name='a')},
+        'x': {'input_datasets': ['a'], 'output_datasets': ['x'],
+              'transformations': pipeline(add_inputs, dataset_name='x')},
+        'y': {'input_datasets': ['a'], 'output_datasets': ['y'],
+              'transformations': pipeline(add_inputs, dataset_name='y')},
+        'xy': {'input_datasets': ['x', 'y'], 'output_datasets': ['xy'],
+               'transformations': pipeline(add_inputs, dataset_name='xy')},
+    })
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'processed')
+    dag.generate('xy', overwrite_catalog=True, executor='thread')
+    stats = Catalog.load('edge_stats', catalog_path=tmpdir)
+    assert set(stats) == {'_a', 'x', 'y', 'xy'}
+    assert stats['x']['wall_time'] > 0
+    assert stats['x']['output_bytes'] > 0
+
+    for edge, wall_time in {'_a': 1.0, 'x': 5.0, 'y': 2.0}.items():
+        dag.edge_stats[edge] = {'wall_time': wall_time}
+    del dag.edge_stats['xy']
+    plan = dag.plan('xy', exhaustive=True)
+    assert plan.costs['xy'] == pytest.approx(8 / 3)  # mean of the known costs
+    assert plan.total_time() == pytest.approx(8 + 8 / 3)
+    assert plan.critical_path() == (['_a', 'x', 'xy'], pytest.approx(6 + 8 / 3))
+    assert plan.estimated_time(max_workers=1) == pytest.approx(plan.total_time())
+    assert plan.estimated_time(max_workers=2) == pytest.approx(6 + 8 / 3)
+    assert '1 edge(s) have no recorded statistics' in plan.explain(max_workers=2)
+
+def test_input_prefetch(join_catalog, monkeypatch):
+    import threading
+    import time
+    from src.data import ParallelismBudget
+    add_transformers(join_catalog, {
+        'a2': {'input_datasets': ['a'], 'output_datasets': ['a2'],
+               'transformations': pipeline(scale_inputs, dataset_name='a2', factor=2)},
+        'b2': {'input_datasets': ['b'], 'output_datasets': ['b2'],
+               'transformations': pipeline(scale_inputs, dataset_name='b2', factor=2)},
+    })
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    dag.generate_many(['a', 'b', 'c'], overwrite_catalog=True)
+    loaded_by = {}
+    load_input = DatasetGraph._load_input
+
+    def recording_load(self, ds_name, dataset_path):
+        loaded_by[ds_name] = threading.current_thread().name
+        time.sleep(0.05)
+        return load_input(self, ds_name, dataset_path)
+    monkeypatch.setattr(DatasetGraph, '_load_input', recording_load)
+
+    # the inputs of an edge are loaded concurrently
+    assert np.array_equal(dag.process_edge('join')['abc'].data, 3 * np.arange(5))
+    assert all(name.startswith('process_edge-load') for name in loaded_by.values())
+
+    # a failed load is raised as is
+
+    def failing_load(self, ds_name, dataset_path):
+        if ds_name == 'b':
+            raise OSError("unreadable")
+        return load_input(self, ds_name, dataset_path)
+    monkeypatch.setattr(DatasetGraph, '_load_input', failing_load)
+    with pytest.raises(OSError, match="unreadable"):
+        dag.process_edge('join')
+    monkeypatch.setattr(DatasetGraph, '_load_input', recording_load)
+
+    # within the parallelism budget
+    loaded_by.clear()
+    with ParallelismBudget(threads=1):
+        dag.process_edge('join')
+    assert len(set(loaded_by.values())) == 1
+
+    # the inputs of the next edge are loaded while the current one is processed
+    loaded_by.clear()
+    generated = dag.generate_many(['a2', 'b2'], overwrite_catalog=True)
+    assert np.array_equal(generated['b2'].data, 2 * np.arange(5))
+    assert loaded_by['b'].startswith('DAGExecutor-prefetch')
+
+def test_edge_peak_memory(tmpdir):
+    from src.utils import current_memory
+    if current_memory() is None:
+        pytest.skip("resident memory can't be measured on this platform")
+    add_transformers(tmpdir, {
+        '_big': {'output_datasets': ['big'], 'transformations': pipeline(make_range, dataset_name='big', n=4 * 1024 ** 2)},
+        '_small': {'output_datasets': ['small'], 'transformations': pipeline(make_range, dataset_name='small', n=5)},
+    })
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'processed')
+    dag.generate('big', overwrite_catalog=True)
+    dag.generate('small', overwrite_catalog=True)
+    # each edge records its own peak, not the process's high-water mark
+    assert dag.edge_stats['_big']['peak_memory'] >= 32 * 1024 ** 2
+    assert dag.edge_stats['_small']['peak_memory'] < 32 * 1024 ** 2
+    # and memory estimates use it
+    plan = dag.plan(['big', 'small'], exhaustive=True)
+    assert plan.memory['_big'] == dag.edge_stats['_big']['peak_memory']
+
+def test_memory_budget(join_catalog, monkeypatch):
+    import threading
+    import time
+    from src.data import DAGExecutor
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    for edge, size in [('_a', 400), ('_b', 100), ('_c', 100)]:
+        dag.edge_stats[edge] = {'wall_time': 1.0, 'output_bytes': size}
+    plan = dag.plan(['a', 'b', 'c'])
+    assert plan.memory == {'_a': 800, '_b': 200, '_c': 200}
+
+    running, overlaps = set(), []
+    lock = threading.Lock()
+    process_edge = DatasetGraph.process_edge
+
+    def tracking_process_edge(self, edge_name, *args, **kwargs):
+        with lock:
+            overlaps.append((edge_name, set(running)))
+            running.add(edge_name)
+        time.sleep(0.1)
+        try:
+            return process_edge(self, edge_name, *args, **kwargs)
+        finally:
+            with lock:
+                running.discard(edge_name)
+    monkeypatch.setattr(DatasetGraph, 'process_edge', tracking_process_edge)
+
+    # '_a' needs more than half the budget, so runs on its own
+    executor = DAGExecutor('thread', max_workers=3, memory_budget=1000)
+    results = executor.run(dag, plan)
+    assert set(results) == {'_a', '_b', '_c'}
+    assert all(not others for edge, others in overlaps if edge == '_a')
+    assert all('_a' not in others for _, others in overlaps)
+
+def test_parallelism_budget(tmpdir):
+    from src.data import DAGExecutor, ParallelismBudget, n_jobs
+    add_transformers(tmpdir, {
+        f'_{name}': {'output_datasets': [name], 'transformations': pipeline(record_n_jobs, dataset_name=name)}
+        for name in 'xyz'})
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'processed')
+    with ParallelismBudget(threads=4):
+        assert n_jobs() == 4
+        DAGExecutor('thread', max_workers=2).run(dag, ['_x', '_y', '_z'])
+        assert N_JOBS == {'x': 2, 'y': 2, 'z': 2}
+        DAGExecutor('serial').run(dag, ['_x'])
+        assert N_JOBS['x'] == 4
+        assert n_jobs() == 4
+    with pytest.raises(ValueError):
+        ParallelismBudget(threads=0)
+
+def test_distributed_executor(join_catalog):
+    from src.data import DAGExecutor, LocalCluster, Metrics
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    with LocalCluster(n_workers=2) as cluster, Metrics() as metrics:
+        executor = DAGExecutor('distributed', coordinator=cluster)
+        dsdict = dag.generate('abc', overwrite_catalog=True, executor=executor)
+        assert executor.completed_ == {'_a', '_b', '_c', 'join'}
+        with pytest.raises(RuntimeError):
+            dag.generate('a_broken', executor=executor)
+        assert executor.cancelled_ == {'broken_join'}
+    assert np.array_equal(dsdict['abc'].data, 3 * np.arange(5))
+    assert dag.is_cached('abc')
+    # telemetry from the workers is merged
+    assert metrics.get('easydata_edge_runs_total', edge='join', status='ok') == 1
+    with pytest.raises(ValueError):
+        DAGExecutor('distributed')
+
+def test_streaming_chain(tmpdir):
+    from src.data import DAGExecutor
+    add_transformers(tmpdir, {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(make_range, dataset_name='a', n=25)},
+        'scale': {'input_datasets': ['a'], 'output_datasets': ['scaled'],
+                  'transformations': pipeline(stream_affine, input_dataset='a', output_dataset='scaled', factor=2)},
+        'shift': {'input_datasets': ['scaled'], 'output_datasets': ['shifted'],
+                  'transformations': pipeline(stream_affine, input_dataset='scaled', output_dataset='shifted', offset=1)},
+    })
+    processed = tmpdir / 'processed'
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=processed)
+    assert not dag.is_streaming('_a') and dag.is_streaming('shift')
+    plan = dag.plan('shifted')
+    assert dag.streaming_chains(plan) == [['_a'], ['scale', 'shift']]
+    assert dag.streaming_chains(plan, keep=['scale']) == [['_a'], ['scale'], ['shift']]
+
+    executor = DAGExecutor('streaming', chunk_size=10)
+    dsdict = dag.generate('shifted', overwrite_catalog=True, executor=executor)
+    assert executor.completed_ == {'_a', 'scale', 'shift'}
+    assert np.array_equal(dsdict['shifted'].data, 2 * np.arange(25) + 1)
+    assert sorted(os.listdir(processed / 'shifted.chunks')) == ['000000.dataset', '000001.dataset', '000002.dataset']
+    assert not (processed / 'shifted.dataset').exists()
+    assert dag.datasets['shifted']['chunks'] == 3 and dag.is_cached('scaled')
+
+    ds = Dataset.from_disk('shifted', data_path=processed, catalog_path=tmpdir)
+    assert np.array_equal(ds.data, 2 * np.arange(25) + 1)
+    assert not dag.outdated()
+    # a streaming edge can also be processed on its own, reading its input chunk by chunk
+    assert np.array_equal(dag.process_edge('shift')['shifted'].data, ds.data)
+
+    # each edge of a chain is journalled once its outputs are on disk
+    from src.data import RunJournal
+    journal = RunJournal(dag, tmpdir / 'journal')
+    journal.start(['scale', 'shift'])
+    DAGExecutor('streaming', chunk_size=10).run(dag, ['scale', 'shift'], journal=journal,
+                                                write_dataset=True, overwrite_catalog=True)
+    assert sorted(journal.completed) == ['scale', 'shift']
+    assert journal.completed['scale']['outputs'] == {'scaled': dag.datasets['scaled']['hashes']}
+
+    # hashes don't depend on chunking: a serial rebuild (with the default chunk size) matches the catalog
+    hashes = {name: dag.datasets[name]['hashes'] for name in ('scaled', 'shifted')}
+    shutil.rmtree(processed)
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=processed)
+    assert np.array_equal(dag.generate('shifted')['shifted'].data, 2 * np.arange(25) + 1)
+    assert {name: Dataset.from_disk(name, data_path=processed, catalog_path=tmpdir).metadata['hashes']
+            for name in ('scaled', 'shifted')} == hashes
@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+
+from src.data import Dataset, DatasetGraph
+
+
+def test_garbage_collector(join_catalog, monkeypatch):
+    import time
+    from src.data import GarbageCollector
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    dag.generate('abc', overwrite_catalog=True)
+    Dataset('stale', data=np.arange(1000)).dump(dump_path=join_catalog / 'processed', update_catalog=False)
+    notebooks = join_catalog / 'interim' / 'notebooks' / 'executed'
+    os.makedirs(notebooks)
+    (notebooks / 'old.ipynb').write_text('x' * 10000, encoding='utf-8')
+    # a root nested in another: only the nested root itself is left to its own label
+    os.makedirs(join_catalog / 'interim' / 'cache' / 'build' / 'entry')
+    (join_catalog / 'interim' / 'cache' / 'build' / 'entry' / 'out.dataset').write_text('x' * 100, encoding='utf-8')
+    (join_catalog / 'interim' / 'cache' / 'other.pkl').write_text('x' * 10, encoding='utf-8')
+    long_ago = time.time() - 86400
+    for dirpath, dirs, files in os.walk(join_catalog):
+        for name in files + dirs:
+            os.utime(os.path.join(dirpath, name), (long_ago, long_ago))
+
+    gc = GarbageCollector(roots={'processed': join_catalog / 'processed', 'interim': join_catalog / 'interim',
+                                 'build_cache': join_catalog / 'interim' / 'cache' / 'build'},
+                          catalog_path=join_catalog, index_path=join_catalog / 'gc_index.json')
+    artifacts = {a['path'].name: a for a in gc.scan()}
+    assert artifacts['abc']['referenced'] and not artifacts['stale']['referenced']
+    assert artifacts['notebooks']['size'] == 10000
+    assert (artifacts['other.pkl']['root'], artifacts['entry']['root']) == ('interim', 'build_cache')
+    assert 'cache' not in artifacts and 'build' not in artifacts
+    assert gc.reclaimable() == artifacts['stale']['size'] + 10000 + 10 + 100
+    assert 'Reclaimable' in gc.report()
+
+    # unchanged directories are not re-read
+    scanned = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda path: scanned.append(str(path)) or scandir(path))
+    gc.scan()
+    assert str(notebooks) not in scanned
+    monkeypatch.undo()
+
+    used = sum(a['size'] for a in artifacts.values())
+    evicted = gc.collect(budget=used - 1)
+    assert [a['path'].name for a in evicted] in (['stale'], ['notebooks'], ['other.pkl'], ['entry'])
+    gc.collect(budget=0)
+    # referenced datasets are kept
+    assert sorted(os.listdir(join_catalog / 'processed')) == sorted(f'{name}.{suffix}' for name in ['a', 'b', 'c', 'abc']
+                                                                    for suffix in ['dataset', 'metadata'])
+    assert not notebooks.exists()
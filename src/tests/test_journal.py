@@ -0,0 +1,147 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.data import Dataset, DatasetGraph
+from src.tests.dag_helpers import (BROKEN, CALL_COUNTS, add_transformers, counted_range, fails_while_broken,
+                                   pipeline, scale_inputs, slow_range)
+
+
+def test_generate_resume(tmpdir, monkeypatch):
+    add_transformers(tmpdir, {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(counted_range, dataset_name='a', n=5)},
+        'scale': {'input_datasets': ['a'], 'output_datasets': ['scaled'],
+                  'transformations': pipeline(scale_inputs, dataset_name='scaled', factor=2)},
+        'final': {'input_datasets': ['scaled'], 'output_datasets': ['final'],
+                  'transformations': pipeline(fails_while_broken, dataset_name='final')},
+    })
+    CALL_COUNTS.clear()
+    BROKEN.add('final')
+    dag = DatasetGraph(catalog_path=tmpdir, dataset_cache_path=tmpdir / 'processed')
+    with pytest.raises(RuntimeError):
+        dag.generate('final', overwrite_catalog=True)
+    journals = os.listdir(tmpdir / 'processed' / '.journals')
+    assert len(journals) == 1
+    assert sorted(os.listdir(tmpdir / 'processed' / '.journals' / journals[0] / 'completed')) == ['_a.json', 'scale.json']
+
+    # the resumed run neither re-plans nor re-runs completed edges
+    BROKEN.clear()
+    monkeypatch.setattr(dag, 'plan', lambda *args, **kwargs: pytest.fail("re-planned"))
+    ds = dag.generate('final', overwrite_catalog=True, resume=True)['final']
+    assert np.array_equal(ds.data, 2 * np.arange(5))
+    assert CALL_COUNTS == {'a': 1, 'scaled': 1}
+    assert not (tmpdir / 'processed' / '.journals').exists()
+
+def test_journal_expiry(join_catalog):
+    import time
+    from src.data import RunJournal
+    from src.data.journal import JOURNAL_MAX_AGE
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    journals = join_catalog / 'processed' / '.journals'
+    active = RunJournal.for_run(dag, ['abc'])
+    active.start(['_a', '_b', '_c', 'join'])
+    abandoned = journals / 'abandoned'
+    os.makedirs(abandoned / 'completed')
+    (abandoned / 'plan.json').write_text('{}', encoding='utf-8')
+    long_ago = time.time() - JOURNAL_MAX_AGE - 1
+    for path in (abandoned, abandoned / 'plan.json', abandoned / 'completed'):
+        os.utime(path, (long_ago, long_ago))
+
+    # journals of abandoned runs are expired when another run starts
+    other_run = RunJournal.for_run(dag, ['a'])
+    other_run.start(['_a'])
+    assert sorted(os.listdir(journals)) == sorted([active.path.name, other_run.path.name])
+
+def test_write_behind(join_catalog, monkeypatch):
+    import time
+    from src.data import RunJournal
+    from src.exceptions import EasydataError
+    processed = join_catalog / 'processed'
+    dump = Dataset.dump
+
+    def slow_dump(self, *args, **kwargs):
+        time.sleep(0.1)
+        if self.name == 'abc' and FAIL_WRITES:
+            raise OSError("disk full")
+        return dump(self, *args, **kwargs)
+    monkeypatch.setattr(Dataset, 'dump', slow_dump)
+    FAIL_WRITES = False
+
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=processed, write_behind=True)
+    dag.generate('c', overwrite_catalog=True)
+    assert (processed / 'c.dataset').exists() and not dag.write_behind.pending()
+
+    # 'join' reads its inputs from disk, so waits for them to be written
+    dag.process_edge('_a', overwrite_catalog=True)
+    dag.process_edge('_b', overwrite_catalog=True)
+    assert dag.write_behind.pending()
+    dsdict = dag.process_edge('join', overwrite_catalog=True)
+    assert np.array_equal(dsdict['abc'].data, 3 * np.arange(5))
+    dag.flush()
+
+    FAIL_WRITES = True
+    with pytest.raises(EasydataError, match="disk full"):
+        dag.generate('abc', exhaustive=True, overwrite_catalog=True)
+    # the run journal only records edges once their outputs are on disk
+    journal = RunJournal.for_run(dag, ['abc'], exhaustive=True, overwrite_catalog=True)
+    assert set(journal.completed) == {'_a', '_b', '_c'}
+
+def test_edge_leases(join_catalog, caplog):
+    import threading
+    import time
+    from src.data import Lease, RunLog
+    processed = join_catalog / 'processed'
+    DatasetGraph(catalog_path=join_catalog, dataset_cache_path=processed).generate('abc', overwrite_catalog=True)
+    for path in processed.listdir('a.*') + processed.listdir('abc.*'):
+        path.remove()
+
+    # another process is generating 'a' (a shared ancestor) when we need it
+    lease = Lease(processed / '.leases' / '_a.edge.lease', poll_interval=0.05)
+    lease.acquire()
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=processed, leases=True)
+    with RunLog(join_catalog / 'runlog.jsonl') as runlog:
+        waiting = threading.Thread(target=dag.generate, args=('abc',))
+        waiting.start()
+        while waiting.is_alive() and 'Waiting for' not in caplog.text:
+            time.sleep(0.01)
+        DatasetGraph(catalog_path=join_catalog, dataset_cache_path=processed).process_edge('_a')
+        lease.release()
+        waiting.join()
+    assert (processed / 'abc.dataset').exists()
+    # once it has the lease, the waiting run loads 'a' rather than regenerating it
+    edges = runlog.records(run_id=True, stage='process_edge', name='_a')
+    assert [edge.get('lease') for edge in edges] == [None, 'reused']
+    assert not os.listdir(processed / '.leases')
+
+def test_load_single_flight(tmpdir):
+    import json
+    import socket
+    import subprocess
+    import sys
+    import threading
+    add_transformers(tmpdir, {
+        '_slow': {'output_datasets': ['slow'], 'transformations': pipeline(slow_range, dataset_name='slow', n=5)},
+    })
+    DatasetGraph(catalog_path=tmpdir)  # add placeholder catalog entries
+    CALL_COUNTS.clear()
+    kwargs = {'catalog_path': tmpdir, 'dataset_cache_path': tmpdir / 'processed'}
+    loaded = []
+    threads = [threading.Thread(target=lambda: loaded.append(Dataset.load('slow', **kwargs))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loaded) == 3 and all(np.array_equal(ds.data, np.arange(5)) for ds in loaded)
+    assert CALL_COUNTS['slow'] == 1
+    assert not (tmpdir / 'processed' / '.leases' / 'slow.lease').exists()
+
+    # a lease left behind by a process that died is broken
+    os.remove(tmpdir / 'processed' / 'slow.dataset')
+    os.remove(tmpdir / 'processed' / 'slow.metadata')
+    dead = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    (tmpdir / 'processed' / '.leases' / 'slow.lease').write_text(
+        json.dumps({'host': socket.gethostname(), 'pid': int(dead.stdout), 'token': 'x', 'acquired': 0}),
+        encoding='utf-8')
+    assert np.array_equal(Dataset.load('slow', **kwargs).data, np.arange(5))
+    assert CALL_COUNTS['slow'] == 2
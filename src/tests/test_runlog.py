@@ -0,0 +1,169 @@
+import os
+from collections import Counter
+
+import pytest
+
+from src.data import DatasetGraph
+
+
+@pytest.mark.parametrize('executor', ['serial', 'process'])
+def test_runlog(join_catalog, executor):
+    from src.data import RunLog
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    runlog = RunLog(join_catalog / 'runlog.jsonl')
+    with runlog:
+        dag.generate('abc', overwrite_catalog=True, executor=executor)
+    assert runlog.runs() == [runlog.run_id]
+    edges = runlog.records(stage='process_edge')
+    assert {record['name'] for record in edges} == {'_a', '_b', '_c', 'join'}
+    assert all(record['status'] == 'ok' and record['wall_time'] > 0 for record in edges)
+
+    summary = runlog.summary()
+    dumped = summary[('dump', 'abc')]['bytes_written']
+    assert dumped > 0
+    # I/O of nested stages is attributed to the edge
+    assert summary[('process_edge', 'join')]['bytes_written'] == dumped
+
+    with RunLog(runlog.path) as rerun:
+        dag.generate('abc', exhaustive=True, executor=executor)
+    changes = runlog.compare(runlog.run_id, run_id=rerun.run_id)
+    assert {(stage, name) for stage, name, *_ in changes} >= {('process_edge', 'join')}
+    # a process pool reads non-ephemeral inputs from disk; otherwise they're handed over in memory
+    reads = rerun.records(run_id=True, stage='from_disk')
+    assert {record['name'] for record in reads} == ({'a', 'b', 'c'} if executor == 'process' else set())
+
+@pytest.mark.parametrize('executor', ['serial', 'process'])
+def test_runlog_memory(join_catalog, executor):
+    from src.data import RunLog
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    with RunLog(join_catalog / 'runlog.jsonl') as runlog:
+        dag.generate('abc', overwrite_catalog=True, executor=executor)
+    edges = runlog.records(stage='process_edge')
+    # the edge's own peak, and the process's high-water mark (not attributed to the stage)
+    assert all('peak_memory' in record and 'process_peak_memory' in record for record in edges)
+    assert not any('memory_growth' in record for record in runlog.records())
+
+@pytest.mark.parametrize('executor', ['serial', 'process'])
+def test_runlog_write_behind(join_catalog, executor):
+    from src.data import RunLog
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed', write_behind=True)
+    with RunLog(join_catalog / 'runlog.jsonl') as runlog:
+        dag.generate('abc', overwrite_catalog=True, executor=executor)
+    # outputs written behind are still attributed to the edge that generated them
+    dump, = runlog.records(stage='dump', name='abc')
+    join, = runlog.records(stage='process_edge', name='join')
+    assert dump['bytes_written'] > 0
+    assert join['bytes_written'] == dump['bytes_written']
+    if executor != 'process':
+        assert dump['thread'] == 'easydata-write-behind'
+
+@pytest.mark.parametrize('executor', ['serial', 'process'])
+def test_runlog_threaded_loads(join_catalog, executor):
+    from src.data import RunLog
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    dag.generate_many(['a', 'b', 'c'], overwrite_catalog=True)
+    runlog_path = join_catalog / 'runlog.jsonl'
+    # inputs loaded in other threads (prefetched, or concurrently) are attributed to the edge reading them
+    with RunLog(runlog_path) as prefetched:
+        dag.generate('abc', executor=executor)
+    with RunLog(runlog_path) as concurrent:
+        dag.process_edge('join')
+    for runlog in (prefetched, concurrent):
+        reads = runlog.records(run_id=True, stage='from_disk')
+        assert {record['name'] for record in reads} == {'a', 'b', 'c'}
+        join, = runlog.records(run_id=True, stage='process_edge', name='join')
+        assert join['bytes_read'] == sum(record['bytes_read'] for record in reads) > 0
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_trace_spans(join_catalog, executor):
+    import json
+    from src.data import Tracer
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    with Tracer() as tracer:
+        dag.generate('abc', overwrite_catalog=True, executor=executor, max_workers=3)
+    trace_file = join_catalog / 'trace.json'
+    tracer.save(trace_file)
+    with open(trace_file) as fr:
+        events = json.load(fr)['traceEvents']
+    spans = [event for event in events if event['ph'] == 'X']
+    by_cat = Counter(event['cat'] for event in spans)
+    assert by_cat['generate'] == 1
+    assert by_cat['process_edge'] == 4
+    assert by_cat['transformer'] == 4
+    assert by_cat['dump'] == 4
+
+    # spans nest: each edge's transformer runs within it, on the same thread
+    join = next(e for e in spans if e['name'] == 'process_edge: join')
+    transformer = next(e for e in spans if e['cat'] == 'transformer' and e['tid'] == join['tid']
+                       and join['ts'] <= e['ts'] <= join['ts'] + join['dur'])
+    assert transformer['pid'] == join['pid']
+    assert any(event['ph'] == 'M' and event['name'] == 'thread_name' for event in events)
+    if executor == 'process':
+        assert len({e['pid'] for e in spans if e['cat'] == 'process_edge'} - {os.getpid()}) >= 1
+
+@pytest.mark.parametrize('executor', ['serial', 'process'])
+def test_metrics(join_catalog, executor):
+    from src.data import BuildCache, Metrics
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed',
+                       build_cache=BuildCache(join_catalog / 'build_cache'))
+    with Metrics() as metrics:
+        dag.generate('abc', overwrite_catalog=True, executor=executor)
+        with pytest.raises(RuntimeError):
+            dag.generate('a_broken', executor=executor)
+    assert metrics.get('easydata_datasets_total', source='generated') == 4
+    assert metrics.get('easydata_edge_runs_total', edge='join', status='ok') == 1
+    assert metrics.get('easydata_edge_failures_total', edge='_broken') == 1
+    assert metrics.get('easydata_build_cache_requests_total', result='miss') == 5
+    assert metrics.get('easydata_hash_seconds_total', kind='dataset') > 0
+    assert metrics.get('easydata_edge_duration_seconds', edge='join') > 0
+
+    with Metrics() as metrics:
+        dag.generate('abc', exhaustive=True, executor=executor)
+    assert metrics.get('easydata_build_cache_requests_total', result='hit') == 4
+    assert metrics.get('easydata_datasets_total', source='build_cache') == 4
+
+    textfile = join_catalog / 'metrics' / 'easydata.prom'
+    metrics.write_textfile(textfile)
+    with open(textfile) as fr:
+        lines = fr.read().splitlines()
+    assert '# TYPE easydata_datasets_total counter' in lines
+    assert 'easydata_datasets_total{source="build_cache"} 4' in lines
+
+@pytest.mark.parametrize('executor', ['serial', 'process'])
+def test_profiler(join_catalog, executor):
+    import pstats
+    from src.data import Profiler, RunLog
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    runlog = RunLog(join_catalog / 'logs' / 'runlog.jsonl')
+    with runlog, Profiler('add_inputs'):
+        dag.generate('abc', overwrite_catalog=True, executor=executor)
+    profile_dir = join_catalog / 'logs' / 'profiles'
+    profiles = sorted(os.listdir(profile_dir))
+    assert [os.path.splitext(name)[1] for name in profiles] == ['.collapsed', '.prof']
+    assert all(name.startswith('join.add_inputs.') for name in profiles)
+    stats = pstats.Stats(str(profile_dir / profiles[1]))
+    assert any(func_name == 'add_inputs' for _, _, func_name in stats.stats)
+    # only the selected transformer is profiled
+    records = {record['name']: record for record in runlog.records(stage='process_edge')}
+    assert len(records['join']['profile']) == 2
+    assert 'profile' not in records['_a']
+
+def test_fetch_unpack_bytes(tmpdir):
+    import gzip
+    import pathlib
+    from src.data import RunLog
+    from src.data.fetch import fetch_file, unpack
+    from src.data.runlog import instrument
+    raw = pathlib.Path(tmpdir) / 'raw'
+    with RunLog(tmpdir / 'runlog.jsonl') as runlog:
+        with instrument('fetch', 'text'):
+            fetch_file(contents='x' * 1000, file_name='text.txt', dst_dir=raw)
+        with gzip.open(raw / 'text.txt.gz', 'wb') as fw:
+            fw.write(b'y' * 5000)
+        with instrument('unpack', 'text'):
+            unpack('text.txt.gz', src_dir=raw, dst_dir=raw.parent / 'interim')
+    summary = runlog.summary()
+    assert summary[('fetch', 'text')]['bytes_written'] == 1000
+    # the compressed file is read; the unpacked output is written
+    assert summary[('unpack', 'text')]['bytes_read'] == os.path.getsize(raw / 'text.txt.gz')
+    assert summary[('unpack', 'text')]['bytes_written'] == 5000
@@ -0,0 +1,50 @@
+import os
+import shutil
+
+from src.data import DatasetGraph
+from src.tests.dag_helpers import add_inputs, add_transformers, make_range, pipeline
+
+
+def test_make_rules(tmpdir):
+    import pathlib
+    import subprocess
+    import sys
+    import src
+    # a project of its own, as the workflow CLI uses the default catalog
+    project = pathlib.Path(tmpdir) / 'project'
+    shutil.copytree(pathlib.Path(src.__file__).parent, project / 'src',
+                    ignore=shutil.ignore_patterns('__pycache__', 'config.ini'))
+    add_transformers(project / 'catalog', {
+        '_a': {'output_datasets': ['a'], 'transformations': pipeline(make_range, dataset_name='a', n=5)},
+        'double': {'input_datasets': ['a'], 'output_datasets': ['a2'],
+                   'transformations': pipeline(add_inputs, dataset_name='a2')},
+    })
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONPATH'}
+
+    def run(*args):
+        subprocess.run(args, cwd=project, env=env, check=True)
+
+    run(sys.executable, '-m', 'src.workflow', 'makefile', 'datasets.mk')
+    rules = (project / 'datasets.mk').read_text(encoding='utf-8')
+    processed = project / 'data' / 'processed'
+    assert f".make/a2.checked: {processed / 'a2.metadata'} " \
+           f"{project / 'catalog' / 'transformers' / 'double.json'} .make/a.hash" in rules
+    assert ".make/a2.hash: .make/a2.checked ;" in rules
+    assert "-m src.workflow dataset a2" in rules
+
+    run('make', '-f', 'datasets.mk', f'PYTHON_INTERPRETER={sys.executable}', '.make/a2.hash')
+    assert (processed / 'a2.dataset').exists()
+    assert (project / '.make' / 'a.hash').exists() and (project / '.make' / 'a2.checked').exists()
+
+def test_make_dataset(join_catalog):
+    from src.workflow import make_dataset
+    dag = DatasetGraph(catalog_path=join_catalog, dataset_cache_path=join_catalog / 'processed')
+    stamps = join_catalog / 'stamps'
+    for name in 'abc':
+        assert make_dataset(name, dag=dag, stamp_dir=stamps)
+    assert make_dataset('abc', dag=dag, stamp_dir=stamps)
+    hash_mtime = os.path.getmtime(stamps / 'abc.hash')
+    # unchanged: checked again, but the hash stamp is left alone
+    assert not make_dataset('abc', dag=dag, stamp_dir=stamps)
+    assert os.path.getmtime(stamps / 'abc.hash') == hash_mtime
+    assert dag.is_cached('abc')
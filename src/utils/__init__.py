@@ -1,7 +1,11 @@
 import json
 import numpy as np
+import os
 import pathlib
+import sys
+import threading
 import time
+import uuid
 
 import nbformat
 from nbconvert.preprocessors import ExecutePreprocessor, CellExecutionError
@@ -40,6 +44,82 @@ def record_time_interval(section, start_time, line_break=False):
         logger.debug("PROCESS_TIME:{:>36}    {} {}".format(section, round(delta, 1), units))
     return end_time
 
+def peak_memory():
+    """Peak resident memory (high-water mark) of the current process, in bytes
+
+    Returns None if this can't be determined on this platform.
+    """
+    try:
+        import resource
+    except ImportError:  # e.g. Windows
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # bytes on macOS, kilobytes elsewhere
+        return maxrss
+    return maxrss * 1024
+
+def current_memory():
+    """Current resident memory of this process, in bytes
+
+    Returns None if this can't be determined on this platform.
+    """
+    try:
+        with open('/proc/self/statm') as fr:
+            return int(fr.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+class MemoryWatch:
+    """Measure how far resident memory rises above its starting level while a block of code runs
+
+    A background thread samples the process's resident memory every `interval`
+    seconds (and at the start and end of the block), so brief spikes between
+    samples may be missed. The measurement is of the whole process: it includes
+    memory allocated by other threads while the block runs.
+
+    >>> with MemoryWatch() as memory:
+    ...     data = bytearray(50 * 1024 ** 2)
+    >>> memory.peak is None or memory.peak > 0
+    True
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = None
+        self._start = None
+        self._highest = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._start = current_memory()
+        if self._start is not None:
+            self._highest = self._start
+            self._thread = threading.Thread(target=self._sample, name='easydata-memory-watch', daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._record(current_memory())
+            self.peak = self._highest - self._start
+        return False
+
+    def _record(self, memory):
+        if memory is not None and memory > self._highest:
+            self._highest = memory
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._record(current_memory())
+
 def normalize_numpy_dict(d):
     ret = d.copy()
     for k, v in ret.items():
@@ -50,6 +130,9 @@ def normalize_numpy_dict(d):
 def save_json(filename, obj, indent=2, sort_keys=True):
     """Dump an object to disk in json format
 
+    The file is written atomically (via a temporary file in the same directory),
+    so concurrent readers never see a partially written file.
+
     filename: pathname
         Filename to dump to
     obj: object
@@ -62,8 +145,15 @@ def save_json(filename, obj, indent=2, sort_keys=True):
     """
     blob = json.dumps(obj, indent=indent, sort_keys=sort_keys)
 
-    with open(filename, 'w') as fw:
-        fw.write(blob)
+    filename = pathlib.Path(filename)
+    tmp_name = filename.parent / f".{filename.name}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_name, 'w') as fw:
+            fw.write(blob)
+        os.replace(tmp_name, filename)
+    finally:
+        if tmp_name.exists():  # the write or rename failed
+            tmp_name.unlink()
 
 def load_json(filename):
     """Read a json file from disk"""
@@ -1,37 +1,206 @@
 # Workflow is where we patch around API issues in between releases.
 # Nothing in this file is intended to be a stable API. use at your own risk,
 # as its contents will be regularly deprecated
+import json
+import os
+import pathlib
+import shlex
 import sys
+import time
 import logging
-from .data import Catalog, Dataset, DataSource
+from .data import Catalog, DAGExecutor, Dataset, DatasetGraph, DataSource, Metrics
+from .exceptions import EasydataError
 from .log import logger
 
 __all__ = [
-    'make_target'
+    'make_dataset',
+    'make_target',
+    'write_dataset_rules',
 ]
 
-def make_target(target):
+# Where the generated make rules keep their per-dataset stamps
+STAMP_DIR = '.make'
+# How the generated make rules run this module. Not `__name__`, which is '__main__' when run by make
+WORKFLOW_MODULE = 'src.workflow'
+
+def make_target(target, *args, metrics_textfile=None):
     """process command from makefile
 
     Parameters
     ----------
-    target: target to execute
+    target: target to execute. One of:
+        'datasets': generate every dataset in the catalog that isn't cached
+        'datasources': fetch, unpack and process every datasource
+        'makefile' [path]: write per-dataset make rules (see `write_dataset_rules`)
+        'dataset' name: bring one dataset up to date (see `make_dataset`)
+    args: arguments of the target
+    metrics_textfile: path or None
+        If given, write Prometheus metrics for this run to this file (for the node-exporter
+        textfile collector). Default: the EASYDATA_METRICS_TEXTFILE environment variable, if set.
     """
+    if metrics_textfile is None:
+        metrics_textfile = os.environ.get('EASYDATA_METRICS_TEXTFILE')
+    if not metrics_textfile:
+        return _make_target(target, *args)
+
+    start_time = time.time()
+    with Metrics() as metrics:
+        try:
+            _make_target(target, *args)
+        finally:
+            metrics.record_run(start_time)
+            metrics.write_textfile(metrics_textfile)
 
+def _make_target(target, *args):
     if target == "datasets":
         c = Catalog.load('datasets')
-        for dsname in c:
-            logger.info(f"Generating Dataset:'{dsname}'")
-            ds = Dataset.load(dsname)
+        dag = DatasetGraph()
+        missing = [dsname for dsname in c if not dag.is_cached(dsname)]
+        logger.info(f"Generating Datasets:{missing}")
+        dag.generate_many(missing)
     elif target == "datasources":
         c = Catalog.load('datasources')
         for name in c:
             logger.info(f"Fetching, unpacking, and processing DataSource:'{name}'")
             dsrc = DataSource.from_catalog(name)
             ds = dsrc.process()
+    elif target == "makefile":
+        write_dataset_rules(*args)
+    elif target == "dataset":
+        for name in args:
+            make_dataset(name)
     else:
         raise NotImplementedError(f"Target: '{target}' not implemented")
 
 
+def _make_escape(path):
+    """Escape a path for use as a make target or prerequisite"""
+    path = str(path).replace('$', '$$')
+    for char in ' :#':
+        path = path.replace(char, f'\\{char}')
+    return path
+
+def _stamp(stamp_dir, dataset_name, kind):
+    return pathlib.Path(stamp_dir) / f'{dataset_name}.{kind}'
+
+def _edge_prerequisites(dag, edge, stamp_dir):
+    """Files whose changes make the outputs of `edge` stale
+
+    These are the edge's transformer catalog entry, and the hash stamps of its inputs.
+    Ephemeral inputs have no stamps, so the prerequisites of the edge producing them are used instead.
+    """
+    transformers = dag.transformers
+    prereqs = [transformers.catalog_dir_fq / f'{edge}.{transformers.extension}']
+    for ds_name in dag._edge_inputs[edge]:
+        if dag.is_ephemeral(ds_name):
+            prereqs += _edge_prerequisites(dag, dag._producers[ds_name], stamp_dir)
+        else:
+            prereqs.append(_stamp(stamp_dir, ds_name, 'hash'))
+    return list(dict.fromkeys(prereqs))
+
+def write_dataset_rules(path='.make.datasets.mk', dag=None, stamp_dir=STAMP_DIR):
+    """Write a make include file with a rule for each (non-ephemeral) dataset
+
+    Each dataset has two stamps in `stamp_dir`:
+
+    <dataset>.checked: touched whenever `make_dataset` has brought the dataset up to date.
+        Its prerequisites are the producing transformer's catalog entry, the
+        dataset's metadata file, and the `.hash` stamps of its inputs.
+    <dataset>.hash: the dataset's content hashes. Rewritten only when they change,
+        so downstream datasets are only revisited when their inputs really changed.
+
+    `DATASET_STAMPS` lists every `.hash` stamp, so `make -j8 $(DATASET_STAMPS)` brings every
+    dataset up to date, processing independent datasets in parallel. Secondary outputs of an
+    edge depend on its first output, so each edge is only processed by one job.
+
+    Parameters
+    ----------
+    path: path
+        include file to write
+    dag: DatasetGraph or None
+        Default: the DatasetGraph in the default catalog
+    stamp_dir: path
+        directory of the stamps
+    """
+    if dag is None:
+        dag = DatasetGraph()
+    lines = [f"# Generated by `python -m {WORKFLOW_MODULE} makefile`. Do not edit.", ""]
+    stamps = []
+    for edge in dag.toposort():
+        outputs = [ds_name for ds_name in dag._edge_outputs[edge] if not dag.is_ephemeral(ds_name)]
+        prereqs = _edge_prerequisites(dag, edge, stamp_dir)
+        for i, ds_name in enumerate(outputs):
+            checked = _make_escape(_stamp(stamp_dir, ds_name, 'checked'))
+            stamp = _make_escape(_stamp(stamp_dir, ds_name, 'hash'))
+            metadata = _make_escape(dag._dataset_cache_path / f'{ds_name}.metadata')
+            deps = [metadata] + [_make_escape(prereq) for prereq in prereqs]
+            if i:
+                deps.append(_make_escape(_stamp(stamp_dir, outputs[0], 'hash')))
+            command = shlex.quote(ds_name).replace('$', '$$')
+            lines += [
+                f"{checked}: {' '.join(deps)}",
+                f"\t$(PYTHON_INTERPRETER) -m {WORKFLOW_MODULE} dataset {command}",
+                f"{stamp}: {checked} ;",
+                # if the dataset is removed, it must be checked again
+                f"{metadata}: ;",
+                "",
+            ]
+            stamps.append(stamp)
+    lines.insert(1, f"DATASET_STAMPS := {' '.join(stamps)}")
+    pathlib.Path(path).write_text('\n'.join(lines), encoding='utf-8')
+    logger.debug(f"Wrote make rules for {len(stamps)} datasets to {path}")
+
+def make_dataset(dataset_name, dag=None, stamp_dir=STAMP_DIR):
+    """Bring a dataset up to date, and update its stamps (see `write_dataset_rules`)
+
+    The dataset's edge is processed if the dataset isn't cached, or if the edge has changed
+    since it was last processed (see `DatasetGraph.edge_changed`), in which
+    case the new hashes are written to the Dataset catalog.
+    Upstream datasets are expected to be up to date already (make sees to that).
+
+    Parameters
+    ----------
+    dataset_name: str
+    dag: DatasetGraph or None
+        Default: the DatasetGraph in the default catalog
+    stamp_dir: path
+        directory of the stamps
+
+    Returns
+    -------
+    True if the dataset's hashes changed
+    """
+    if dag is None:
+        dag = DatasetGraph()
+    _, edge, _ = dag.find_child(dataset_name)
+    if dag.edge_changed(edge):
+        logger.info(f"Regenerating outdated Dataset:'{dataset_name}'")
+        plan = dag.plan([], force={edge: 'outdated'})
+        executor = DAGExecutor('serial')
+        executor.run(dag, plan, keep=(), write_dataset=True, overwrite_catalog=True)
+        dag.flush()
+        if edge not in executor.completed_:
+            errors = [err for err in executor.failed_.values() if err is not None]
+            if errors:
+                raise errors[0]
+            raise EasydataError(f"Failed to regenerate Dataset '{dataset_name}'")
+    elif not dag.is_cached(dataset_name):
+        logger.info(f"Generating Dataset:'{dataset_name}'")
+        dag.generate(dataset_name)
+
+    # a dataset in the remote cache is downloaded here, as make expects it on disk
+    meta = Dataset.from_disk(dataset_name, data_path=dag._dataset_cache_path, metadata_only=True,
+                             catalog_path=dag._catalog_path, dataset_path=dag._dataset_path,
+                             remote_cache=dag.remote_cache)
+    content = json.dumps(meta['hashes'], sort_keys=True)
+    stamp = _stamp(stamp_dir, dataset_name, 'hash')
+    changed = not stamp.exists() or stamp.read_text(encoding='utf-8') != content
+    os.makedirs(stamp_dir, exist_ok=True)
+    if changed:
+        stamp.write_text(content, encoding='utf-8')
+    _stamp(stamp_dir, dataset_name, 'checked').touch()
+    return changed
+
+
 if __name__ == '__main__':
-    make_target(sys.argv[1])
+    make_target(*sys.argv[1:])